@@ -1,13 +1,16 @@
 from dotenv import load_dotenv
 import streamlit as st
 import os
-import hashlib
-import json
-from datetime import datetime
 from modules.data_loader import load_excel_data
-from modules.data_processing import df_to_document
-from modules.vectorstore_handler import load_vectorstore, create_vectorstore
-from modules.rag_chain import create_qa_chain
+from modules.ingestion import load_compatible_vectorstore
+from modules.ingestion_jobs import get_ingestion_workers
+from modules.vectorstore_handler import dataset_namespace, load_manifest
+from modules.rag_chain import get_qa_chain, get_aggregate_chain, stream_answer
+from modules.answer_cache import get_answer_cache
+from modules.chat_store import get_chat_store, import_legacy_history
+from modules.aggregate_query import (
+    load_query_frame, parse_aggregate_query, run_aggregate_query, describe_query, table_to_markdown
+)
 
 load_dotenv()
 
@@ -37,8 +40,16 @@ def initialize_session_state():
         st.session_state.username = None
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
+    if 'chat_count' not in st.session_state:
+        st.session_state.chat_count = 0
     if 'file_hash' not in st.session_state:
         st.session_state.file_hash = None
+    if 'data_file' not in st.session_state:
+        st.session_state.data_file = None
+    if 'ingest_job' not in st.session_state:
+        st.session_state.ingest_job = None
+    if 'saved_upload' not in st.session_state:
+        st.session_state.saved_upload = None
 
 initialize_session_state()
 
@@ -47,59 +58,33 @@ if not st.session_state.authenticated:
     st.switch_page("pages/login.py")
 
 # Chat history management functions
-def save_chat_to_history(question, answer):
-    """Save a chat exchange to history if it's not a duplicate"""
-    chat_entry = {
-        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'question': question,
-        'answer': answer
-    }
-    
-    # Check for duplicates before adding
-    is_duplicate = False
-    for existing_chat in st.session_state.chat_history:
-        if existing_chat['question'] == question and existing_chat['answer'] == answer:
-            is_duplicate = True
-            break
-    
-    if not is_duplicate:
-        st.session_state.chat_history.append(chat_entry)
-        save_chat_history_to_file()
+# Only the latest conversations are kept in session state; the rest stay in the store
+RECENT_CHATS = 5
+
+def save_chat_to_history(question, answer, timings=None):
+    """Save a chat exchange to history if it's not a duplicate, with its response times if measured"""
+    if get_chat_store().append(st.session_state.username, question, answer, timings) is not None:
+        load_chat_history()
         return True
     return False
 
-def save_chat_history_to_file():
-    """Save chat history to a JSON file"""
-    try:
-        chat_dir = "chat_history"
-        if not os.path.exists(chat_dir):
-            os.makedirs(chat_dir)
-        
-        filename = f"{chat_dir}/{st.session_state.username}_chat_history.json"
-        with open(filename, 'w') as f:
-            json.dump(st.session_state.chat_history, f, indent=2)
-    except Exception as e:
-        st.error(f"Error saving chat history: {str(e)}")
-
-def load_chat_history_from_file():
-    """Load chat history from file"""
+def load_chat_history():
+    """Load the conversation count and the latest conversations for the current user"""
     try:
-        chat_dir = "chat_history"
-        filename = f"{chat_dir}/{st.session_state.username}_chat_history.json"
-        
-        if os.path.exists(filename):
-            with open(filename, 'r') as f:
-                st.session_state.chat_history = json.load(f)
+        chat_store = get_chat_store()
+        st.session_state.chat_count = chat_store.count(st.session_state.username)
+        st.session_state.chat_history = chat_store.recent(st.session_state.username, RECENT_CHATS)
     except Exception as e:
         st.error(f"Error loading chat history: {str(e)}")
 
 def clear_chat_history():
     """Clear all chat history"""
-    st.session_state.chat_history = []
-    save_chat_history_to_file()
+    get_chat_store().clear(st.session_state.username)
+    load_chat_history()
 
-# Load chat history for current user
-load_chat_history_from_file()
+# Load chat history for current user, moving over any history saved in the old JSON format
+import_legacy_history(st.session_state.username)
+load_chat_history()
 
 # Main app layout
 st.title("AI LECTURER SUPPORT SYSTEM")
@@ -114,7 +99,10 @@ with st.sidebar:
         st.session_state.authenticated = False
         st.session_state.username = None
         st.session_state.chat_history = []
+        st.session_state.chat_count = 0
         st.session_state.file_hash = None
+        st.session_state.data_file = None
+        st.session_state.ingest_job = None
         st.rerun()
     
     st.divider()
@@ -129,18 +117,93 @@ with st.sidebar:
             st.success("Chat history cleared!")
             st.rerun()
         
-        st.write(f"**Total conversations:** {len(st.session_state.chat_history)}")
+        st.write(f"**Total conversations:** {st.session_state.chat_count}")
         
         # Show recent chats (last 5)
         st.write("**Recent Chats:**")
-        recent_chats = st.session_state.chat_history[-5:] if len(st.session_state.chat_history) > 5 else st.session_state.chat_history
+        recent_chats = st.session_state.chat_history
         
-        for i, chat in enumerate(reversed(recent_chats)):
+        for i, chat in enumerate(recent_chats):
             with st.expander(f"💬 {chat['timestamp']}", expanded=False):
                 st.write(f"**Q:** {chat['question'][:100]}...")
                 st.write(f"**A:** {chat['answer'][:200]}...")
     else:
         st.info("No chat history yet. Start asking questions!")
+    
+    st.divider()
+    
+    # Datasets that already have an index load instantly when selected
+    st.write("### Indexed Datasets")
+    indexed_datasets = load_manifest()
+    if indexed_datasets:
+        for namespace, entry in sorted(indexed_datasets.items(), key=lambda item: item[1]["updated"], reverse=True):
+            current = " ✅" if namespace == st.session_state.file_hash else ""
+            st.caption(f"**{entry.get('source') or namespace}**{current} · {entry['rows']} rows · updated {entry['updated']}")
+    else:
+        st.info("No datasets indexed yet.")
+
+# Seconds between checks on a background ingestion job
+INGEST_POLL_SECONDS = 2
+
+def select_dataset(file_path):
+    """
+    Make a data file this session's dataset. A file indexed before is loaded
+    at once; otherwise it is indexed by a background job, and the current
+    dataset keeps answering questions until the job finishes. Returns the
+    file's vectorstore, or None while it is being indexed.
+    """
+    # A dataset indexed before is loaded, not rebuilt
+    namespace = dataset_namespace(file_path)
+    dataset_vectorstore, mismatch = load_compatible_vectorstore(namespace)
+    if dataset_vectorstore is not None:
+        st.session_state.file_hash = namespace
+        st.session_state.data_file = file_path
+        if st.session_state.ingest_job == namespace:
+            st.session_state.ingest_job = None
+        return dataset_vectorstore
+    
+    if mismatch:
+        st.warning(f"⚠️ Re-embedding this file: {mismatch}")
+    get_ingestion_workers().submit(file_path, namespace)
+    st.session_state.ingest_job = namespace
+    return None
+
+@st.fragment(run_every=INGEST_POLL_SECONDS)
+def show_ingestion_progress():
+    """Show the progress of this session's ingestion job, switching to its dataset once it is done."""
+    job = get_ingestion_workers().get(st.session_state.ingest_job)
+    if job is None:
+        st.session_state.ingest_job = None
+        return
+    
+    status = job.snapshot()
+    source = os.path.basename(status["file_path"])
+    if status["status"] == "done":
+        changes = status["changes"]
+        st.session_state.file_hash = status["namespace"]
+        st.session_state.data_file = status["file_path"]
+        st.session_state.ingest_job = None
+        st.session_state.ingest_message = (
+            f"✅ Vectorstore ready! {changes['added']} rows added, "
+            f"{changes['removed']} removed, {changes['unchanged']} unchanged, "
+            f"{changes['summaries_updated']} summaries refreshed."
+        )
+        if changes.get("embedding_mismatch"):
+            st.session_state.ingest_message += f" Re-embedded in full: {changes['embedding_mismatch']}"
+        st.rerun()
+    elif status["status"] == "failed":
+        st.error(f"❌ Indexing {source} failed: {status['error']}")
+        if st.button("🔁 Retry indexing"):
+            get_ingestion_workers().submit(status["file_path"], status["namespace"], retry=True)
+            st.rerun(scope="fragment")
+    elif status["status"] == "queued":
+        st.info(f"⏳ {source} is queued for indexing.")
+    else:
+        serving = " The current dataset stays available meanwhile." if st.session_state.file_hash else ""
+        st.info(
+            f"🔄 Indexing {source} in the background: {status['rows']:,} rows in "
+            f"{status['batches']} batches after {status['seconds']:.0f}s.{serving}"
+        )
 
 # Main content area
 col1, col2 = st.columns([2, 1])
@@ -149,11 +212,17 @@ with col1:
     # Define data directory
     DATA_DIR = os.path.join(os.getcwd(), "data")
 
+    # Only this many rows are loaded for the preview; ingestion streams the whole file
+    PREVIEW_ROWS = 1000
+
     # Create tabs for different input methods
     tab1, tab2 = st.tabs(["📤 Upload File", "📁 Use Existing File"])
 
-    # Load or create vectorstore
-    vectorstore = load_vectorstore()
+    # Load this session's dataset index; each dataset has its own, keyed by content hash
+    vectorstore = load_compatible_vectorstore(st.session_state.file_hash)[0] if st.session_state.file_hash else None
+    
+    if 'ingest_message' in st.session_state:
+        st.success(st.session_state.pop('ingest_message'))
 
     # Tab 1: File upload
     with tab1:
@@ -164,34 +233,27 @@ with col1:
             if not os.path.exists(DATA_DIR):
                 os.makedirs(DATA_DIR)
             
-            # Save the uploaded file to data directory
+            # Save the uploaded file to data directory, once per upload: rewriting
+            # it on every rerun would change its mtime and force a re-hash.
+            # Replaced in one step, since a background ingestion job may be
+            # reading the previous copy
             file_path = os.path.join(DATA_DIR, uploaded_file.name)
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            
-            # Process the saved file
-            with open(file_path, 'rb') as f:
-                file_content = f.read()
-                current_file_hash = hashlib.md5(file_content).hexdigest()
-            
-            create_new_vectorstore = False
-            
-            if vectorstore is None or st.session_state.file_hash != current_file_hash:
-                create_new_vectorstore = True
-                st.session_state.file_hash = current_file_hash
+            if st.session_state.saved_upload != (uploaded_file.file_id, file_path) or not os.path.exists(file_path):
+                with open(file_path + ".tmp", "wb") as f:
+                    f.write(uploaded_file.getbuffer())
+                os.replace(file_path + ".tmp", file_path)
+                st.session_state.saved_upload = (uploaded_file.file_id, file_path)
             
             st.success(f"✅ Excel file uploaded and saved to {file_path}!")
-            df = load_excel_data(file_path)
+            dataset_vectorstore = select_dataset(file_path)
+            if dataset_vectorstore is not None:
+                vectorstore = dataset_vectorstore
+            df = load_excel_data(file_path, nrows=PREVIEW_ROWS)
             
-            with st.expander("📊 Preview Data", expanded=False):
+            with st.expander(f"📊 Preview Data (first {PREVIEW_ROWS} rows)", expanded=False):
                 st.dataframe(df)
             
-            if create_new_vectorstore:
-                with st.spinner("🔄 Processing and creating vectorstore..."):
-                    documents = df_to_document(df)
-                    vectorstore = create_vectorstore(documents)
-                    st.success("✅ Vectorstore created and ready!")
-            else:
+            if dataset_vectorstore is not None:
                 st.info("ℹ️ Vectorstore already exists for this file.")
 
     # Tab 2: Use existing file from data directory
@@ -212,41 +274,35 @@ with col1:
             if selected_file:
                 file_path = os.path.join(DATA_DIR, selected_file)
                 
-                # Calculate file hash
-                with open(file_path, 'rb') as f:
-                    file_content = f.read()
-                    current_file_hash = hashlib.md5(file_content).hexdigest()
-                
-                create_new_vectorstore = False
-                
-                if vectorstore is None or st.session_state.file_hash != current_file_hash:
-                    create_new_vectorstore = True
-                    st.session_state.file_hash = current_file_hash
-                
                 st.success(f"✅ Using file: {selected_file}")
-                df = load_excel_data(file_path)
+                dataset_vectorstore = select_dataset(file_path)
+                if dataset_vectorstore is not None:
+                    vectorstore = dataset_vectorstore
+                df = load_excel_data(file_path, nrows=PREVIEW_ROWS)
                 
-                with st.expander("📊 Preview Data", expanded=False):
+                with st.expander(f"📊 Preview Data (first {PREVIEW_ROWS} rows)", expanded=False):
                     st.dataframe(df)
                 
-                if create_new_vectorstore:
-                    with st.spinner("🔄 Processing and creating vectorstore..."):
-                        documents = df_to_document(df)
-                        vectorstore = create_vectorstore(documents)
-                        st.success("✅ Vectorstore created and ready!")
-                else:
+                if dataset_vectorstore is not None:
                     st.info("ℹ️ Vectorstore already exists for this file.")
 
+    if st.session_state.ingest_job:
+        show_ingestion_progress()
+
 with col2:
     # Chat statistics
     if st.session_state.chat_history:
         st.write("### 📊 Chat Statistics")
-        st.metric("Total Questions", len(st.session_state.chat_history))
+        st.metric("Total Questions", st.session_state.chat_count)
         
         # Most recent chat time
         if st.session_state.chat_history:
-            latest_chat = st.session_state.chat_history[-1]['timestamp']
+            latest_chat = st.session_state.chat_history[0]['timestamp']
             st.write(f"**Last Activity:** {latest_chat}")
+        
+        answer_cache_stats = get_answer_cache().stats()
+        if answer_cache_stats["hits"] + answer_cache_stats["semantic_hits"] + answer_cache_stats["misses"]:
+            st.metric("Answer Cache Hit Rate", f"{answer_cache_stats['hit_rate']:.0%}")
 
 # Question answering section
 if vectorstore:
@@ -267,16 +323,51 @@ if vectorstore:
     if (query and ask_button) or (query and st.session_state.get('enter_pressed', True)):
         with st.spinner("🤔 Getting answer..."):
             try:
-                qa_chain = create_qa_chain(vectorstore)
-                response = qa_chain.invoke({"input": query})
-                answer = response["answer"]
+                # Aggregate questions are computed exactly over every row with pandas;
+                # everything else goes through retrieval
+                aggregate_query = None
+                if st.session_state.data_file and os.path.exists(st.session_state.data_file):
+                    query_frame = load_query_frame(st.session_state.data_file)
+                    aggregate_query = parse_aggregate_query(query, query_frame)
                 
-                # Display answer
+                if aggregate_query is not None:
+                    result_table = run_aggregate_query(query_frame, aggregate_query)
+                
+                # Repeated questions about the same dataset skip retrieval and the LLM
+                answer_cache = get_answer_cache()
+                answer = answer_cache.get(st.session_state.file_hash, query)
+                
+                # Display answer; new answers are rendered token by token as they are generated
                 st.write("### 💡 Answer:")
-                st.write(answer)
+                timings = {}
+                if answer is not None:
+                    st.write(answer)
+                    st.caption("⚡ Answered from cache")
+                else:
+                    if aggregate_query is not None:
+                        chain = get_aggregate_chain()
+                        inputs = {
+                            "input": query,
+                            "query": describe_query(aggregate_query),
+                            "table": table_to_markdown(result_table),
+                        }
+                    else:
+                        chain = get_qa_chain(vectorstore)
+                        inputs = {"input": query}
+                    answer = st.write_stream(stream_answer(chain, inputs, timings))
+                    answer_cache.put(st.session_state.file_hash, query, answer)
+                    if timings["ttft"] is not None:
+                        st.caption(
+                            f"⏱️ First token after {timings['ttft']:.2f}s, "
+                            f"full answer after {timings['total']:.2f}s"
+                        )
+                
+                if aggregate_query is not None:
+                    with st.expander(f"🧮 Computed over all rows: {describe_query(aggregate_query)}", expanded=False):
+                        st.dataframe(result_table)
                 
                 # Save to chat history and check if it was a duplicate
-                if save_chat_to_history(query, answer):
+                if save_chat_to_history(query, answer, timings):
                     st.success("✅ Answer saved to chat history!")
                 else:
                     st.info("ℹ️ This Q&A is already in your chat history.")
@@ -290,9 +381,9 @@ if vectorstore:
         st.subheader("📝 Recent Conversations")
         
         # Show last 3 conversations
-        recent_conversations = st.session_state.chat_history[-3:]
+        recent_conversations = st.session_state.chat_history[:3]
         
-        for i, chat in enumerate(reversed(recent_conversations)):
+        for i, chat in enumerate(recent_conversations):
             with st.expander(f"💬 {chat['timestamp']} - {chat['question'][:50]}...", expanded=i==0):
                 st.write(f"**Question:** {chat['question']}")
                 st.write(f"**Answer:** {chat['answer']}")
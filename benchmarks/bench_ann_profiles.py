@@ -0,0 +1,76 @@
+#=======================Benchmark: ANN index profiles==================
+#
+# Usage: python -m benchmarks.bench_ann_profiles [--sizes 10000 100000] [--k 10] [--queries 200]
+
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from benchmarks.synthetic import synthetic_feedback
+from modules.ann_index import INDEX_PROFILES, build_index, configure_search
+from modules.data_processing import row_texts
+from modules.local_embeddings import HashingEmbeddings
+
+
+def recall_at_k(vectors, queries, found, exact_distances):
+    """
+    Share of returned neighbours that are as close as the exact k-th nearest
+    neighbour. Synthetic rows repeat, so comparing distances rather than ids
+    keeps ties from counting as misses.
+    """
+    hits = 0
+    for query, row, distances in zip(queries, found, exact_distances):
+        row = row[row >= 0]
+        found_distances = ((vectors[row] - query) ** 2).sum(axis=1)
+        hits += int((found_distances <= distances[-1] + 1e-5).sum())
+    return hits / exact_distances.size
+
+
+def latencies(index, queries, k):
+    """Return per-query search times in milliseconds, one query at a time as the app searches."""
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query[None, :], k)
+        times.append((time.perf_counter() - start) * 1000)
+    return np.array(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare recall and latency of the vectorstore index profiles.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--ef-search", type=int, default=64)
+    args = parser.parse_args()
+
+    embeddings = HashingEmbeddings(args.dimension)
+    print(f"{'rows':>8} {'profile':>9} {'build (s)':>10} {f'recall@{args.k}':>10} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for size in args.sizes:
+        vectors = embeddings.embed_array(row_texts(synthetic_feedback(size)).tolist())
+        # Questions look like rows the index has not seen
+        queries = embeddings.embed_array(row_texts(synthetic_feedback(args.queries, seed=1)).tolist())
+
+        exact_distances = None
+        for profile in INDEX_PROFILES:
+            start = time.perf_counter()
+            index = build_index(profile, vectors, faiss.METRIC_L2)
+            configure_search(index, nprobe=args.nprobe, ef_search=args.ef_search)
+            build_time = time.perf_counter() - start
+
+            distances, found = index.search(queries, args.k)
+            if exact_distances is None:
+                exact_distances = distances
+            times = latencies(index, queries, args.k)
+            print(
+                f"{size:>8} {profile:>9} {build_time:>10.2f} {recall_at_k(vectors, queries, found, exact_distances):>10.3f} "
+                f"{np.percentile(times, 50):>9.3f} {np.percentile(times, 99):>9.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
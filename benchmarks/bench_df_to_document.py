@@ -0,0 +1,50 @@
+#=======================Benchmark: DataFrame -> Document conversion==================
+#
+# Usage: python -m benchmarks.bench_df_to_document [--sizes 1000 100000 1000000]
+
+import argparse
+import time
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from benchmarks.synthetic import synthetic_feedback
+from modules.data_processing import df_to_document
+
+
+def legacy_df_to_document(df):
+    """The original iterrows + split_documents implementation, kept for comparison."""
+    documents = [
+        Document(page_content="\n".join(f"{col}: {row[col]}" for col in df.columns))
+        for _, row in df.iterrows()
+    ]
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=500,
+        chunk_overlap=50,
+        separators=["\n\n", "\n", ".", ",", " ", ""]
+    )
+    return text_splitter.split_documents(documents)
+
+
+def timed(func, df):
+    start = time.perf_counter()
+    documents = func(df)
+    return time.perf_counter() - start, len(documents)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare legacy and vectorized df_to_document.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>8}")
+    for size in args.sizes:
+        df = synthetic_feedback(size)
+        legacy_time, legacy_docs = timed(legacy_df_to_document, df)
+        new_time, new_docs = timed(df_to_document, df)
+        assert legacy_docs == new_docs, f"document count mismatch: {legacy_docs} vs {new_docs}"
+        print(f"{size:>10} {legacy_time:>12.3f} {new_time:>15.3f} {legacy_time / new_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#=======================Benchmark: parsed-frame cache, CSV vs XLSX==================
+#
+# Usage: python -m benchmarks.bench_frame_cache [--sizes 1000 10000 100000] [--repeat 5]
+#
+# For each size, writes the same synthetic feedback as .csv and .xlsx and
+# times load_excel_data: parsing with the frame cache off, a cold load (parse
+# and write the Feather sidecar), a warm load (memory-map the sidecar), and
+# the 1000-row preview cold and warm. Excel files are parsed with openpyxl
+# and, if python-calamine is installed, with calamine too (forced for the
+# preview as well, which "auto" leaves to openpyxl).
+
+import argparse
+import importlib.util
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.synthetic import synthetic_feedback
+from modules import data_loader
+
+PREVIEW_ROWS = 1000
+
+
+def timed(func, repeat=1):
+    """Return the median seconds of running func `repeat` times."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def clear_sidecars():
+    directory = data_loader.FRAME_CACHE_DIR
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+
+
+def measure(path, repeat):
+    """Time the loads of one file; returns {measurement: seconds}."""
+    data_loader.FRAME_CACHE = False
+    parse = timed(lambda: data_loader.load_excel_data(path), repeat=1)
+    preview_cold = timed(lambda: data_loader.load_excel_data(path, nrows=PREVIEW_ROWS), repeat)
+
+    data_loader.FRAME_CACHE = True
+    clear_sidecars()
+    cold = timed(lambda: data_loader.load_excel_data(path), repeat=1)
+    warm = timed(lambda: data_loader.load_excel_data(path), repeat)
+    preview_warm = timed(lambda: data_loader.load_excel_data(path, nrows=PREVIEW_ROWS), repeat)
+    return {"parse": parse, "cold": cold, "warm": warm, "preview_cold": preview_cold, "preview_warm": preview_warm}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time cold and warm loads of CSV and Excel files through the frame cache.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per warm measurement (median reported)")
+    args = parser.parse_args()
+
+    engines = ["openpyxl"] + (["calamine"] if importlib.util.find_spec("python_calamine") else [])
+    if importlib.util.find_spec("pyarrow") is None:
+        print("pyarrow is not installed, so nothing is cached: warm loads parse the file again.")
+
+    print(f"{'rows':>8} {'file':>14} {'parse (s)':>10} {'cold (s)':>9} {'warm (s)':>9} {'preview cold':>13} {'preview warm':>13} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        # The frame and fingerprint caches live under the working directory
+        os.chdir(directory)
+        for rows in args.sizes:
+            df = synthetic_feedback(rows)
+            csv_path = os.path.join(directory, f"feedback_{rows}.csv")
+            xlsx_path = os.path.join(directory, f"feedback_{rows}.xlsx")
+            df.to_csv(csv_path, index=False)
+            df.to_excel(xlsx_path, index=False)
+
+            runs = [("csv", csv_path, None)] + [(f"xlsx/{engine}", xlsx_path, engine) for engine in engines]
+            for label, path, engine in runs:
+                data_loader.EXCEL_ENGINE = engine or "auto"
+                result = measure(path, args.repeat)
+                print(
+                    f"{rows:>8} {label:>14} {result['parse']:>10.3f} {result['cold']:>9.3f} {result['warm']:>9.4f} "
+                    f"{result['preview_cold']:>13.4f} {result['preview_warm']:>13.4f} {result['parse'] / result['warm']:>7.0f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#=======================Benchmark: memory-mapped index loading==================
+#
+# Usage: python -m benchmarks.bench_mmap_load [--sizes 10000 100000] [--profile flat] [--processes 4]
+#
+# Resident memory is read from /proc, so this benchmark runs on Linux only.
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from benchmarks.synthetic import synthetic_feedback
+from modules import vectorstore_handler
+from modules.ann_index import build_index
+from modules.data_processing import row_texts
+from modules.local_embeddings import HashingEmbeddings
+
+
+def resident_memory():
+    """Return this process's resident memory in MB: total, private (anonymous) and file-backed."""
+    fields = {"VmRSS": "rss", "RssAnon": "private", "RssFile": "file"}
+    memory = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in fields:
+                memory[fields[name]] = int(value.split()[0]) / 1024
+    return memory
+
+
+def load_and_search(path, mmap, queries, k, results):
+    """Load an index the way load_vectorstore does, search it, and report time and memory."""
+    vectorstore_handler.VECTORSTORE_MMAP = mmap
+    before = resident_memory()
+    start = time.perf_counter()
+    index, mapped = vectorstore_handler._read_index(path)
+    load_time = time.perf_counter() - start
+    loaded = resident_memory()
+    index.search(queries, k)
+    results.put({"mapped": mapped, "load": load_time, "before": before, "loaded": loaded, "searched": resident_memory()})
+
+
+def run(path, mmap, queries, k, processes):
+    """Run the load in separate worker processes at once, as several servers on one machine would."""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    workers = [context.Process(target=load_and_search, args=(path, mmap, queries, k, results)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    reports = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare load time and resident memory of read vs memory-mapped indexes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--profile", default="flat")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    print(
+        f"{'rows':>8} {'load':>5} {'load (s)':>9} {'RSS before':>11} {'RSS loaded':>11} "
+        f"{'RSS searched':>13} {'private':>8} {'shared':>8}   (MB, mean per process)"
+    )
+    embeddings = HashingEmbeddings(args.dimension)
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            vectors = embeddings.embed_array(row_texts(synthetic_feedback(size)).tolist())
+            queries = embeddings.embed_array(row_texts(synthetic_feedback(args.queries, seed=1)).tolist())
+            path = os.path.join(directory, f"{size}.faiss")
+            faiss.write_index(build_index(args.profile, vectors, faiss.METRIC_L2), path)
+            del vectors
+
+            for mmap in (False, True):
+                reports = run(path, mmap, queries, args.k, args.processes)
+                mean = lambda stage, field: np.mean([report[stage][field] for report in reports])
+                label = "mmap" if all(report["mapped"] for report in reports) else "read"
+                print(
+                    f"{size:>8} {label:>5} {np.mean([report['load'] for report in reports]):>9.3f} "
+                    f"{mean('before', 'rss'):>11.0f} {mean('loaded', 'rss'):>11.0f} {mean('searched', 'rss'):>13.0f} "
+                    f"{mean('searched', 'private'):>8.0f} {mean('searched', 'file'):>8.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#=======================Benchmark: end-to-end pipeline, offline==================
+#
+# Usage: python -m benchmarks.bench_pipeline [--sizes 1000 10000 100000 1000000] [--queries 200]
+#                                            [--output bench_pipeline.json] [--baseline previous.json]
+#
+# Drives load_excel_data -> df_to_document -> create_vectorstore ->
+# create_qa_chain -> questions, on the local hashing embeddings
+# (EMBEDDING_BACKEND=hashing) and a canned chat model in place of ChatGroq, so
+# it needs no API keys or network. Each size runs in its own process, in a
+# temporary directory.
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_feedback
+from modules.data_processing import CATEGORICAL_COLUMNS
+
+# Longest a worker may go without reporting before it is checked for a crash
+WORKER_POLL_SECONDS = 10
+
+FAKE_ANSWER = "Students rated this lecturer highly for clarity and punctuality, based on the feedback rows provided."
+
+QUESTION_TEMPLATES = (
+    "How did students rate {Lecturers Name}?",
+    "What do students say about the {Department} department?",
+    "Which lecturers in the {Faculty} faculty got the best feedback in {Year}?",
+    "How was teaching in the {Section} section of {Year}?",
+)
+
+
+def reset_peak_rss():
+    """Start a new peak resident memory measurement, where the OS allows it (Linux)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    """Return the peak resident memory in MB since the last reset_peak_rss (or process start)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in bytes on macOS and KB elsewhere
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def questions(df, count, seed=0):
+    """Generate questions about entities that appear in a dataset."""
+    columns = {col.strip(): col for col in df.columns if col.strip() in CATEGORICAL_COLUMNS}
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(df), size=count)
+    templates = rng.integers(0, len(QUESTION_TEMPLATES), size=count)
+    return [
+        QUESTION_TEMPLATES[template].format_map({name: df[col].iat[row] for name, col in columns.items()})
+        for row, template in zip(rows, templates)
+    ]
+
+
+def run_size(rows, args, results):
+    """Run the pipeline over one synthetic dataset and put its measurements on the results queue."""
+    # Read by vectorstore_handler when it is imported, so set first
+    os.environ["EMBEDDING_BACKEND"] = "hashing"
+    os.environ["HASHING_EMBEDDING_DIMENSION"] = str(args.dimension)
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    from modules import rag_chain, vectorstore_handler
+    from modules.data_loader import load_excel_data
+    from modules.data_processing import df_to_document
+
+    # Seed the shared chat model the pipeline would otherwise create for the Groq API
+    rag_chain._llms[rag_chain.DEFAULT_MODEL] = FakeListChatModel(responses=[FAKE_ANSWER])
+
+    stages = {}
+
+    def stage(name, func):
+        reset_peak_rss()
+        start = time.perf_counter()
+        output = func()
+        stages[name] = {"seconds": round(time.perf_counter() - start, 4), "peak_rss_mb": round(peak_rss_mb(), 1)}
+        return output
+
+    with tempfile.TemporaryDirectory() as directory:
+        # The app keeps its indexes and caches under the working directory
+        os.chdir(directory)
+        path = os.path.join(directory, "feedback.csv")
+        stage("generate", lambda: synthetic_feedback(rows).to_csv(path, index=False))
+        df = stage("load", lambda: load_excel_data(path))
+        documents = stage("documents", lambda: df_to_document(df))
+        namespace = vectorstore_handler.dataset_namespace(path)
+        vectorstore = stage("index", lambda: vectorstore_handler.create_vectorstore(documents, namespace, source="feedback.csv"))
+        chain = stage("chain", lambda: rag_chain.create_qa_chain(vectorstore))
+        asked = questions(df, args.queries)
+        del documents, df
+
+        latencies = []
+
+        def ask():
+            for question in asked:
+                start = time.perf_counter()
+                chain.invoke({"input": question})
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        stage("queries", ask)
+        results.put({
+            "rows": rows,
+            "documents": vectorstore.index.ntotal,
+            "stages": stages,
+            "query_ms": {
+                "count": len(latencies),
+                "p50": round(float(np.percentile(latencies, 50)), 3),
+                "p99": round(float(np.percentile(latencies, 99)), 3),
+                "mean": round(float(np.mean(latencies)), 3),
+            },
+        })
+
+
+def git_commit():
+    """Return the current commit of the repository, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print each stage's time relative to the same stage of a saved run."""
+    with open(baseline_path) as f:
+        baseline = {entry["rows"]: entry for entry in json.load(f)["results"]}
+    print(f"\nvs {baseline_path}:")
+    for entry in results:
+        previous = baseline.get(entry["rows"])
+        if previous is None:
+            continue
+        changes = [
+            f"{name} {entry['stages'][name]['seconds'] / previous['stages'][name]['seconds']:.2f}x"
+            for name in entry["stages"] if previous["stages"].get(name, {}).get("seconds")
+            # The queries stage total only compares between runs asking as many questions
+            and (name != "queries" or entry["query_ms"]["count"] == previous["query_ms"]["count"])
+        ]
+        changes.append(f"p50 {entry['query_ms']['p50'] / previous['query_ms']['p50']:.2f}x")
+        changes.append(f"p99 {entry['query_ms']['p99'] / previous['query_ms']['p99']:.2f}x")
+        print(f"{entry['rows']:>8}  " + "  ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the ingestion and question-answering pipeline end to end, offline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--output", default="bench_pipeline.json")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    print(f"{'rows':>8} {'stage':>10} {'time (s)':>9} {'peak RSS (MB)':>14}")
+    for rows in args.sizes:
+        worker_results = context.Queue()
+        worker = context.Process(target=run_size, args=(rows, args, worker_results))
+        worker.start()
+        entry = None
+        while entry is None:
+            # Checked before waiting, so results put just before exiting are still read
+            alive = worker.is_alive()
+            try:
+                entry = worker_results.get(timeout=WORKER_POLL_SECONDS)
+            except queue.Empty:
+                if not alive:
+                    raise RuntimeError(f"The benchmark worker for {rows} rows exited with code {worker.exitcode}.")
+        worker.join()
+        results.append(entry)
+        for name, measured in entry["stages"].items():
+            print(f"{rows:>8} {name:>10} {measured['seconds']:>9.3f} {measured['peak_rss_mb']:>14.0f}")
+        print(f"{rows:>8} {'query':>10} p50 {entry['query_ms']['p50']:.2f} ms, p99 {entry['query_ms']['p99']:.2f} ms")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "arguments": {"queries": args.queries, "dimension": args.dimension},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
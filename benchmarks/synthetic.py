@@ -0,0 +1,30 @@
+#=======================Synthetic feedback data for benchmarks==================
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from modules.data_processing import CATEGORICAL_COLUMNS
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "Student Feedback 04.csv")
+
+
+def synthetic_feedback(n_rows, seed=0):
+    """
+    Generate a feedback DataFrame with the schema of the sample CSV. Categorical
+    columns are resampled together from sample rows so lecturer, department and
+    faculty stay consistent; rating columns get random values in the sample's range.
+    """
+    sample = pd.read_csv(SAMPLE_FILE)
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(sample), size=n_rows)
+
+    columns = {}
+    for col in sample.columns:
+        if col.strip() in CATEGORICAL_COLUMNS:
+            columns[col] = sample[col].to_numpy()[picks]
+        else:
+            low, high = int(sample[col].min()), int(sample[col].max())
+            columns[col] = rng.integers(low, high + 1, size=n_rows)
+    return pd.DataFrame(columns)
@@ -0,0 +1,214 @@
+#=============================Answer aggregate questions with pandas instead of retrieval================
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from modules.data_loader import load_excel_data
+from modules.data_processing import CATEGORICAL_COLUMNS
+from modules.query_parsing import build_value_index, find_entities, normalize_text
+
+# Aggregation keywords, checked in order. "count" only applies when no other
+# aggregation of a named rating column does: "the total number of missed
+# classes" asks for a sum, not for the number of rows
+AGGREGATIONS = (
+    ("count", ("how many", "number of", "count")),
+    ("median", ("median",)),
+    ("sum", ("total", "sum")),
+    ("max", ("maximum", "max")),
+    ("min", ("minimum", "min")),
+    ("mean", ("average", "avg", "mean", "compare", "comparison", "versus", "vs")),
+)
+RANK_DESCENDING = ("highest", "best", "top", "most")
+RANK_ASCENDING = ("lowest", "worst", "least", "bottom")
+
+GROUP_ALIASES = {
+    "faculty": "Faculty", "faculties": "Faculty",
+    "department": "Department", "departments": "Department",
+    "lecturer": "Lecturers Name", "lecturers": "Lecturers Name",
+    "year": "Year", "years": "Year",
+    "section": "Section", "sections": "Section", "semester": "Section", "semesters": "Section",
+}
+GROUP_PATTERN = re.compile(
+    r"\b(?:by|per|for each|for every|each|every|across|which)\s+(" + "|".join(GROUP_ALIASES) + r")\b"
+)
+
+# Words too generic to identify a rating column on their own
+METRIC_STOPWORDS = {"class", "rating", "ratings", "other", "another", "lecturer", "only", "from", "talk"}
+
+# Keep the table handed to the LLM small no matter how many groups there are
+MAX_TABLE_ROWS = 50
+MAX_CACHED_FRAMES = 4
+
+_frames = OrderedDict()
+_frames_lock = threading.Lock()
+
+
+def load_query_frame(file_path):
+    """
+    Load a data file for aggregate queries, with stripped column names and
+    categorical columns stored as pandas categories. Frames are cached per
+    process and reloaded when the file's mtime or size changes.
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    with _frames_lock:
+        if key in _frames:
+            _frames.move_to_end(key)
+            return _frames[key]
+
+    df = load_excel_data(file_path)
+    df.columns = df.columns.str.strip()
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].astype("category")
+    df.attrs["value_index"] = build_value_index(
+        {col: df[col].dropna().unique() for col in CATEGORICAL_COLUMNS if col in df.columns}
+    )
+
+    with _frames_lock:
+        _frames[key] = df
+        while len(_frames) > MAX_CACHED_FRAMES:
+            _frames.popitem(last=False)
+    return df
+
+
+def rating_columns(df):
+    """Return the numeric columns that are ratings rather than categories."""
+    return [col for col in df.columns if col not in CATEGORICAL_COLUMNS and pd.api.types.is_numeric_dtype(df[col])]
+
+
+def _has_phrase(text, phrase):
+    return f" {phrase} " in f" {text} "
+
+
+def _find_metrics(text, df):
+    """Return rating columns named in the question, by full name or a distinctive word."""
+    columns = rating_columns(df)
+    named = [col for col in columns if _has_phrase(text, normalize_text(col))]
+    if named:
+        return named
+
+    words = set(text.split())
+    found = []
+    for col in columns:
+        for alias in normalize_text(col).split():
+            if len(alias) < 5 or alias in METRIC_STOPWORDS:
+                continue
+            if alias in words or any(len(word) >= 6 and alias.startswith(word) for word in words):
+                found.append(col)
+                break
+    if not found and ({"ratings", "scores"} & words):
+        return columns
+    return found
+
+
+def parse_aggregate_query(question, df):
+    """
+    Detect an aggregate/filter question about the DataFrame's known columns.
+    Returns a dict describing the query, or None if it should go to retrieval.
+    """
+    text = normalize_text(question)
+
+    matched = [name for name, keywords in AGGREGATIONS if any(_has_phrase(text, keyword) for keyword in keywords)]
+    metrics = _find_metrics(text, df)
+    if metrics and "count" in matched and len(matched) > 1:
+        matched.remove("count")
+    aggregation = matched[0] if matched else None
+
+    ascending = None
+    if any(_has_phrase(text, word) for word in RANK_DESCENDING):
+        ascending = False
+    elif any(_has_phrase(text, word) for word in RANK_ASCENDING):
+        ascending = True
+
+    if aggregation is None and ascending is None:
+        return None
+    aggregation = aggregation or "mean"
+
+    if aggregation != "count" and not metrics:
+        return None
+
+    group_by = []
+    for alias in GROUP_PATTERN.findall(text):
+        column = GROUP_ALIASES[alias]
+        if column in df.columns and column not in group_by:
+            group_by.append(column)
+
+    filters = find_entities(question, df.attrs.get("value_index", {}))
+    for column, values in filters.items():
+        # Naming several lecturers/departments means comparing them
+        if len(values) > 1 and column not in group_by:
+            group_by.append(column)
+
+    return {
+        "aggregation": aggregation,
+        "metrics": metrics,
+        "filters": filters,
+        "group_by": group_by,
+        "ascending": ascending,
+    }
+
+
+def run_aggregate_query(df, query):
+    """Run a parsed aggregate query over every row with vectorized pandas operations."""
+    mask = pd.Series(True, index=df.index)
+    for column, values in query["filters"].items():
+        mask &= df[column].isin(values)
+    subset = df[mask]
+
+    group_by = query["group_by"]
+    aggregation = query["aggregation"]
+    metrics = query["metrics"]
+
+    if aggregation == "count":
+        if group_by:
+            table = subset.groupby(group_by, observed=True).size().rename("Responses").reset_index()
+        else:
+            table = pd.DataFrame({"Responses": [len(subset)]})
+        sort_column = "Responses"
+    else:
+        if group_by:
+            grouped = subset.groupby(group_by, observed=True)
+            table = grouped[metrics].agg(aggregation)
+            table["Responses"] = grouped.size()
+            table = table.reset_index()
+        else:
+            table = subset[metrics].agg(aggregation).to_frame().T
+            table["Responses"] = len(subset)
+        sort_column = metrics[0]
+
+    if query["ascending"] is not None and group_by:
+        table = table.sort_values(sort_column, ascending=query["ascending"])
+
+    return table.round(2).reset_index(drop=True)
+
+
+def describe_query(query):
+    """Return a one-line, human-readable description of a parsed query."""
+    parts = [query["aggregation"]]
+    if query["metrics"]:
+        parts.append("of " + ", ".join(query["metrics"]))
+    if query["filters"]:
+        conditions = [f"{column} in ({', '.join(map(str, values))})" for column, values in query["filters"].items()]
+        parts.append("where " + " and ".join(conditions))
+    if query["group_by"]:
+        parts.append("grouped by " + ", ".join(query["group_by"]))
+    return " ".join(parts)
+
+
+def table_to_markdown(table, max_rows=MAX_TABLE_ROWS):
+    """Render a result table as a markdown table, truncated to max_rows."""
+    shown = table.head(max_rows)
+    lines = [
+        "| " + " | ".join(str(col) for col in shown.columns) + " |",
+        "| " + " | ".join("---" for _ in shown.columns) + " |",
+    ]
+    for row in shown.itertuples(index=False):
+        lines.append("| " + " | ".join(str(value) for value in row) + " |")
+    if len(table) > max_rows:
+        lines.append(f"({len(table) - max_rows} more rows not shown)")
+    return "\n".join(lines)
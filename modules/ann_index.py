@@ -0,0 +1,173 @@
+#=============================Approximate nearest-neighbour index profiles================
+
+import math
+import os
+
+import faiss
+import numpy as np
+
+# Index layouts a vectorstore can use. "flat" is exact search; the others
+# trade a little recall for query time that grows sub-linearly with the corpus
+INDEX_PROFILES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+VECTORSTORE_INDEX_PROFILE = os.getenv("VECTORSTORE_INDEX_PROFILE", "flat")
+# Vectors sampled to train IVF centroids and PQ codebooks
+ANN_TRAINING_SAMPLE = int(os.getenv("ANN_TRAINING_SAMPLE", "50000"))
+# Below this many vectors exact search is fast enough and IVF/PQ training is unreliable
+ANN_MIN_VECTORS = int(os.getenv("ANN_MIN_VECTORS", "10000"))
+# IVF lists visited per query, and HNSW candidate list size per query
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+ANN_EF_SEARCH = int(os.getenv("ANN_EF_SEARCH", "64"))
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+PQ_BITS = 8
+# Dimensions encoded by each PQ sub-quantizer
+PQ_DIMS_PER_CODE = 8
+
+
+def index_profile(index):
+    """Return the profile name of a FAISS index."""
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def effective_profile(profile, n_vectors):
+    """Return the profile to build for a corpus size; small corpora always stay flat."""
+    if profile not in INDEX_PROFILES:
+        raise ValueError(f"Unknown index profile {profile!r}; expected one of {', '.join(INDEX_PROFILES)}.")
+    return profile if n_vectors >= ANN_MIN_VECTORS else "flat"
+
+
+def _nlist(n_vectors):
+    # ~4 sqrt(n) lists, with at least 39 training points per centroid
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def _pq_m(dimension):
+    # The most sub-quantizers that divide the dimension and encode >= PQ_DIMS_PER_CODE dims each
+    for m in range(max(1, dimension // PQ_DIMS_PER_CODE), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def new_index(profile, dimension, metric, n_vectors):
+    """Return an empty, untrained FAISS index of a profile sized for n_vectors."""
+    if profile == "flat":
+        return faiss.IndexFlatIP(dimension) if metric == faiss.METRIC_INNER_PRODUCT else faiss.IndexFlatL2(dimension)
+    if profile == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M, metric)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index
+
+    quantizer = new_index("flat", dimension, metric, n_vectors)
+    if profile == "ivf_pq":
+        return faiss.IndexIVFPQ(quantizer, dimension, _nlist(n_vectors), _pq_m(dimension), PQ_BITS, metric)
+    return faiss.IndexIVFFlat(quantizer, dimension, _nlist(n_vectors), metric)
+
+
+def configure_search(index, nprobe=ANN_NPROBE, ef_search=ANN_EF_SEARCH):
+    """Apply the query-time accuracy/speed settings to an IVF or HNSW index."""
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(nprobe, index.nlist)
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+    return index
+
+
+def build_index(profile, vectors, metric, sample_size=ANN_TRAINING_SAMPLE, seed=0):
+    """
+    Build an index of a profile over vectors, training it on a random sample
+    of at most sample_size of them. Vectors keep their positions, so a
+    vectorstore's position -> document id mapping stays valid.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_vectors, dimension = vectors.shape
+    index = new_index(profile, dimension, metric, n_vectors)
+
+    if not index.is_trained:
+        sample = vectors
+        if n_vectors > sample_size:
+            picks = np.random.default_rng(seed).choice(n_vectors, size=sample_size, replace=False)
+            sample = vectors[np.sort(picks)]
+        index.train(sample)
+    if isinstance(index, faiss.IndexIVF):
+        # Lets vectors be reconstructed by position, for rebuilds after deletes
+        index.make_direct_map()
+    index.add(vectors)
+    return configure_search(index)
+
+
+def index_vectors(index, positions=None):
+    """Return the stored vectors of an index, all of them or those at the given positions (lossy for PQ)."""
+    if positions is None:
+        return index.reconstruct_n(0, index.ntotal)
+    return index.reconstruct_batch(np.asarray(positions, dtype=np.int64))
+
+
+def search_parameters(index, selector):
+    """Return search parameters restricting a search to selector, with the index's own query settings."""
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def index_metadata(index):
+    """Describe an index's profile and parameters, for the saved index metadata."""
+    metadata = {"profile": index_profile(index), "dimension": index.d, "vectors": index.ntotal}
+    if isinstance(index, faiss.IndexIVF):
+        metadata.update({"nlist": index.nlist, "nprobe": index.nprobe})
+        if isinstance(index, faiss.IndexIVFPQ):
+            metadata.update({"pq_m": index.pq.M, "pq_bits": index.pq.nbits})
+    elif isinstance(index, faiss.IndexHNSW):
+        metadata.update({"hnsw_m": HNSW_M, "ef_construction": index.hnsw.efConstruction, "ef_search": index.hnsw.efSearch})
+    return metadata
+
+
+def apply_index_profile(vs, profile):
+    """
+    Rebuild a FAISS vectorstore's index in place with another profile if it
+    does not already use it. Returns True if the index was rebuilt.
+    """
+    target = effective_profile(profile, vs.index.ntotal)
+    if index_profile(vs.index) == target:
+        return False
+    vs.index = build_index(target, index_vectors(vs.index), vs.index.metric_type)
+    return True
+
+
+def delete_from_vectorstore(vs, ids):
+    """
+    Delete documents from a FAISS vectorstore. Flat indexes delete in place;
+    IVF and HNSW indexes cannot shift positions down the way the vectorstore
+    expects, so the remaining vectors are re-added to an emptied copy of the
+    index, which keeps its trained centroids and codebooks.
+    """
+    if index_profile(vs.index) == "flat":
+        vs.delete(ids)
+        return
+
+    ids = set(ids)
+    positions = sorted(vs.index_to_docstore_id.items())
+    kept = [position for position, doc_id in positions if doc_id not in ids]
+    vectors = index_vectors(vs.index, kept)
+    index = faiss.clone_index(vs.index)
+    index.reset()
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    index.add(vectors)
+    vs.index = configure_search(index)
+    removed = [doc_id for _, doc_id in positions if doc_id in ids]
+    if removed:
+        vs.docstore.delete(removed)
+    vs.index_to_docstore_id = {
+        new_position: vs.index_to_docstore_id[old_position] for new_position, old_position in enumerate(kept)
+    }
@@ -0,0 +1,167 @@
+#=============================Cache of answers to repeated questions================
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from modules.metrics import add_collector
+from modules.query_parsing import normalize_text
+from modules.vectorstore_handler import get_embeddings
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+# Cosine similarity above which a paraphrase reuses a cached answer; 0 turns the
+# embedding lookup off so only exact (normalized) repeats are served from cache
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0"))
+
+# Question embeddings remembered between a missed lookup and the put that follows it
+_QUERY_VECTORS = 64
+
+
+class AnswerCache:
+    """
+    In-memory cache of answers keyed by (dataset namespace, model, normalized
+    question). The namespace is the dataset's content hash, so answers about
+    a changed dataset are never served. Entries expire after ttl_seconds and
+    the least recently used are evicted beyond max_entries. With an
+    embed_query function and a threshold above 0, a question that is not an
+    exact repeat can still reuse the answer of its closest cached paraphrase
+    about the same dataset.
+    """
+
+    def __init__(
+        self,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+        similarity_threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD,
+        embed_query=None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.embed_query = embed_query if similarity_threshold > 0 else None
+        self.entries = OrderedDict()  # key -> (answer, stored at, unit question vector or None)
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._query_vectors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _vector(self, question):
+        """Return the unit-length embedding of a normalized question, memoizing recent ones."""
+        with self._lock:
+            vector = self._query_vectors.get(question)
+        if vector is None:
+            vector = np.asarray(self.embed_query(question), dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+            with self._lock:
+                self._query_vectors[question] = vector
+                if len(self._query_vectors) > _QUERY_VECTORS:
+                    self._query_vectors.popitem(last=False)
+        return vector
+
+    def _expired(self, stored_at, now):
+        return self.ttl_seconds > 0 and now - stored_at > self.ttl_seconds
+
+    def get(self, namespace, question, model=None):
+        """Return the cached answer to a question about a dataset, or None."""
+        normalized = normalize_text(question)
+        key = (namespace, model, normalized)
+        now = time.time()
+
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and self._expired(entry[1], now):
+                del self.entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if self.embed_query is None:
+                self.misses += 1
+                return None
+
+        vector = self._vector(normalized)
+        with self._lock:
+            best_key, best_score = None, self.similarity_threshold
+            for other_key, (_, stored_at, other_vector) in self.entries.items():
+                if other_key[:2] != key[:2] or other_vector is None or self._expired(stored_at, now):
+                    continue
+                score = float(other_vector @ vector)
+                if score >= best_score:
+                    best_key, best_score = other_key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            return self.entries[best_key][0]
+
+    def put(self, namespace, question, answer, model=None):
+        """Cache the answer to a question about a dataset."""
+        normalized = normalize_text(question)
+        vector = self._vector(normalized) if self.embed_query is not None else None
+        with self._lock:
+            key = (namespace, model, normalized)
+            self.entries.pop(key, None)
+            self.entries[key] = (answer, time.time(), vector)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, namespace=None):
+        """Drop the cached answers about one dataset, or all of them."""
+        with self._lock:
+            for key in list(self.entries):
+                if namespace is None or key[0] == namespace:
+                    del self.entries[key]
+
+    def stats(self):
+        """Return hit/miss counters and the current number of cached answers."""
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+            }
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def _cache_metrics():
+    if _answer_cache is None:
+        return
+    stats = _answer_cache.stats()
+    yield "cache_requests_total", {"cache": "answer", "result": "hit"}, stats["hits"], "counter"
+    yield "cache_requests_total", {"cache": "answer", "result": "semantic_hit"}, stats["semantic_hits"], "counter"
+    yield "cache_requests_total", {"cache": "answer", "result": "miss"}, stats["misses"], "counter"
+    yield "cache_evictions_total", {"cache": "answer"}, stats["evictions"], "counter"
+    yield "cache_entries", {"cache": "answer"}, stats["entries"], "gauge"
+
+
+add_collector(_cache_metrics)
+
+
+def get_answer_cache():
+    """Return the process-wide answer cache, created on first use."""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            embed_query = get_embeddings().embed_query if ANSWER_CACHE_SIMILARITY_THRESHOLD > 0 else None
+            _answer_cache = AnswerCache(embed_query=embed_query)
+        return _answer_cache
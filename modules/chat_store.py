@@ -0,0 +1,291 @@
+#=============================Append-only chat history store================
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+CHAT_HISTORY_DIR = "chat_history"
+CHAT_HISTORY_DB = os.getenv("CHAT_HISTORY_DB", os.path.join(CHAT_HISTORY_DIR, "chat_history.sqlite3"))
+# Deleted conversations are only marked; they are purged at most this often
+CHAT_HISTORY_COMPACT_INTERVAL_SECONDS = float(os.getenv("CHAT_HISTORY_COMPACT_INTERVAL_SECONDS", "3600"))
+
+_COLUMNS = "id, timestamp, question, answer, ttft_seconds, total_seconds"
+
+# Result orders accepted by ChatHistoryStore.search; "relevance" (BM25) needs a search text
+SORT_ORDERS = ("newest", "oldest", "relevance")
+# Searches stop counting matches here; broader searches are shown newest first
+MAX_COUNTED_MATCHES = 1000
+
+
+def exchange_hash(question, answer):
+    """Return the hash that identifies a question/answer pair for duplicate detection."""
+    return hashlib.sha256(json.dumps([question, answer]).encode("utf-8")).hexdigest()
+
+
+def fts_query(text):
+    """
+    Turn free text into an FTS5 query matching conversations that contain
+    every word, the last one as a prefix so results follow the user's typing.
+    """
+    words = text.split()
+    if not words:
+        return None
+    terms = ['"' + word.replace('"', '""') + '"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _row_to_chat(row):
+    chat = {"id": row[0], "timestamp": row[1], "question": row[2], "answer": row[3]}
+    if row[4] is not None:
+        chat["ttft_seconds"] = row[4]
+        chat["total_seconds"] = row[5]
+    return chat
+
+
+class ChatHistoryStore:
+    """
+    Chat history for every user in one SQLite database in WAL mode. Each
+    exchange is a single appended row; a unique index on (user, exchange
+    hash) over live rows rejects duplicates without scanning the history.
+    Deletes only mark rows, and marked rows are purged by compact(), which
+    runs on its own at most once per compact_interval. Questions and answers
+    are indexed in an FTS5 table kept in sync by triggers, so searching,
+    sorting and paging all happen in SQL.
+    """
+
+    def __init__(self, path=CHAT_HISTORY_DB, compact_interval=CHAT_HISTORY_COMPACT_INTERVAL_SECONDS):
+        self.path = path
+        self.compact_interval = compact_interval
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chats ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " username TEXT NOT NULL,"
+            " timestamp TEXT NOT NULL,"
+            " question TEXT NOT NULL,"
+            " answer TEXT NOT NULL,"
+            " exchange_hash TEXT NOT NULL,"
+            " ttft_seconds REAL,"
+            " total_seconds REAL,"
+            " deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_chats_exchange"
+            " ON chats (username, exchange_hash) WHERE deleted = 0"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chats_user ON chats (username, deleted, id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._create_search_index()
+        self._conn.commit()
+        row = self._conn.execute("SELECT value FROM store_meta WHERE key = 'last_compacted'").fetchone()
+        self._last_compacted = float(row[0]) if row else time.time()
+
+    def _create_search_index(self):
+        """Create the full-text index over questions and answers, indexing existing rows once."""
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chats_fts'"
+        ).fetchone()
+        if exists:
+            return
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE chats_fts USING fts5("
+            " question, answer, content='chats', content_rowid='id', tokenize='unicode61')"
+        )
+        # Rows marked deleted stay indexed until compaction removes them; searches skip them
+        self._conn.execute(
+            "CREATE TRIGGER chats_fts_insert AFTER INSERT ON chats BEGIN"
+            " INSERT INTO chats_fts (rowid, question, answer) VALUES (new.id, new.question, new.answer);"
+            " END"
+        )
+        self._conn.execute(
+            "CREATE TRIGGER chats_fts_delete AFTER DELETE ON chats BEGIN"
+            " INSERT INTO chats_fts (chats_fts, rowid, question, answer)"
+            " VALUES ('delete', old.id, old.question, old.answer);"
+            " END"
+        )
+        self._conn.execute("INSERT INTO chats_fts (chats_fts) VALUES ('rebuild')")
+
+    def _where(self, username, text):
+        """Return the FROM/WHERE clause and parameters selecting a user's live conversations matching text."""
+        query = fts_query(text) if text else None
+        if query is None:
+            return "FROM chats WHERE chats.username = ? AND chats.deleted = 0", [username]
+        return (
+            # CROSS JOIN keeps the full-text match as the outer loop instead of the user's whole history
+            "FROM chats_fts CROSS JOIN chats ON chats.id = chats_fts.rowid"
+            " WHERE chats_fts MATCH ? AND chats.username = ? AND chats.deleted = 0",
+            [query, username],
+        )
+
+    def append(self, username, question, answer, timings=None, timestamp=None):
+        """
+        Append one exchange. Returns its id, or None if the user already has
+        the same question and answer in their history.
+        """
+        timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        ttft = total = None
+        if timings and timings.get("ttft") is not None:
+            ttft, total = round(timings["ttft"], 3), round(timings["total"], 3)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO chats"
+                " (username, timestamp, question, answer, exchange_hash, ttft_seconds, total_seconds)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (username, timestamp, question, answer, exchange_hash(question, answer), ttft, total),
+            )
+            self._conn.commit()
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def count(self, username, text=None, limit=None):
+        """
+        Return how many conversations a user has, or how many of them match a
+        search text. With a limit, counting stops there, which keeps broad
+        searches over long histories fast.
+        """
+        clause, params = self._where(username, text)
+        with self._lock:
+            if limit is None:
+                return self._conn.execute(f"SELECT COUNT(*) {clause}", params).fetchone()[0]
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM (SELECT 1 {clause} LIMIT ?)", params + [limit]
+            ).fetchone()[0]
+
+    def count_matches(self, username, text, order, limit=MAX_COUNTED_MATCHES):
+        """
+        Count a user's conversations matching a search text, stopping past
+        limit. Returns (count, whether there are more than limit, the order to
+        show them in): ranking that many matches by relevance is slow, so
+        "relevance" falls back to "newest" for them.
+        """
+        count = self.count(username, text, limit=limit + 1)
+        if count <= limit:
+            return count, False, order
+        return limit, True, "newest" if order == "relevance" else order
+
+    def search(self, username, text=None, order="newest", limit=10, offset=0):
+        """
+        Return one page of a user's conversations, optionally only those
+        matching a search text, in "newest", "oldest" or (when searching)
+        "relevance" order.
+        """
+        clause, params = self._where(username, text)
+        searching = "MATCH" in clause
+        # Ordering by the full-text index's own rowid lets SQLite stop after one page
+        key = "chats_fts.rowid" if searching else "chats.id"
+        order_by = {"newest": f"{key} DESC", "oldest": f"{key} ASC", "relevance": "chats_fts.rank"}
+        if order == "relevance" and not searching:
+            order = "newest"
+        columns = ", ".join(f"chats.{column.strip()}" for column in _COLUMNS.split(","))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {columns} {clause} ORDER BY {order_by[order]} LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return [_row_to_chat(row) for row in rows]
+
+    def date_range(self, username):
+        """Return the timestamps of a user's first and latest conversations, or (None, None)."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT MIN(timestamp), MAX(timestamp) FROM chats WHERE username = ? AND deleted = 0", (username,)
+            ).fetchone()
+
+    def recent(self, username, limit):
+        """Return a user's latest conversations, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM chats WHERE username = ? AND deleted = 0 ORDER BY id DESC LIMIT ?",
+                (username, limit),
+            ).fetchall()
+        return [_row_to_chat(row) for row in rows]
+
+    def conversations(self, username):
+        """Return all of a user's conversations, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM chats WHERE username = ? AND deleted = 0 ORDER BY id",
+                (username,),
+            ).fetchall()
+        return [_row_to_chat(row) for row in rows]
+
+    def delete(self, username, chat_id):
+        """Mark one of a user's conversations deleted. Returns True if it existed."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE chats SET deleted = 1 WHERE id = ? AND username = ? AND deleted = 0", (chat_id, username)
+            )
+            self._conn.commit()
+        self.maybe_compact()
+        return cursor.rowcount > 0
+
+    def clear(self, username):
+        """Mark all of a user's conversations deleted."""
+        with self._lock:
+            self._conn.execute("UPDATE chats SET deleted = 1 WHERE username = ? AND deleted = 0", (username,))
+            self._conn.commit()
+        self.maybe_compact()
+
+    def import_json(self, username, path):
+        """
+        Append the conversations of a legacy <user>_chat_history.json file,
+        then rename it so it is only imported once. Returns the number imported.
+        """
+        with open(path, 'r') as f:
+            chats = json.load(f)
+        imported = sum(
+            1 for chat in chats
+            if self.append(username, chat['question'], chat['answer'], timestamp=chat.get('timestamp')) is not None
+        )
+        os.replace(path, path + ".imported")
+        return imported
+
+    def maybe_compact(self):
+        """Run compact() if the last compaction is older than the compaction interval."""
+        if time.time() - self._last_compacted >= self.compact_interval:
+            self.compact()
+
+    def compact(self):
+        """Purge rows marked deleted and fold the write-ahead log back into the database."""
+        now = time.time()
+        with self._lock:
+            purged = self._conn.execute("DELETE FROM chats WHERE deleted = 1").rowcount
+            self._conn.execute(
+                "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('last_compacted', ?)", (str(now),)
+            )
+            self._conn.commit()
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._last_compacted = now
+        return purged
+
+
+_chat_store = None
+_chat_store_lock = threading.Lock()
+
+
+def get_chat_store():
+    """Return the process-wide chat history store, created on first use."""
+    global _chat_store
+    with _chat_store_lock:
+        if _chat_store is None:
+            _chat_store = ChatHistoryStore()
+        return _chat_store
+
+
+def import_legacy_history(username):
+    """Move a user's JSON chat history from before the store existed into the store, if there is one."""
+    path = os.path.join(CHAT_HISTORY_DIR, f"{username}_chat_history.json")
+    if os.path.exists(path):
+        get_chat_store().import_json(username, path)
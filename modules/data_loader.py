@@ -1,25 +1,127 @@
 #======================Load excel file as df===============
 
-import pandas as pd
+import importlib.util
+import logging
+import os
 
 import pandas as pd
 
-def load_excel_data(file_path):
-    """Load data from CSV or Excel file based on extension or content type."""
+from modules.file_fingerprints import file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "5000"))
+
+# Fully parsed files are saved as uncompressed Feather (Arrow IPC) sidecars
+# named by the file's content hash and parser, and memory-mapped instead of
+# parsed again on later loads. Needs pyarrow; without it every load parses
+# the file
+FRAME_CACHE = os.getenv("FRAME_CACHE", "1") == "1"
+FRAME_CACHE_DIR = os.getenv("FRAME_CACHE_DIR", os.path.join(".cache", "frames"))
+FRAME_CACHE_MAX_FILES = int(os.getenv("FRAME_CACHE_MAX_FILES", "20"))
+# pandas engine for Excel files; "auto" picks python-calamine when it is
+# installed, which parses several times faster than the default openpyxl
+EXCEL_ENGINE = os.getenv("EXCEL_ENGINE", "auto")
+
+# Reader options that keep every value as the text in the file; only empty
+# cells become missing (not "NA", "null" and the like)
+RAW_TEXT = {"dtype": str, "keep_default_na": False, "na_values": [""]}
+
+
+def _filename(file_path):
+    # Check if it's a Streamlit UploadedFile object
+    if hasattr(file_path, 'name'):
+        return file_path.name
+    return file_path  # Assume it's a string path
+
+
+def excel_engine(nrows=None):
+    """Return the pandas Excel engine to use, or None for pandas' default."""
+    if EXCEL_ENGINE != "auto":
+        return EXCEL_ENGINE
+    # calamine reads the whole sheet even for a few rows, where openpyxl stops early
+    if nrows is None and importlib.util.find_spec("python_calamine"):
+        return "calamine"
+    return None
+
+
+def _full_parser(filename):
+    """Return the name of the parser a full load of a file goes through."""
+    if filename.endswith('.csv'):
+        return "csv"
+    return excel_engine() or ("xlrd" if filename.endswith('.xls') else "openpyxl")
+
+
+def sidecar_path(file_path, directory=FRAME_CACHE_DIR):
+    """Return the path of a data file's parsed-frame sidecar, or None if frames are not cached for it.
+    The name holds the parser as well as the content hash, since engines do
+    not parse the same file into the same frame (e.g. dates and numbers)."""
+    if not FRAME_CACHE or not isinstance(file_path, (str, os.PathLike)) or importlib.util.find_spec("pyarrow") is None:
+        return None
+    return os.path.join(directory, f"{file_fingerprint(file_path)}-{_full_parser(str(file_path))}.feather")
+
+
+def _read_sidecar(path):
+    """Memory-map a sidecar as an Arrow table, or return None if there is none or it cannot be read."""
+    if path is None or not os.path.exists(path):
+        return None
+    from pyarrow import feather
+
     try:
-        # Check if it's a Streamlit UploadedFile object
-        if hasattr(file_path, 'name'):
-            filename = file_path.name
-        else:
-            filename = file_path  # Assume it's a string path
+        return feather.read_table(path, memory_map=True)
+    except Exception as e:
+        logger.warning("Ignoring unreadable frame cache %s: %s", path, e)
+        return None
+
+
+def _write_sidecar(df, path):
+    """Save a parsed frame as a sidecar, keeping at most FRAME_CACHE_MAX_FILES of them."""
+    from pyarrow import feather
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Written under another name and swapped in, since other processes may have it mapped
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    try:
+        feather.write_feather(df, tmp_file, compression="uncompressed")
+        os.replace(tmp_file, path)
+    except Exception as e:
+        # e.g. a column mixing numbers and text, which Arrow cannot store
+        logger.warning("Frame not cached: %s", e)
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return
+
+    sidecars = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(".feather")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in sidecars[:max(0, len(sidecars) - FRAME_CACHE_MAX_FILES)]:
+        os.remove(entry.path)
+
+
+def load_excel_data(file_path, nrows=None):
+    """Load data from CSV or Excel file based on extension or content type.
+    Pass nrows to read only the first rows, e.g. for a preview. A full load
+    caches the parsed frame (see FRAME_CACHE), and later loads of the same
+    content, previews included, read it from there."""
+    try:
+        filename = _filename(file_path)
+        if not filename.endswith(('.csv', '.xlsx', '.xls')):
+            raise ValueError("Unsupported file format. Use .csv, .xlsx, or .xls")
+
+        sidecar = sidecar_path(file_path)
+        table = _read_sidecar(sidecar)
+        if table is not None:
+            return (table if nrows is None else table.slice(0, nrows)).to_pandas()
 
         if filename.endswith('.csv'):
-            df = pd.read_csv(file_path)
-        elif filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file_path)
+            df = pd.read_csv(file_path, nrows=nrows)
         else:
-            raise ValueError("Unsupported file format. Use .csv, .xlsx, or .xls")
+            df = pd.read_excel(file_path, nrows=nrows, engine=excel_engine(nrows))
 
+        if sidecar is not None and nrows is None:
+            _write_sidecar(df, sidecar)
         return df
 
     except FileNotFoundError:
@@ -30,6 +132,74 @@ def load_excel_data(file_path):
         raise RuntimeError(f"An error occurred while loading the file: {str(e)}")
 
 
+def _cell_text(value):
+    """Return an Excel cell as the text a CSV export of it would hold, or None if it is empty."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _iter_xlsx_batches(file_path, batch_size):
+    """Stream the first sheet of an .xlsx file (the one pd.read_excel reads) through openpyxl's read-only row iterator."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        batch = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            batch.append([_cell_text(value) for value in row])
+            if len(batch) == batch_size:
+                yield pd.DataFrame(batch, columns=header, dtype="str")
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header, dtype="str")
+    finally:
+        workbook.close()
+
+
+def iter_excel_batches(file_path, batch_size=INGEST_BATCH_SIZE):
+    """
+    Yield the rows of a CSV or Excel file as DataFrames of at most batch_size
+    rows, so large files never have to be held in memory at once. Values are
+    kept as the text in the file (empty cells as missing) instead of having
+    their types inferred batch by batch, so a row always reads the same, and
+    keeps its row id, wherever the batch boundaries fall.
+    """
+    try:
+        filename = _filename(file_path)
+
+        # Parsed-frame sidecars are not read here: their values have types
+        # inferred, so rows would read differently than when streamed
+        if filename.endswith('.csv'):
+            with pd.read_csv(file_path, chunksize=batch_size, **RAW_TEXT) as reader:
+                yield from reader
+        elif filename.endswith('.xlsx'):
+            yield from _iter_xlsx_batches(file_path, batch_size)
+        elif filename.endswith('.xls'):
+            # Legacy .xls has no streaming reader, so slice the parsed sheet
+            df = pd.read_excel(file_path, **RAW_TEXT)
+            for start in range(0, len(df), batch_size):
+                yield df.iloc[start:start + batch_size]
+        else:
+            raise ValueError("Unsupported file format. Use .csv, .xlsx, or .xls")
+
+    except FileNotFoundError:
+        raise FileNotFoundError(f"File not found: {file_path}")
+    except pd.errors.ParserError:
+        raise ValueError("Failed to parse file. Please check the file content and format.")
+    except Exception as e:
+        raise RuntimeError(f"An error occurred while loading the file: {str(e)}")
+
+
 
 
 # def load_excel_data(file_path):
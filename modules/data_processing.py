@@ -1,35 +1,101 @@
 #=======================Convert df into document==================
 
+import hashlib
+from collections import Counter
+
+import pandas as pd
 from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+from modules.metrics import span
 
+# Columns that identify who and what a feedback row is about
+CATEGORICAL_COLUMNS = ("Faculty", "Department", "Lecturers Name", "Year", "Section")
 
-def df_to_document(df):
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=CHUNK_OVERLAP,
+    separators=["\n\n", "\n", ".", ",", " ", ""]
+)
+
+
+def row_id(text, seen):
     """
-    Convert a pandas DataFrame to a list of chunked Document objects
-    suitable for retrieval or embedding.
+    Return a stable id for a row based on its content. Identical rows get an
+    occurrence suffix so each copy keeps its own id across ingests.
     """
-    try:
-        if df.empty:
-            raise ValueError("DataFrame is empty. Please provide a valid DataFrame.")
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+    occurrence = seen[digest]
+    seen[digest] += 1
+    return digest if occurrence == 0 else f"{digest}#{occurrence}"
+
+
+def row_texts(df):
+    """
+    Format every row as "column: value" lines in one pass per column,
+    using vectorized string concatenation instead of iterating rows.
+    """
+    texts = None
+    for col in df.columns:
+        # Missing values are written as "nan" on purpose: that is what older
+        # pandas' astype(str) produced, so row text (and row ids) stay the
+        # same. pandas 3 keeps them missing through astype(str), which would
+        # make the whole row's text missing, hence the explicit fill
+        values = f"{col}: " + df[col].astype(str).fillna("nan")
+        texts = values if texts is None else texts + "\n" + values
+    return texts
+
 
-        # Convert each row of the DataFrame into a Document
-        documents = [
-            Document(page_content="\n".join(f"{col}: {row[col]}" for col in df.columns))
-            for _, row in df.iterrows()
-        ]
+def row_metadata(df):
+    """
+    Return one metadata dict per row holding the row's categorical columns
+    (Faculty, Department, ...), keyed by their stripped column names.
+    """
+    columns = [(col, str(col).strip()) for col in df.columns if str(col).strip() in CATEGORICAL_COLUMNS]
+    values = [df[col].tolist() for col, _ in columns]
+    return [
+        {name: value for (_, name), value in zip(columns, row) if not pd.isna(value)}
+        for row in zip(*values)
+    ] if columns else [{} for _ in range(len(df))]
+
+
+def iter_documents(df, seen=None):
+    """
+    Lazily yield Document objects for the rows of a DataFrame. Rows that fit
+    in a single chunk are emitted as-is; only longer rows go through the splitter.
+    Categorical columns are also stored as metadata for filtered retrieval.
+    Pass the same `seen` Counter for consecutive batches of one file so
+    duplicate rows get consistent ids.
+    """
+    if df.empty:
+        raise ValueError("DataFrame is empty. Please provide a valid DataFrame.")
 
-        # Split the documents into chunks for better processing
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=50,
-            separators=["\n\n", "\n", ".", ",", " ", ""]
-        )
+    if seen is None:
+        seen = Counter()
+    for text, categories in zip(row_texts(df), row_metadata(df)):
+        metadata = {"row_id": row_id(text, seen), **categories}
 
-        chunked_documents = text_splitter.split_documents(documents)
-        return chunked_documents
+        if len(text) <= CHUNK_SIZE:
+            yield Document(page_content=text, metadata=metadata)
+        else:
+            for chunk in text_splitter.split_text(text):
+                yield Document(page_content=chunk, metadata=dict(metadata))
 
+
+def df_to_document(df):
+    """
+    Convert a pandas DataFrame to a list of chunked Document objects
+    suitable for retrieval or embedding. Every chunk carries the id of
+    the row it came from in metadata["row_id"].
+    """
+    try:
+        with span("documents") as documents_span:
+            documents = list(iter_documents(df))
+            documents_span.add(rows=len(df), documents=len(documents))
+            return documents
     except Exception as e:
         raise RuntimeError(f"Failed to convert DataFrame to documents: {str(e)}")
 
@@ -0,0 +1,188 @@
+#=============================Offset-indexed docstore read lazily from disk================
+
+import json
+import os
+from bisect import bisect_left
+from collections.abc import Mapping
+
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+# Plain files that numpy can map rather than Arrow: pyarrow only speeds up
+# parsing data files (FRAME_CACHE in modules/data_loader.py), which works
+# without it, and loading an index should not depend on it
+
+# One JSON record [page_content, metadata] per document, in index position order
+DOCSTORE_FILE = "docstore.dat"
+# Byte offset of every record, plus the end of the last one
+DOCSTORE_OFFSETS_FILE = "docstore_offsets.npy"
+# Document id of every index position
+DOCSTORE_IDS_FILE = "docstore_ids.npy"
+# Index positions sorted by document id, for looking ids up by binary search
+DOCSTORE_ORDER_FILE = "docstore_order.npy"
+
+
+def _encode(doc):
+    return json.dumps([doc.page_content, doc.metadata], separators=(",", ":"), default=str).encode("utf-8")
+
+
+def _save_array(path, array):
+    # np.save appends ".npy" to a path that lacks it, so write through a file handle
+    with open(path + ".tmp", 'wb') as f:
+        np.save(f, array)
+    os.replace(path + ".tmp", path)
+
+
+def write_docstore(directory, docstore, index_to_docstore_id):
+    """
+    Write the documents of a FAISS vectorstore, in index position order, as a
+    record file with an offset table and an id lookup. Records of a
+    ColumnarDocstore that were not changed are copied without decoding.
+    """
+    ids = [index_to_docstore_id[position] for position in range(len(index_to_docstore_id))]
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+
+    path = os.path.join(directory, DOCSTORE_FILE)
+    with open(path + ".tmp", 'wb') as f:
+        for position, doc_id in enumerate(ids):
+            record = docstore.record(doc_id) if isinstance(docstore, ColumnarDocstore) else None
+            if record is None:
+                record = _encode(docstore.search(doc_id))
+            f.write(record)
+            offsets[position + 1] = offsets[position] + len(record)
+    os.replace(path + ".tmp", path)
+
+    encoded_ids = np.array([doc_id.encode("utf-8") for doc_id in ids], dtype=np.bytes_)
+    _save_array(os.path.join(directory, DOCSTORE_IDS_FILE), encoded_ids)
+    _save_array(os.path.join(directory, DOCSTORE_ORDER_FILE), np.argsort(encoded_ids, kind="stable").astype(np.int64))
+    # Written last, so a write cut short does not pass has_docstore. Readers
+    # never see a docstore while it is written: vectorstore_handler writes
+    # each save to a new snapshot directory and switches over in one rename
+    _save_array(os.path.join(directory, DOCSTORE_OFFSETS_FILE), offsets)
+
+
+def has_docstore(directory):
+    """Return True if a directory holds a docstore written by write_docstore."""
+    return os.path.exists(os.path.join(directory, DOCSTORE_OFFSETS_FILE))
+
+
+class SavedIds(Mapping):
+    """Read-only index position -> document id mapping of a saved docstore."""
+
+    def __init__(self, ids):
+        self._ids = ids
+
+    def __getitem__(self, position):
+        if not 0 <= position < len(self._ids):
+            raise KeyError(position)
+        return self._ids[position].decode("utf-8")
+
+    def __iter__(self):
+        return iter(range(len(self._ids)))
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class SavedPositions(Mapping):
+    """Read-only document id -> index position mapping of a saved docstore, by binary search."""
+
+    def __init__(self, ids, order):
+        self._ids = ids
+        self._order = order
+
+    def _bisect(self, key):
+        return bisect_left(self._order, key, key=lambda position: self._ids[position])
+
+    def __getitem__(self, doc_id):
+        key = doc_id.encode("utf-8")
+        i = self._bisect(key)
+        if i == len(self._order) or self._ids[self._order[i]] != key:
+            raise KeyError(doc_id)
+        return int(self._order[i])
+
+    def __iter__(self):
+        return (doc_id.decode("utf-8") for doc_id in self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def with_prefix(self, prefix):
+        """Return the sorted positions of every id that starts with prefix."""
+        key = prefix.encode("utf-8")
+        start = self._bisect(key)
+        end = start
+        while end < len(self._order) and self._ids[self._order[end]].startswith(key):
+            end += 1
+        return np.sort(np.asarray(self._order[start:end], dtype=np.int64))
+
+
+class ColumnarDocstore(Docstore, AddableMixin):
+    """
+    Docstore over the files written by write_docstore. The files are
+    memory-mapped, so opening one costs the same whatever the corpus size and
+    only the documents looked up are read and decoded. Documents added or
+    deleted afterwards are kept in memory on top of the saved ones; the files
+    are never changed in place.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        data_path = os.path.join(directory, DOCSTORE_FILE)
+        # An empty file cannot be mapped
+        self._data = np.memmap(data_path, dtype=np.uint8, mode="r").view(np.ndarray) if os.path.getsize(data_path) else b""
+        self._offsets = np.load(os.path.join(directory, DOCSTORE_OFFSETS_FILE), mmap_mode="r").view(np.ndarray)
+        # Plain ndarray views of the maps index much faster than np.memmap itself
+        ids = np.load(os.path.join(directory, DOCSTORE_IDS_FILE), mmap_mode="r").view(np.ndarray)
+        order = np.load(os.path.join(directory, DOCSTORE_ORDER_FILE), mmap_mode="r").view(np.ndarray)
+        self.index_to_docstore_id = SavedIds(ids)
+        self.id_positions = SavedPositions(ids, order)
+        self.added = {}
+        self.deleted = set()
+
+    def copy(self):
+        """Return a docstore over the same files with its own added and deleted documents."""
+        other = object.__new__(ColumnarDocstore)
+        other.__dict__.update(self.__dict__)
+        other.added = dict(self.added)
+        other.deleted = set(self.deleted)
+        return other
+
+    def _saved_position(self, doc_id):
+        if doc_id in self.deleted:
+            return None
+        return self.id_positions.get(doc_id)
+
+    def record(self, doc_id):
+        """Return the saved, encoded record of a document, or None if it was added or deleted since."""
+        if doc_id in self.added:
+            return None
+        position = self._saved_position(doc_id)
+        if position is None:
+            return None
+        return bytes(self._data[self._offsets[position]:self._offsets[position + 1]])
+
+    def search(self, search):
+        """Return the document with an id, or an error message as InMemoryDocstore does."""
+        if search in self.added:
+            return self.added[search]
+        record = self.record(search)
+        if record is None:
+            return f"ID {search} not found."
+        page_content, metadata = json.loads(record)
+        return Document(id=search, page_content=page_content, metadata=metadata)
+
+    def add(self, texts):
+        """Add documents, keyed by id, on top of the saved ones."""
+        overlapping = {doc_id for doc_id in texts if doc_id in self.added or self._saved_position(doc_id) is not None}
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self.added.update(texts)
+        self.deleted.difference_update(texts)
+
+    def delete(self, ids):
+        """Delete documents by id."""
+        for doc_id in ids:
+            self.added.pop(doc_id, None)
+            self.deleted.add(doc_id)
@@ -0,0 +1,189 @@
+#=============================Persistent, content-addressed embedding cache================
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+from modules.metrics import add_collector, span
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite3"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# Keep IN (...) lists below SQLite's default host parameter limit
+_SQL_BATCH = 500
+
+
+def text_hash(text):
+    """Return the content hash used as the cache key for a chunk of text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk store of embedding vectors keyed by (embedding model, text hash).
+    Least recently used entries are evicted once max_entries is exceeded.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model, hashes):
+        """Return {text_hash: vector} for every hash already cached for this model."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(hashes), _SQL_BATCH):
+                batch = hashes[start:start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, key) for key in found],
+                )
+                self._conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, model, items):
+        """Store (text_hash, vector) pairs for this model, evicting the oldest entries if needed."""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(model, key, array("f", vector).tobytes(), now) for key, vector in items],
+            )
+            # Counted inside the write transaction: other processes sharing the
+            # file add and evict entries too, so a count kept here would drift
+            self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+            overflow = self._size - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self._size -= overflow
+                self.evictions += overflow
+            self._conn.commit()
+
+    def stats(self):
+        """Return hit/miss counters and the current number of cached vectors."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": self._size,
+            "max_entries": self.max_entries,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only sends text missing from the cache to the
+    underlying embedding model. Query embeddings are passed straight through.
+    """
+
+    def __init__(self, embeddings, cache, model_name):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name
+
+    def embed_documents(self, texts):
+        with span("embed", kind="documents") as embed_span:
+            hashes = [text_hash(text) for text in texts]
+            unique_hashes = list(dict.fromkeys(hashes))
+            vectors = self.cache.get_many(self.model_name, unique_hashes)
+
+            # Embed each missing text once, even if it appears several times
+            missing = {}
+            for key, text in zip(hashes, texts):
+                if key not in vectors and key not in missing:
+                    missing[key] = text
+
+            if missing:
+                new_vectors = self.embeddings.embed_documents(list(missing.values()))
+                new_items = list(zip(missing.keys(), new_vectors))
+                self.cache.put_many(self.model_name, new_items)
+                vectors.update(new_items)
+
+            embed_span.add(
+                texts=len(texts), cached=len(texts) - len(missing), embedded=len(missing),
+                chars=sum(len(text) for text in missing.values()),
+            )
+            return [list(vectors[key]) for key in hashes]
+
+    def embed_query(self, text):
+        with span("embed", kind="query") as embed_span:
+            embed_span.add(texts=1, chars=len(text))
+            return self.embeddings.embed_query(text)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def _cache_metrics():
+    if _default_cache is None:
+        return
+    stats = _default_cache.stats()
+    yield "cache_requests_total", {"cache": "embedding", "result": "hit"}, stats["hits"], "counter"
+    yield "cache_requests_total", {"cache": "embedding", "result": "miss"}, stats["misses"], "counter"
+    yield "cache_evictions_total", {"cache": "embedding"}, stats["evictions"], "counter"
+    yield "cache_entries", {"cache": "embedding"}, stats["entries"], "gauge"
+
+
+add_collector(_cache_metrics)
+
+
+def get_embedding_cache():
+    """Return the process-wide embedding cache, opening it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
@@ -0,0 +1,167 @@
+#=============================Concurrent, rate-limited embedding executor================
+
+import os
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+from modules.metrics import add_collector
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_MAX_WORKERS = int(os.getenv("EMBEDDING_MAX_WORKERS", "4"))
+EMBEDDING_REQUESTS_PER_SECOND = float(os.getenv("EMBEDDING_REQUESTS_PER_SECOND", "8"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` acquisitions per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _is_rate_limited(error):
+    """Return True for HTTP 429 errors raised by the embedding client."""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    return type(error).__name__ == "RateLimitError"
+
+
+def _is_transient(error):
+    """
+    Return True for errors a retry may get past: rate limits, request
+    timeouts, 5xx responses and dropped or timed-out connections, i.e. what
+    the OpenAI client retries itself when its max_retries is not 0.
+    """
+    if _is_rate_limited(error):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in (408, 409) or status_code >= 500
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "InternalServerError")
+
+
+def _retry_after(error):
+    """Return the server's Retry-After delay in seconds, if it sent one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ConcurrentEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that splits texts into fixed-size batches and embeds
+    them concurrently, with a token bucket capping requests per second and
+    exponential backoff on 429s and transient failures (5xx, timeouts,
+    dropped connections). At most max_workers requests are in flight across
+    every caller of one instance, however many threads embed through it at
+    once (ingestion jobs and queries share the process-wide instance).
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        max_workers=EMBEDDING_MAX_WORKERS,
+        requests_per_second=EMBEDDING_REQUESTS_PER_SECOND,
+        max_retries=EMBEDDING_MAX_RETRIES,
+        backoff_seconds=1.0,
+    ):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.rate_limiter = TokenBucket(requests_per_second, capacity=max_workers)
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self._in_flight = threading.BoundedSemaphore(max(max_workers, 1))
+        self._metrics_lock = threading.Lock()
+        _executors.add(self)
+
+    def _call_with_retries(self, func):
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._in_flight:
+                    self.rate_limiter.acquire()
+                    with self._metrics_lock:
+                        self.requests += 1
+                    return func()
+            except Exception as e:
+                if not _is_transient(e) or attempt == self.max_retries:
+                    with self._metrics_lock:
+                        self.failures += 1
+                    raise
+                with self._metrics_lock:
+                    self.retries += 1
+                # Back off without holding a request slot
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random())
+                time.sleep(delay)
+
+    def _embed_batch(self, batch):
+        return self._call_with_retries(lambda: self.embeddings.embed_documents(batch))
+
+    def embed_documents(self, texts):
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1 or self.max_workers <= 1:
+            results = [self._embed_batch(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+                results = list(pool.map(self._embed_batch, batches))
+        return [vector for vectors in results for vector in vectors]
+
+    def embed_query(self, text):
+        return self._call_with_retries(lambda: self.embeddings.embed_query(text))
+
+    def stats(self):
+        """Return the counts of requests sent, retried after a transient error and failed for good."""
+        with self._metrics_lock:
+            return {"requests": self.requests, "retries": self.retries, "failures": self.failures}
+
+
+# Live executors, reported by the metrics collector; their time is in the "embed" stage
+_executors = weakref.WeakSet()
+
+
+def _executor_metrics():
+    totals = {"requests": 0, "retries": 0, "failures": 0}
+    for executor in list(_executors):
+        for name, value in executor.stats().items():
+            totals[name] += value
+    yield "embedding_requests_total", {}, totals["requests"], "counter"
+    yield "embedding_retries_total", {}, totals["retries"], "counter"
+    yield "embedding_failures_total", {}, totals["failures"], "counter"
+
+
+add_collector(_executor_metrics)
@@ -0,0 +1,136 @@
+#=============================Content fingerprints of data files================
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from modules.metrics import add_collector
+
+FINGERPRINT_CACHE_PATH = os.getenv("FINGERPRINT_CACHE_PATH", os.path.join(".cache", "fingerprints.sqlite3"))
+FINGERPRINT_CACHE_MAX_ENTRIES = int(os.getenv("FINGERPRINT_CACHE_MAX_ENTRIES", "10000"))
+
+# Bytes read per hash update; the file is never held in memory whole
+HASH_BLOCK_SIZE = 1024 * 1024
+# Files modified more recently than this are hashed but not cached: on file
+# systems with coarse timestamps, a second write within the same tick would
+# leave size and mtime unchanged
+RECENT_WRITE_SECONDS = 2.0
+
+
+def hash_file(file_path, block_size=HASH_BLOCK_SIZE):
+    """Return the 64-bit BLAKE2b hex digest of a file's content, read block by block."""
+    digest = hashlib.blake2b(digest_size=8)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FingerprintCache:
+    """
+    Content hashes of files keyed by (absolute path, size, mtime), kept in a
+    SQLite table shared by every process and surviving restarts. A file whose
+    size and mtime have not changed since it was hashed is not read again;
+    any write to it changes its mtime and gets it re-hashed. The entries
+    hashed longest ago are dropped beyond max_entries.
+    """
+
+    def __init__(self, path=FINGERPRINT_CACHE_PATH, max_entries=FINGERPRINT_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " digest TEXT NOT NULL,"
+            " hashed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_hashed_at ON fingerprints (hashed_at)")
+        self._conn.commit()
+
+    def fingerprint(self, file_path, block_size=HASH_BLOCK_SIZE):
+        """Return the content hash of a file, hashing it only if it changed since last time."""
+        key = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest FROM fingerprints WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (key, stat.st_size, stat.st_mtime_ns),
+            ).fetchone()
+            if row is not None:
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+
+        digest = hash_file(file_path, block_size)
+        after = os.stat(file_path)
+        if (after.st_size, after.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            # Written to while being hashed; the next call hashes it again
+            return digest
+        if time.time() - stat.st_mtime < RECENT_WRITE_SECONDS:
+            return digest
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fingerprints (path, size, mtime_ns, digest, hashed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, stat.st_size, stat.st_mtime_ns, digest, time.time()),
+            )
+            # Counted inside the write transaction, as other processes add entries too
+            overflow = self._conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM fingerprints WHERE rowid IN "
+                    "(SELECT rowid FROM fingerprints ORDER BY hashed_at ASC LIMIT ?)",
+                    (overflow,),
+                )
+            self._conn.commit()
+        return digest
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+_fingerprints = None
+_fingerprints_lock = threading.Lock()
+
+
+def get_fingerprint_cache():
+    """Return the process-wide fingerprint cache, loaded on first use."""
+    global _fingerprints
+    with _fingerprints_lock:
+        if _fingerprints is None:
+            _fingerprints = FingerprintCache()
+        return _fingerprints
+
+
+def file_fingerprint(file_path):
+    """Return the content hash of a file, through the process-wide fingerprint cache."""
+    return get_fingerprint_cache().fingerprint(file_path)
+
+
+def _cache_metrics():
+    if _fingerprints is None:
+        return
+    stats = _fingerprints.stats()
+    yield "cache_requests_total", {"cache": "fingerprint", "result": "hit"}, stats["hits"], "counter"
+    yield "cache_requests_total", {"cache": "fingerprint", "result": "miss"}, stats["misses"], "counter"
+    yield "cache_entries", {"cache": "fingerprint"}, stats["entries"], "gauge"
+
+
+add_collector(_cache_metrics)
@@ -0,0 +1,98 @@
+#=============================Streaming file ingestion================
+
+import logging
+import os
+from collections import Counter
+
+from modules.data_loader import INGEST_BATCH_SIZE, iter_excel_batches
+from modules.data_processing import iter_documents
+from modules.metrics import span
+from modules.summaries import SummaryAccumulator
+from modules.vectorstore_handler import (
+    EmbeddingMismatchError, dataset_namespace, latest_namespace, load_vectorstore, sync_vectorstore,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def iter_document_batches(file_path, batch_size=INGEST_BATCH_SIZE, progress=None):
+    """
+    Read a file in row batches and yield the Documents built from each batch,
+    followed by one batch of per-entity summary documents over all rows.
+    `progress`, if given, is called as progress(rows=..., batches=...) with
+    running totals each time the consumer asks for the next batch, i.e. once
+    it has embedded and inserted the previous one.
+    """
+    seen = Counter()
+    summaries = SummaryAccumulator()
+    rows = batches = 0
+    for df in iter_excel_batches(file_path, batch_size):
+        if not df.empty:
+            with span("documents") as documents_span:
+                summaries.add(df)
+                documents = list(iter_documents(df, seen))
+                documents_span.add(rows=len(df), documents=len(documents))
+            yield documents
+            rows += len(df)
+            batches += 1
+            if progress is not None:
+                progress(rows=rows, batches=batches)
+
+    with span("documents", kind="summaries") as documents_span:
+        summary_documents = summaries.documents()
+        documents_span.add(documents=len(summary_documents))
+    if summary_documents:
+        yield summary_documents
+
+
+def load_compatible_vectorstore(namespace):
+    """
+    Load a namespace's vectorstore. Returns (vectorstore, mismatch): the
+    vectorstore is None if there is none or it was built with other
+    embeddings than the configured ones, so it gets rebuilt, and mismatch
+    then says why, for showing to the user; it is None otherwise.
+    """
+    try:
+        return load_vectorstore(namespace), None
+    except EmbeddingMismatchError as e:
+        logger.warning("Not reusing index: %s", e)
+        return None, str(e)
+
+
+def ingest_file(file_path, namespace=None, batch_size=INGEST_BATCH_SIZE, profile=None, progress=None):
+    """
+    Stream a CSV/Excel file into its dataset's vectorstore batch by batch, so
+    the raw rows, their Documents and their embeddings are only ever held for
+    one batch at a time. A file not indexed before starts from the index of
+    the last version of the same file name, so only changed rows are embedded.
+    `profile` picks the index layout (see modules.ann_index). An index built
+    with other embeddings than the configured ones is not reused; the file is
+    re-embedded in full and replaces it, and the change counts say why under
+    "embedding_mismatch". `progress` is passed on to iter_document_batches.
+    Returns the vectorstore and the row change counts.
+    """
+    namespace = namespace or dataset_namespace(file_path)
+    source = os.path.basename(file_path)
+
+    base_namespace = namespace
+    vectorstore, mismatch = load_compatible_vectorstore(namespace)
+    if vectorstore is None:
+        base_namespace = latest_namespace(source)
+        if base_namespace not in (None, namespace):
+            vectorstore, base_mismatch = load_compatible_vectorstore(base_namespace)
+            mismatch = mismatch or base_mismatch
+        if vectorstore is None:
+            base_namespace = namespace
+
+    with span("index", mode="sync") as index_span:
+        vectorstore, changes = sync_vectorstore(
+            vectorstore,
+            iter_document_batches(file_path, batch_size, progress),
+            namespace,
+            base_namespace=base_namespace,
+            source=source,
+            profile=profile,
+        )
+        index_span.add(rows_added=changes["added"], rows_removed=changes["removed"])
+    changes["embedding_mismatch"] = mismatch
+    return vectorstore, changes
@@ -0,0 +1,137 @@
+#=============================Background ingestion jobs================
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.ingestion import ingest_file
+from modules.metrics import add_collector
+
+# Files indexed at once; each job streams its file batch by batch, so this
+# bounds memory as well as embedding API load
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Finished jobs kept in the job table, for sessions that have not polled them yet
+FINISHED_JOBS_KEPT = 100
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+
+class IngestionJob:
+    """One file being indexed in the background, with its progress and outcome."""
+
+    def __init__(self, namespace, file_path, profile=None):
+        self.namespace = namespace
+        self.file_path = file_path
+        self.profile = profile
+        self.status = "queued"
+        self.rows = 0
+        self.batches = 0
+        self.changes = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def update(self, **progress):
+        """Record progress, e.g. update(rows=10000, batches=2)."""
+        with self._lock:
+            for name, value in progress.items():
+                setattr(self, name, value)
+
+    def snapshot(self):
+        """Return the job's state as a dict, consistent across fields."""
+        with self._lock:
+            end = self.finished or time.time()
+            return {
+                "namespace": self.namespace,
+                "file_path": self.file_path,
+                "status": self.status,
+                "rows": self.rows,
+                "batches": self.batches,
+                "changes": self.changes,
+                "error": self.error,
+                "seconds": end - self.started if self.started else 0.0,
+            }
+
+
+class IngestionWorkers:
+    """
+    Thread pool that indexes data files in the background, with a job table
+    keyed by dataset namespace (the file's content hash). Submitting a file
+    whose namespace already has a job returns that job instead of starting
+    another, so sessions selecting the same file share one ingestion; a
+    failed job is only run again when retried explicitly. Jobs write to their
+    own namespace, so indexes already loaded keep serving until they finish.
+    """
+
+    def __init__(self, max_workers=INGEST_WORKERS, finished_kept=FINISHED_JOBS_KEPT):
+        self.finished_kept = finished_kept
+        self.jobs = OrderedDict()  # namespace -> IngestionJob, oldest first
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._lock = threading.Lock()
+
+    def submit(self, file_path, namespace, profile=None, retry=False):
+        """Return the job indexing a file into a namespace, starting one if there is none to share."""
+        with self._lock:
+            job = self.jobs.get(namespace)
+            if job is not None and (job.status in ("queued", "running") or (job.status == "failed" and not retry)):
+                return job
+            job = IngestionJob(namespace, file_path, profile)
+            self.jobs.pop(namespace, None)
+            self.jobs[namespace] = job
+            self._forget_finished()
+        self._pool.submit(self._run, job)
+        return job
+
+    def get(self, namespace):
+        """Return the latest job for a namespace, or None."""
+        with self._lock:
+            return self.jobs.get(namespace)
+
+    def counts(self):
+        """Return the number of jobs in the table per status."""
+        with self._lock:
+            jobs = list(self.jobs.values())
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        for job in jobs:
+            counts[job.status] += 1
+        return counts
+
+    def _forget_finished(self):
+        finished = [namespace for namespace, job in self.jobs.items() if job.status in ("done", "failed")]
+        for namespace in finished[:max(0, len(finished) - self.finished_kept)]:
+            del self.jobs[namespace]
+
+    def _run(self, job):
+        job.update(status="running", started=time.time())
+        try:
+            _, changes = ingest_file(job.file_path, job.namespace, profile=job.profile, progress=job.update)
+            job.update(status="done", changes=changes, finished=time.time())
+        except Exception as e:
+            job.update(status="failed", error=str(e), finished=time.time())
+
+
+_workers = None
+_workers_lock = threading.Lock()
+
+
+def get_ingestion_workers():
+    """Return the process-wide ingestion worker pool, created on first use."""
+    global _workers
+    with _workers_lock:
+        if _workers is None:
+            _workers = IngestionWorkers()
+        return _workers
+
+
+def _job_metrics():
+    if _workers is None:
+        return
+    for status, count in _workers.counts().items():
+        yield "ingest_jobs", {"status": status}, count, "gauge"
+
+
+add_collector(_job_metrics)
@@ -0,0 +1,169 @@
+#=============================BM25 inverted index over document text================
+
+import json
+import math
+import os
+import threading
+from collections import Counter, defaultdict
+
+from modules.query_parsing import normalize_text
+
+LEXICAL_INDEX_FILENAME = "lexical_index.json"
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text):
+    """
+    Return the searchable terms of a document or query. For "column: value"
+    lines only the value is indexed, since every row repeats the same column
+    names; one- and two-digit numbers (the ratings) are skipped for the same reason.
+    """
+    terms = []
+    for line in str(text).split("\n"):
+        _, sep, value = line.partition(": ")
+        for term in normalize_text(value if sep else line).split():
+            if term.isdigit() and len(term) < 3:
+                continue
+            terms.append(term)
+    return terms
+
+
+class LexicalIndex:
+    """
+    In-memory BM25 index keyed by vectorstore document id. The forward index
+    (doc id -> terms) is what gets persisted; postings are derived from it.
+    """
+
+    def __init__(self, doc_terms=None):
+        self.doc_terms = {}
+        self.postings = defaultdict(dict)
+        self.total_length = 0
+        for doc_id, terms in (doc_terms or {}).items():
+            self._add(doc_id, terms)
+
+    def _add(self, doc_id, terms):
+        if doc_id in self.doc_terms:
+            self._remove(doc_id)
+        self.doc_terms[doc_id] = terms
+        self.total_length += len(terms)
+        for term, count in Counter(terms).items():
+            self.postings[term][doc_id] = count
+
+    def _remove(self, doc_id):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self.total_length -= len(terms)
+        for term in set(terms):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+
+    def add_documents(self, ids, texts):
+        """Index texts under the given document ids."""
+        for doc_id, text in zip(ids, texts):
+            self._add(doc_id, tokenize(text))
+
+    def delete(self, ids):
+        """Remove documents from the index."""
+        for doc_id in ids:
+            self._remove(doc_id)
+
+    def covers(self, query):
+        """Return True if every term of the query occurs somewhere in the index."""
+        terms = tokenize(query)
+        return bool(terms) and all(term in self.postings for term in terms)
+
+    def search(self, query, k=20, where=None):
+        """
+        Return up to k (doc id, BM25 score) pairs, best first. `where`, if
+        given, is a predicate on doc ids restricting which documents are scored.
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.doc_terms:
+            return []
+
+        total_docs = len(self.doc_terms)
+        average_length = self.total_length / total_docs
+        scores = Counter()
+        for term in terms:
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (total_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, count in docs.items():
+                if where is not None and not where(doc_id):
+                    continue
+                length = len(self.doc_terms[doc_id])
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                scores[doc_id] += idf * count * (BM25_K1 + 1) / (count + norm)
+        return scores.most_common(k)
+
+    def save(self, directory):
+        """Write the forward index next to the vectorstore files."""
+        path = os.path.join(directory, LEXICAL_INDEX_FILENAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.doc_terms, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory):
+        """Read a saved index, or return None if the directory has none."""
+        path = os.path.join(directory, LEXICAL_INDEX_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def from_vectorstore(cls, vs):
+        """Build an index from every document already in a FAISS vectorstore."""
+        index = cls()
+        for doc_id in vs.index_to_docstore_id.values():
+            index._add(doc_id, tokenize(vs.docstore.search(doc_id).page_content))
+        return index
+
+
+# Process-wide cache of loaded indexes: directory -> (mtime, index)
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def get_lexical_index(directory):
+    """
+    Return the saved lexical index for a vectorstore directory, loading it on
+    first use and again only when the file changes. Returns None if there is none.
+    """
+    path = os.path.join(directory, LEXICAL_INDEX_FILENAME)
+    if not os.path.exists(path):
+        return None
+    mtime = os.stat(path).st_mtime_ns
+    key = os.path.abspath(directory)
+
+    with _loaded_lock:
+        cached = _loaded.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    index = LexicalIndex.load(directory)
+    with _loaded_lock:
+        _loaded[key] = (mtime, index)
+    return index
+
+
+def set_lexical_index(directory, index):
+    """Make a just-saved index the cached one for its directory."""
+    path = os.path.join(directory, LEXICAL_INDEX_FILENAME)
+    with _loaded_lock:
+        _loaded[os.path.abspath(directory)] = (os.stat(path).st_mtime_ns, index)
+
+
+def forget_lexical_index(directory):
+    """Drop a directory's index from the cache, e.g. when its vectorstore is evicted."""
+    with _loaded_lock:
+        _loaded.pop(os.path.abspath(directory), None)
@@ -0,0 +1,66 @@
+#=============================Local CPU embeddings, no model or network================
+
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from modules.lexical_index import tokenize
+
+# Bump when the features or weighting change: vectors from different
+# versions are not comparable, and the version is part of the model name
+HASHING_EMBEDDING_VERSION = 1
+
+# Distinct terms whose slots are remembered; ingest vocabularies are far smaller
+TERM_SLOT_CACHE_SIZE = 1 << 18
+
+
+@lru_cache(maxsize=TERM_SLOT_CACHE_SIZE)
+def _term_slot(term, dimension):
+    """Return the vector position and sign a term is hashed to."""
+    code = int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+    return code % dimension, 1.0 if (code >> 63) & 1 else -1.0
+
+
+def _features(text):
+    """Return a text's terms (as the BM25 index sees them) and its pairs of adjacent terms."""
+    terms = tokenize(text)
+    return terms + [f"{first} {second}" for first, second in zip(terms, terms[1:])]
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Embeddings computed locally from the words of a text: every term and pair
+    of adjacent terms is hashed to a signed position in a fixed-size vector,
+    counts are damped with log1p and each vector is L2-normalized. Texts that
+    share names and words score close, which covers most lookups on feedback
+    rows, but paraphrases with no words in common do not match as they would
+    with a trained model. Needs no API key, and a query embeds in microseconds.
+    """
+
+    def __init__(self, dimension):
+        self.dimension = dimension
+        self.model = f"hashing-v{HASHING_EMBEDDING_VERSION}-{dimension}"
+
+    def embed_array(self, texts):
+        """Embed texts into a float32 array of shape (len(texts), dimension)."""
+        rows, slots, signs = [], [], []
+        for row, text in enumerate(texts):
+            for feature in _features(text):
+                slot, sign = _term_slot(feature, self.dimension)
+                rows.append(row)
+                slots.append(slot)
+                signs.append(sign)
+
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        np.add.at(vectors, (np.asarray(rows, dtype=np.intp), np.asarray(slots, dtype=np.intp)), np.asarray(signs, dtype=np.float32))
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+    def embed_documents(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text):
+        return self.embed_array([text])[0].tolist()
@@ -0,0 +1,284 @@
+#=============================Per-stage timings and counters================
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Off by default; when off, span() returns a shared no-op and nothing is recorded
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+# Prometheus text snapshot, rewritten every flush interval (e.g. for node_exporter's textfile collector)
+METRICS_FILE = os.getenv("METRICS_FILE", os.path.join("metrics", "metrics.prom"))
+METRICS_FLUSH_INTERVAL_SECONDS = float(os.getenv("METRICS_FLUSH_INTERVAL_SECONDS", "15"))
+# Serve the same text at http://<host>:<port>/metrics; 0 serves nothing
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+METRICS_PREFIX = "lecturer_support"
+
+# Pipeline stages. "index" covers a whole index build or update, including
+# the "embed" time of its documents; "generate" is the LLM call alone, and
+# "first_token" the part of it before the first streamed token
+STAGES = ("load", "documents", "embed", "index", "retrieve", "generate")
+
+# Upper bounds in seconds of the duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Spans kept for the admin page's recent percentiles and trace list
+RECENT_SPANS = 500
+
+logger = logging.getLogger(__name__)
+
+
+def _labels(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escape = lambda value: value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """
+    Process-wide store of stage durations (as Prometheus histograms), item
+    counters such as documents, characters and tokens, and the most recent
+    spans. Collectors registered with add_collector report values that other
+    modules already keep, like cache hit counts, and are only called when
+    the metrics are rendered.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS, recent=RECENT_SPANS):
+        self.buckets = buckets
+        self.durations = {}  # (stage, labels) -> [bucket counts, count, sum]
+        self.counters = {}  # (name, labels) -> value
+        self.recent = deque(maxlen=recent)
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, labels=(), sizes=None):
+        """Record one run of a stage and the sizes of what it handled."""
+        key = (stage, labels)
+        with self._lock:
+            entry = self.durations.get(key)
+            if entry is None:
+                entry = self.durations[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    entry[0][i] += 1
+            entry[1] += 1
+            entry[2] += seconds
+            for item, amount in (sizes or {}).items():
+                counter = ("stage_items_total", (("item", item), ("stage", stage)) + labels)
+                self.counters[counter] = self.counters.get(counter, 0) + amount
+            self.recent.append({
+                "time": time.time(), "stage": stage, "labels": dict(labels), "seconds": seconds, "sizes": sizes or {},
+            })
+
+    def add_collector(self, collector):
+        """
+        Register collector() -> iterable of (name, labels dict, value, type),
+        where type is "counter" or "gauge", to be read at render time.
+        """
+        self.collectors.append(collector)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            durations = {key: (list(buckets), count, total) for key, (buckets, count, total) in self.durations.items()}
+            counters = dict(self.counters)
+
+        name = f"{METRICS_PREFIX}_stage_duration_seconds"
+        lines += [f"# HELP {name} Time spent in each pipeline stage.", f"# TYPE {name} histogram"]
+        for (stage, labels), (buckets, count, total) in sorted(durations.items()):
+            labels = (("stage", stage),) + labels
+            for bound, bucket_count in zip(self.buckets, buckets):
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        # Samples grouped by metric name, since several collectors report the
+        # same metric (e.g. cache_requests_total) and the text format wants
+        # each metric's samples in one block after its TYPE line
+        families = {}  # name -> (type, sample lines)
+        for (counter, labels), value in sorted(counters.items()):
+            name = f"{METRICS_PREFIX}_{counter}"
+            families.setdefault(name, ("counter", []))[1].append(f"{name}{_format_labels(labels)} {value}")
+        for collector in self.collectors:
+            for counter, labels, value, kind in collector():
+                name = f"{METRICS_PREFIX}_{counter}"
+                families.setdefault(name, (kind, []))[1].append(f"{name}{_format_labels(_labels(labels))} {value}")
+
+        for name, (kind, samples) in families.items():
+            lines.append(f"# TYPE {name} {kind}")
+            lines += samples
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=METRICS_FILE):
+        """Write the rendered metrics to a file, replacing it in one step."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + ".tmp", 'w') as f:
+            f.write(self.render())
+        os.replace(path + ".tmp", path)
+
+    def recent_spans(self, limit=None):
+        """Return the most recent spans, oldest first."""
+        with self._lock:
+            spans = list(self.recent)
+        return spans[-limit:] if limit else spans
+
+    def stage_summary(self):
+        """Return per-stage run counts and total seconds, and p50/p99 over the recent spans."""
+        with self._lock:
+            durations = dict(self.durations)
+        recent = self.recent_spans()
+        summary = {}
+        for (stage, _), (_, count, total) in durations.items():
+            entry = summary.setdefault(stage, {"runs": 0, "total_seconds": 0.0})
+            entry["runs"] += count
+            entry["total_seconds"] += total
+        for stage, entry in summary.items():
+            times = sorted(span["seconds"] for span in recent if span["stage"] == stage)
+            entry["mean_seconds"] = entry["total_seconds"] / entry["runs"]
+            entry["recent_p50_seconds"] = times[len(times) // 2] if times else None
+            entry["recent_p99_seconds"] = times[min(len(times) - 1, int(len(times) * 0.99))] if times else None
+        return summary
+
+
+_registry = MetricsRegistry()
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return the process-wide metrics registry."""
+    return _registry
+
+
+def add_collector(collector):
+    """Register a collector with the process-wide registry (see MetricsRegistry.add_collector)."""
+    _registry.add_collector(collector)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = _registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL_SECONDS)
+        try:
+            _registry.write()
+        except OSError as e:
+            logger.warning("Could not write metrics file: %s", e)
+
+
+def _start_exporters():
+    """Start the metrics file writer and, if METRICS_PORT is set, the HTTP endpoint, once per process."""
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+    if METRICS_FILE:
+        threading.Thread(target=_flush_periodically, name="metrics-file", daemon=True).start()
+    if METRICS_PORT:
+        try:
+            server = ThreadingHTTPServer(("", METRICS_PORT), _MetricsHandler)
+        except OSError as e:
+            # Another server process on this machine already serves the port
+            logger.warning("Metrics endpoint not started on port %s: %s", METRICS_PORT, e)
+            return
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+
+
+class Span:
+    """Times one run of a stage; sizes added with add() are recorded with it."""
+
+    __slots__ = ("stage", "labels", "sizes", "start")
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+        self.sizes = {}
+
+    def add(self, **sizes):
+        """Count items handled in this run, e.g. add(documents=10, chars=4000)."""
+        for item, amount in sizes.items():
+            self.sizes[item] = self.sizes.get(item, 0) + amount
+
+    def label(self, **labels):
+        """Set labels only known once the stage has run, e.g. whether it hit a cache."""
+        self.labels = _labels({**dict(self.labels), **labels})
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.label(error=exc_type.__name__)
+        _registry.observe(self.stage, time.perf_counter() - self.start, self.labels, self.sizes)
+        return False
+
+
+class _NoopSpan:
+    """Stands in for Span when metrics are off."""
+
+    __slots__ = ()
+
+    def add(self, **sizes):
+        pass
+
+    def label(self, **labels):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(stage, **labels):
+    """
+    Return a context manager timing one run of a pipeline stage:
+
+        with span("retrieve") as s:
+            documents = ...
+            s.add(documents=len(documents))
+
+    Returns a shared no-op object when METRICS_ENABLED is off.
+    """
+    if not METRICS_ENABLED:
+        return _NOOP_SPAN
+    _start_exporters()
+    return Span(stage, _labels(labels))
+
+
+def record(stage, seconds, sizes=None, **labels):
+    """Record a stage run timed elsewhere, e.g. by a callback; does nothing when METRICS_ENABLED is off."""
+    if METRICS_ENABLED:
+        _start_exporters()
+        _registry.observe(stage, seconds, _labels(labels), sizes)
@@ -0,0 +1,163 @@
+#=============================Partition index over categorical metadata================
+
+import json
+import os
+import threading
+from collections import defaultdict
+
+from modules.data_processing import CATEGORICAL_COLUMNS
+from modules.query_parsing import build_value_index
+
+PARTITION_INDEX_FILENAME = "partitions.json"
+
+
+def partition_keys(doc):
+    """
+    Return the "column=value" partition keys of a document. Feedback rows are
+    keyed by their categorical metadata; summary documents by the entity they
+    summarize. Rows indexed before metadata was stored fall back to their text.
+    """
+    metadata = doc.metadata or {}
+    if "entity_column" in metadata:
+        return [f"{metadata['entity_column']}={metadata['entity']}"]
+
+    keys = [f"{col}={metadata[col]}" for col in CATEGORICAL_COLUMNS if col in metadata]
+    if keys:
+        return keys
+
+    for line in doc.page_content.split("\n"):
+        column, sep, value = line.partition(": ")
+        if sep and column.strip() in CATEGORICAL_COLUMNS:
+            keys.append(f"{column.strip()}={value.strip()}")
+    return keys
+
+
+class PartitionIndex:
+    """
+    Maps "column=value" keys to the ids of the documents in that partition,
+    so a search can be restricted to e.g. Department=Data Science, Year=2009.
+    The forward map (doc id -> keys) is persisted; partitions are derived from it.
+    """
+
+    def __init__(self, doc_keys=None):
+        self.doc_keys = {}
+        self.partitions = defaultdict(set)
+        self._value_index = None
+        for doc_id, keys in (doc_keys or {}).items():
+            self._add(doc_id, keys)
+
+    def _add(self, doc_id, keys):
+        if doc_id in self.doc_keys:
+            self._remove(doc_id)
+        self.doc_keys[doc_id] = keys
+        for key in keys:
+            self.partitions[key].add(doc_id)
+        self._value_index = None
+
+    def _remove(self, doc_id):
+        for key in self.doc_keys.pop(doc_id, []):
+            members = self.partitions.get(key)
+            if members is not None:
+                members.discard(doc_id)
+                if not members:
+                    del self.partitions[key]
+        self._value_index = None
+
+    def add_documents(self, ids, documents):
+        """Record the partitions of newly indexed documents."""
+        for doc_id, doc in zip(ids, documents):
+            self._add(doc_id, partition_keys(doc))
+
+    def delete(self, ids):
+        """Forget deleted documents."""
+        for doc_id in ids:
+            self._remove(doc_id)
+
+    @property
+    def value_index(self):
+        """Lookup of the known partition values, for detecting filters in a question."""
+        if self._value_index is None:
+            values = defaultdict(set)
+            for key in self.partitions:
+                column, _, value = key.partition("=")
+                values[column].add(value)
+            self._value_index = build_value_index(values)
+        return self._value_index
+
+    def lookup(self, filters):
+        """
+        Return the ids of documents matching every filtered column, where a
+        column matches any of its listed values. Returns None without filters.
+        """
+        matched = None
+        for column, values in filters.items():
+            ids = set()
+            for value in values:
+                ids |= self.partitions.get(f"{column}={value}", set())
+            matched = ids if matched is None else matched & ids
+        return matched
+
+    def save(self, directory):
+        """Write the forward map next to the vectorstore files."""
+        path = os.path.join(directory, PARTITION_INDEX_FILENAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.doc_keys, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory):
+        """Read a saved partition index, or return None if the directory has none."""
+        path = os.path.join(directory, PARTITION_INDEX_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def from_vectorstore(cls, vs):
+        """Build a partition index from every document already in a FAISS vectorstore."""
+        index = cls()
+        for doc_id in vs.index_to_docstore_id.values():
+            index._add(doc_id, partition_keys(vs.docstore.search(doc_id)))
+        return index
+
+
+# Process-wide cache of loaded indexes: directory -> (mtime, index)
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def get_partition_index(directory):
+    """
+    Return the saved partition index for a vectorstore directory, loading it on
+    first use and again only when the file changes. Returns None if there is none.
+    """
+    path = os.path.join(directory, PARTITION_INDEX_FILENAME)
+    if not os.path.exists(path):
+        return None
+    mtime = os.stat(path).st_mtime_ns
+    key = os.path.abspath(directory)
+
+    with _loaded_lock:
+        cached = _loaded.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    index = PartitionIndex.load(directory)
+    with _loaded_lock:
+        _loaded[key] = (mtime, index)
+    return index
+
+
+def set_partition_index(directory, index):
+    """Make a just-saved index the cached one for its directory."""
+    path = os.path.join(directory, PARTITION_INDEX_FILENAME)
+    with _loaded_lock:
+        _loaded[os.path.abspath(directory)] = (os.stat(path).st_mtime_ns, index)
+
+
+def forget_partition_index(directory):
+    """Drop a directory's index from the cache, e.g. when its vectorstore is evicted."""
+    with _loaded_lock:
+        _loaded.pop(os.path.abspath(directory), None)
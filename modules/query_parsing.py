@@ -0,0 +1,66 @@
+#=============================Detect dataset entities mentioned in a question================
+
+import re
+
+# Honorifics that users often leave out when naming a lecturer
+TITLES = ("mr", "mrs", "ms", "miss", "dr", "prof", "professor")
+
+# Longest entity name, in words, that find_entities looks for
+MAX_ENTITY_WORDS = 6
+
+
+def normalize_text(text):
+    """Lowercase text and collapse punctuation and whitespace to single spaces."""
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", str(text).lower()).split())
+
+
+def _variants(value):
+    """Return the normalized spellings a question may use for a value."""
+    normalized = normalize_text(value)
+    variants = {normalized}
+    words = normalized.split()
+    if len(words) > 1 and words[0] in TITLES:
+        variants.add(" ".join(words[1:]))
+    return {variant for variant in variants if variant}
+
+
+def build_value_index(values_by_column):
+    """
+    Build a lookup of normalized spelling -> (column, original value) from
+    {column: iterable of values}. Spellings shared by several values are dropped
+    so only unambiguous mentions are matched.
+    """
+    index = {}
+    ambiguous = set()
+    for column, values in values_by_column.items():
+        for value in values:
+            for variant in _variants(value):
+                if variant in index and index[variant] != (column, value):
+                    ambiguous.add(variant)
+                index[variant] = (column, value)
+    for variant in ambiguous:
+        del index[variant]
+    return index
+
+
+def find_entities(question, value_index):
+    """
+    Return {column: [values]} for every known value mentioned in the question.
+    Phrases are looked up by n-gram, longest first, and matched words are
+    consumed so "Data Science" is not also read as the faculty "Science".
+    """
+    words = normalize_text(question).split()
+    consumed = [False] * len(words)
+    found = {}
+    for size in range(min(MAX_ENTITY_WORDS, len(words)), 0, -1):
+        for start in range(len(words) - size + 1):
+            if any(consumed[start:start + size]):
+                continue
+            match = value_index.get(" ".join(words[start:start + size]))
+            if match is None:
+                continue
+            column, value = match
+            if value not in found.setdefault(column, []):
+                found[column].append(value)
+            consumed[start:start + size] = [True] * size
+    return found
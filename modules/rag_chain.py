@@ -1,13 +1,233 @@
 #================================Handle retrieval and generation chain================================
 
-
+import threading
+import time
+from collections import OrderedDict
 
 from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_groq import ChatGroq
+from modules.lexical_index import get_lexical_index
+from modules.metrics import METRICS_ENABLED, record
+from modules.partition_index import get_partition_index
+from modules.retrievers import HybridRetriever
+from modules.vectorstore_handler import add_eviction_listener, vectorstore_directory
+
+DEFAULT_MODEL = "llama-3.1-8b-instant"
+DEFAULT_K = 3
+SUMMARY_K = 1
+MAX_CACHED_CHAINS = 16
+
+# System prompt for the LLM
+SYSTEM_PROMPT = (
+    "You are an expert data analyst capable of analyzing Excel spreadsheets and providing comprehensive insights. "
+    "When given data, you should: "
+    
+    "ANALYSIS CAPABILITIES: "
+    "Data Processing - Parse and understand tabular data structures, identify data types (numerical, categorical, temporal), "
+    "handle missing values and data quality issues, perform statistical calculations (mean, median, mode, standard deviation, correlations). "
+    
+    "Comparative Analysis - Compare performance across different categories, time periods, or groups, "
+    "identify trends, patterns, and outliers, perform ranking and benchmarking analysis, "
+    "calculate percentage changes and growth rates. "
+    
+    "Visualization & Charts - Create appropriate charts based on data type (bar charts, line graphs, scatter plots, pie charts, histograms), "
+    "generate comparative visualizations (side-by-side comparisons, trend analysis), "
+    "use proper labeling, legends, and formatting, choose colors and styles that enhance data interpretation. "
+    
+    "Insights & Recommendations - Provide clear, actionable insights based on the analysis, "
+    "highlight key findings and notable patterns, suggest areas for improvement or further investigation, "
+    "present findings in business-friendly language. "
+    
+    "RESPONSE FORMAT: "
+    "1. Data Overview - Briefly describe the dataset structure and key variables. "
+    "2. Key Findings - Present 3-5 main insights with supporting data. "
+    "3. Visualizations - Create relevant charts to illustrate findings. "
+    "4. Recommendations - Provide actionable suggestions based on analysis. "
+    "5. Technical Details - Include statistical measures when relevant. "
+    
+    "INSTRUCTIONS: "
+    "Use the provided data context to perform analysis. Create interactive visualizations when possible. "
+    "Keep explanations clear and concise (aim for 2-3 sentences per insight). "
+    "When asked to compare entities, first check if both exist in the dataset. "
+    "If one entity is missing, provide analysis for the available entity and suggest what data would be needed for comparison. "
+    "If both entities exist, perform detailed comparative analysis with specific metrics and percentages. "
+    "Always work with the available data and provide meaningful insights even with limited information. "
+    "Focus on practical, actionable insights rather than just describing numbers. "
+    "When comparing categories, always provide context and percentage differences. "
+    "Do not generate inaccurate answers. "
+    "Context entries that start with 'Summary for' are precomputed statistics over every feedback row for that "
+    "lecturer, department, faculty or year; prefer them over individual rows for overview questions. "
+    
+    "Context: {context}"
+)
+
+# Construct prompt template once; it is immutable and shared by every chain
+PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", SYSTEM_PROMPT),
+        ("human", "{input}"),
+    ]
+)
+
+# Prompt for wording results that were computed exactly with pandas
+AGGREGATE_SYSTEM_PROMPT = (
+    "You are an expert data analyst explaining the result of a query over a student feedback dataset. "
+    "The table below was computed exactly over every matching row, so treat its numbers as correct and complete. "
+    "Answer the question using only these numbers: do not recompute, estimate or invent values. "
+    "Highlight the key comparisons, give percentage differences where useful and keep the answer concise. "
+    "The Responses column is the number of feedback rows behind each figure. "
+
+    "Query: {query} "
+    "Result table: {table}"
+)
 
-def create_qa_chain(vectorstore):
+AGGREGATE_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", AGGREGATE_SYSTEM_PROMPT),
+        ("human", "{input}"),
+    ]
+)
+
+class GenerationMetrics(BaseCallbackHandler):
+    """
+    Records each LLM call as a "generate" stage run: its duration, time to
+    first token when streaming, prompt and answer sizes in characters and,
+    when the provider reports them, tokens.
+    """
+
+    def __init__(self):
+        self._runs = {}  # run id -> [start, first token time, prompt chars]
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        chars = sum(len(str(message.content)) for batch in messages for message in batch)
+        with self._lock:
+            self._runs[run_id] = [time.perf_counter(), None, chars]
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is not None and run[1] is None:
+                run[1] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        start, first_token, prompt_chars = run
+        sizes = {
+            "prompt_chars": prompt_chars,
+            "answer_chars": sum(len(generation.text) for generations in response.generations for generation in generations),
+        }
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                for item, key in (("prompt_tokens", "input_tokens"), ("answer_tokens", "output_tokens")):
+                    if usage.get(key):
+                        sizes[item] = sizes.get(item, 0) + usage[key]
+        record("generate", time.perf_counter() - start, sizes)
+        if first_token is not None:
+            record("first_token", first_token - start)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is not None:
+            record("generate", time.perf_counter() - run[0], error=type(error).__name__)
+
+
+_llms = {}
+_chains = OrderedDict()
+_aggregate_chains = {}
+_registry_lock = threading.Lock()
+
+
+def get_llm(model=DEFAULT_MODEL):
+    """
+    Return the shared ChatGroq client for a model. Reusing one client keeps
+    its pooled HTTP connections alive across questions.
+    """
+    with _registry_lock:
+        if model not in _llms:
+            callbacks = [GenerationMetrics()] if METRICS_ENABLED else None
+            _llms[model] = ChatGroq(model=model, temperature=0, callbacks=callbacks)
+        return _llms[model]
+
+
+def get_qa_chain(vectorstore, model=DEFAULT_MODEL, k=DEFAULT_K):
+    """
+    Return the QA chain for (vectorstore, model, k), building it only the first
+    time. Chains are kept in a small LRU keyed by the vectorstore's identity,
+    so a rebuilt or reloaded index gets a fresh chain automatically.
+    """
+    key = (id(vectorstore), model, k)
+    with _registry_lock:
+        entry = _chains.get(key)
+        if entry is not None and entry[0] is vectorstore:
+            _chains.move_to_end(key)
+            return entry[1]
+
+    chain = create_qa_chain(vectorstore, model=model, k=k)
+
+    with _registry_lock:
+        _chains[key] = (vectorstore, chain)
+        _chains.move_to_end(key)
+        while len(_chains) > MAX_CACHED_CHAINS:
+            _chains.popitem(last=False)
+    return chain
+
+
+def get_aggregate_chain(model=DEFAULT_MODEL):
+    """
+    Return the chain that words a precomputed result table. It expects
+    "input" (the question), "query" (a description) and "table" (markdown).
+    """
+    llm = get_llm(model)
+    with _registry_lock:
+        if model not in _aggregate_chains:
+            _aggregate_chains[model] = AGGREGATE_PROMPT | llm | StrOutputParser()
+        return _aggregate_chains[model]
+
+
+def invalidate_qa_chains(vectorstore=None):
+    """Drop cached chains for one vectorstore, or all of them."""
+    with _registry_lock:
+        for key in list(_chains):
+            if vectorstore is None or _chains[key][0] is vectorstore:
+                del _chains[key]
+
+
+def stream_answer(chain, inputs, timings=None):
+    """
+    Yield the answer of a QA or aggregate chain piece by piece as the LLM
+    generates it. If a timings dict is given, it receives the seconds to the
+    first answer token ("ttft") and to the end of the answer ("total").
+    """
+    start = time.perf_counter()
+    if timings is not None:
+        timings["ttft"] = None
+    for chunk in chain.stream(inputs):
+        # Retrieval chains stream dicts; only their "answer" pieces are text
+        text = chunk.get("answer") if isinstance(chunk, dict) else chunk
+        if not text:
+            continue
+        if timings is not None and timings["ttft"] is None:
+            timings["ttft"] = time.perf_counter() - start
+        yield text
+    if timings is not None:
+        timings["total"] = time.perf_counter() - start
+
+
+# Chains hold their vectorstore, so drop them when it leaves the loaded-index cache
+add_eviction_listener(lambda directory, vectorstore: invalidate_qa_chains(vectorstore))
+
+
+def create_qa_chain(vectorstore, model=DEFAULT_MODEL, k=DEFAULT_K):
     """
     Create a QA retrieval chain from a given vector store.
     Uses a language model to answer questions based on retrieved documents.
@@ -17,67 +237,20 @@ def create_qa_chain(vectorstore):
         if not hasattr(vectorstore, 'as_retriever'):
             raise ValueError("The provided vectorstore does not support 'as_retriever'.")
 
-        # Setup retriever
-        retriever = vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 3}
-        )
-
-        # Load language model
-        llm = ChatGroq(model="llama-3.1-8b-instant", temperature=0)
-
-        # System prompt for the LLM
-        system_prompt = (
-            "You are an expert data analyst capable of analyzing Excel spreadsheets and providing comprehensive insights. "
-            "When given data, you should: "
-            
-            "ANALYSIS CAPABILITIES: "
-            "Data Processing - Parse and understand tabular data structures, identify data types (numerical, categorical, temporal), "
-            "handle missing values and data quality issues, perform statistical calculations (mean, median, mode, standard deviation, correlations). "
-            
-            "Comparative Analysis - Compare performance across different categories, time periods, or groups, "
-            "identify trends, patterns, and outliers, perform ranking and benchmarking analysis, "
-            "calculate percentage changes and growth rates. "
-            
-            "Visualization & Charts - Create appropriate charts based on data type (bar charts, line graphs, scatter plots, pie charts, histograms), "
-            "generate comparative visualizations (side-by-side comparisons, trend analysis), "
-            "use proper labeling, legends, and formatting, choose colors and styles that enhance data interpretation. "
-            
-            "Insights & Recommendations - Provide clear, actionable insights based on the analysis, "
-            "highlight key findings and notable patterns, suggest areas for improvement or further investigation, "
-            "present findings in business-friendly language. "
-            
-            "RESPONSE FORMAT: "
-            "1. Data Overview - Briefly describe the dataset structure and key variables. "
-            "2. Key Findings - Present 3-5 main insights with supporting data. "
-            "3. Visualizations - Create relevant charts to illustrate findings. "
-            "4. Recommendations - Provide actionable suggestions based on analysis. "
-            "5. Technical Details - Include statistical measures when relevant. "
-            
-            "INSTRUCTIONS: "
-            "Use the provided data context to perform analysis. Create interactive visualizations when possible. "
-            "Keep explanations clear and concise (aim for 2-3 sentences per insight). "
-            "When asked to compare entities, first check if both exist in the dataset. "
-            "If one entity is missing, provide analysis for the available entity and suggest what data would be needed for comparison. "
-            "If both entities exist, perform detailed comparative analysis with specific metrics and percentages. "
-            "Always work with the available data and provide meaningful insights even with limited information. "
-            "Focus on practical, actionable insights rather than just describing numbers. "
-            "When comparing categories, always provide context and percentage differences. "
-            "Do not generate inaccurate answers. "
-            
-            "Context: {context}"
-        )
+        # Lexical and partition indexes live next to the vectorstore's own files
+        directory = vectorstore_directory(vectorstore)
 
-        # Construct prompt template
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", system_prompt),
-                ("human", "{input}"),
-            ]
+        # Setup retriever: BM25 + vector hits fused, best summary document first, then the k best rows
+        retriever = HybridRetriever(
+            vectorstore=vectorstore,
+            lexical_index_loader=lambda: get_lexical_index(directory) if directory else None,
+            partition_index_loader=lambda: get_partition_index(directory) if directory else None,
+            k=k,
+            summary_k=SUMMARY_K,
         )
 
         # Create the QA chain
-        question_answer_chain = create_stuff_documents_chain(llm, prompt)
+        question_answer_chain = create_stuff_documents_chain(get_llm(model), PROMPT)
         chain = create_retrieval_chain(retriever, question_answer_chain)
 
         return chain
@@ -89,6 +262,7 @@ def create_qa_chain(vectorstore):
 
 
 
+
 # def create_qa_chain(vectorstore):
 #     """Create a QA chain using create_retrieval_chain"""
 #     retriever = vectorstore.as_retriever(
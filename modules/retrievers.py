@@ -0,0 +1,218 @@
+#================================Retrievers over the FAISS vectorstore================================
+
+from typing import Any, List, Optional
+
+import faiss
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from modules.ann_index import search_parameters
+from modules.docstore import SavedIds
+from modules.metrics import span
+from modules.query_parsing import find_entities
+from modules.summaries import SUMMARY_ID_PREFIX, is_summary_row
+
+
+def embed_query(vectorstore, query):
+    """Embed a query with the vectorstore's own embedding function."""
+    return vectorstore._embed_query(query)
+
+
+# Below this share of the index, a restricted search scores just the selected
+# vectors rather than letting FAISS walk the whole index behind an id filter
+PARTITION_SCAN_RATIO = 0.25
+
+
+def _search_positions(index, vector, k, positions):
+    """Exact search over only the given positions of a flat FAISS index."""
+    candidates = index.reconstruct_batch(positions)
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        scores = candidates @ vector[0]
+        order = np.argsort(-scores)
+    else:
+        scores = ((candidates - vector[0]) ** 2).sum(axis=1)
+        order = np.argsort(scores)
+    if k < len(order):
+        order = order[:k]
+    return [(int(positions[i]), float(scores[i])) for i in order]
+
+
+def search_ids_by_vector(vectorstore, embedding, k, positions=None):
+    """
+    Return up to k (document id, score) pairs nearest to an embedding. When
+    positions is given, only the vectors at those index positions are
+    considered, so the cost of a small partition scales with its size.
+    """
+    if k <= 0 or vectorstore.index.ntotal == 0:
+        return []
+    if positions is not None and len(positions) == 0:
+        return []
+
+    vector = np.array([embedding], dtype=np.float32)
+    if vectorstore._normalize_L2:
+        faiss.normalize_L2(vector)
+
+    index = vectorstore.index
+    if (
+        positions is not None
+        and isinstance(index, faiss.IndexFlat)
+        and len(positions) <= PARTITION_SCAN_RATIO * index.ntotal
+    ):
+        return [
+            (vectorstore.index_to_docstore_id[position], score)
+            for position, score in _search_positions(index, vector, k, np.asarray(positions, dtype=np.int64))
+        ]
+
+    params = None
+    if positions is not None:
+        params = search_parameters(index, faiss.IDSelectorBatch(np.asarray(positions, dtype=np.int64)))
+    scores, indices = vectorstore.index.search(vector, k, params=params)
+
+    return [
+        (vectorstore.index_to_docstore_id[int(position)], float(score))
+        for score, position in zip(scores[0], indices[0])
+        if position != -1
+    ]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse several best-first lists of document ids into one, best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def docstore_positions(vectorstore):
+    """Return a doc id -> index position lookup for a FAISS vectorstore."""
+    if isinstance(vectorstore.index_to_docstore_id, SavedIds):
+        # A saved docstore looks ids up on disk instead of building the map
+        return vectorstore.docstore.id_positions
+    return {doc_id: position for position, doc_id in vectorstore.index_to_docstore_id.items()}
+
+
+def summary_positions(vectorstore):
+    """Return the index positions of the precomputed summary documents."""
+    if isinstance(vectorstore.index_to_docstore_id, SavedIds):
+        return vectorstore.docstore.id_positions.with_prefix(SUMMARY_ID_PREFIX)
+    return np.array(
+        [position for position, doc_id in vectorstore.index_to_docstore_id.items() if is_summary_row(doc_id)],
+        dtype=np.int64,
+    )
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever that fuses BM25 hits from the lexical index with FAISS
+    similarity hits using reciprocal-rank fusion, then returns the best
+    summary documents followed by the best feedback rows. Queries made up
+    only of indexed terms (e.g. a lecturer's name) are answered from the
+    lexical index alone, without an embedding call.
+
+    When the question names known categorical values (a department, a year,
+    a lecturer), both searches are restricted to the matching partition
+    before ranking, instead of filtering the top hits afterwards.
+    """
+
+    vectorstore: Any
+    lexical_index_loader: Any
+    partition_index_loader: Optional[Any] = None
+    k: int = 3
+    summary_k: int = 1
+    candidates: int = 20
+    rrf_k: int = 60
+    positions: Optional[Any] = None
+    id_positions: Optional[Any] = None
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def model_post_init(self, __context):
+        if self.positions is None:
+            self.positions = summary_positions(self.vectorstore)
+        if self.id_positions is None and self.partition_index_loader is not None:
+            self.id_positions = docstore_positions(self.vectorstore)
+
+    def _partition(self, query):
+        """
+        Return (row ids, summary ids) of the partition a query is about, or
+        None when it names no known values or nothing matches them.
+        """
+        partition_index = self.partition_index_loader() if self.partition_index_loader else None
+        if partition_index is None:
+            return None
+        filters = find_entities(query, partition_index.value_index)
+        if not filters:
+            return None
+
+        matched = partition_index.lookup(filters)
+        if not matched:
+            return None
+        rows = {doc_id for doc_id in matched if not is_summary_row(doc_id)}
+
+        # A summary covers one entity, so it matches if it is about any filtered value
+        summaries = set()
+        for column, values in filters.items():
+            for value in values:
+                summaries |= {
+                    doc_id for doc_id in partition_index.partitions.get(f"{column}={value}", ())
+                    if is_summary_row(doc_id)
+                }
+        return rows, summaries
+
+    def _positions_of(self, ids):
+        return np.array(
+            sorted(self.id_positions[doc_id] for doc_id in ids if doc_id in self.id_positions),
+            dtype=np.int64,
+        )
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        with span("retrieve") as retrieve_span:
+            documents = self._retrieve(query, retrieve_span)
+            retrieve_span.add(documents=len(documents), chars=sum(len(doc.page_content) for doc in documents))
+            return documents
+
+    def _retrieve(self, query, retrieve_span):
+        partition = self._partition(query)
+        if partition is None:
+            row_where, summary_where = None, is_summary_row
+            row_scope, summary_scope = None, self.positions
+        else:
+            row_ids, summary_ids = partition
+            row_where, summary_where = (row_ids | summary_ids).__contains__, summary_ids.__contains__
+            row_scope, summary_scope = self._positions_of(row_ids | summary_ids), self._positions_of(summary_ids)
+
+        lexical_index = self.lexical_index_loader()
+        lexical_ids = []
+        if lexical_index is not None:
+            # Summaries are long, so BM25 length normalization would bury them among rows
+            lexical_ids = [
+                doc_id for doc_id, _ in lexical_index.search(query, self.summary_k, where=summary_where)
+            ] + [doc_id for doc_id, _ in lexical_index.search(query, self.candidates, where=row_where)]
+
+        lexical_only = bool(lexical_ids) and lexical_index.covers(query)
+        retrieve_span.label(path="lexical" if lexical_only else "hybrid", partitioned=partition is not None)
+        if lexical_only:
+            ranked = lexical_ids
+        else:
+            embedding = embed_query(self.vectorstore, query)
+            vector_ids = [
+                doc_id for doc_id, _ in search_ids_by_vector(self.vectorstore, embedding, self.candidates, row_scope)
+            ]
+            summary_ids = [
+                doc_id for doc_id, _ in search_ids_by_vector(self.vectorstore, embedding, self.summary_k, summary_scope)
+            ]
+            ranked = reciprocal_rank_fusion([lexical_ids, summary_ids + vector_ids], k=self.rrf_k)
+
+        summaries = [doc_id for doc_id in ranked if is_summary_row(doc_id)][:self.summary_k]
+        rows = [doc_id for doc_id in ranked if not is_summary_row(doc_id)][:self.k]
+
+        documents = []
+        for doc_id in summaries + rows:
+            doc = self.vectorstore.docstore.search(doc_id)
+            # The lexical index can be newer than this vectorstore for a moment after an update
+            if isinstance(doc, Document):
+                documents.append(doc)
+        return documents
@@ -0,0 +1,97 @@
+#=======================Precomputed per-entity summary documents==================
+
+from collections import Counter, defaultdict
+
+import pandas as pd
+from langchain.schema import Document
+
+from modules.data_processing import CATEGORICAL_COLUMNS, row_id
+
+# Entities that get a rollup document, in the order they are emitted
+SUMMARY_COLUMNS = ("Lecturers Name", "Department", "Faculty", "Year")
+
+SUMMARY_DOC_TYPE = "summary"
+SUMMARY_ID_PREFIX = "summary-"
+
+
+def _native(value):
+    # Keep metadata plain Python so it compares and serializes cleanly; a
+    # score reads the same whether its batch parsed it as 4 or 4.0
+    value = value.item() if hasattr(value, "item") else value
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
+class SummaryAccumulator:
+    """
+    Running rating distributions per (entity column, value), built up batch by
+    batch so summaries can be computed while a file is streamed.
+    """
+
+    def __init__(self):
+        self.responses = Counter()
+        self.distributions = defaultdict(lambda: defaultdict(Counter))
+        self.rating_columns = []
+
+    def add(self, df):
+        """Fold a batch of feedback rows into the running statistics."""
+        df = df.rename(columns=lambda col: str(col).strip())
+        # Streamed batches hold text (see iter_excel_batches); a column is a
+        # rating if all its values are numbers
+        scores = {}
+        for col in df.columns:
+            if col in CATEGORICAL_COLUMNS:
+                continue
+            values = df[col] if pd.api.types.is_numeric_dtype(df[col]) else pd.to_numeric(df[col], errors="coerce")
+            if values.notna().any() and values.notna().sum() == df[col].notna().sum():
+                scores[col] = values
+        df = df.assign(**scores)
+        ratings = list(scores)
+        for col in ratings:
+            if col not in self.rating_columns:
+                self.rating_columns.append(col)
+
+        for column in SUMMARY_COLUMNS:
+            if column not in df.columns:
+                continue
+            for value, count in df[column].value_counts().items():
+                self.responses[(column, _native(value))] += int(count)
+            for rating in ratings:
+                for (value, score), count in df.groupby([column, rating]).size().items():
+                    self.distributions[(column, _native(value))][rating][_native(score)] += int(count)
+
+    def _summary_text(self, column, value):
+        total = self.responses[(column, value)]
+        lines = [f"Summary for {column}: {value} (computed over all feedback rows)", f"Responses: {total}"]
+        for rating in self.rating_columns:
+            distribution = self.distributions[(column, value)].get(rating)
+            if not distribution:
+                continue
+            count = sum(distribution.values())
+            mean = sum(score * n for score, n in distribution.items()) / count
+            spread = ", ".join(f"{score}: {n}" for score, n in sorted(distribution.items()))
+            lines.append(f"{rating}: mean {mean:.2f}; distribution {spread}")
+        return "\n".join(lines)
+
+    def documents(self):
+        """Return one summary Document per entity seen so far."""
+        documents = []
+        seen = Counter()
+        for column in SUMMARY_COLUMNS:
+            values = sorted((value for col, value in self.responses if col == column), key=str)
+            for value in values:
+                text = self._summary_text(column, value)
+                documents.append(Document(
+                    page_content=text,
+                    metadata={
+                        "row_id": SUMMARY_ID_PREFIX + row_id(text, seen),
+                        "doc_type": SUMMARY_DOC_TYPE,
+                        "entity_column": column,
+                        "entity": value,
+                    },
+                ))
+        return documents
+
+
+def is_summary_row(row):
+    """Return True if a row id belongs to a summary document."""
+    return row.startswith(SUMMARY_ID_PREFIX)
@@ -1,61 +1,703 @@
 #=============================Handle the vector store creation and loading================
 
+import json
 import os
+import pickle
+import shutil
+import threading
+import weakref
+from collections import OrderedDict
+from datetime import datetime
+import faiss
 from dotenv import load_dotenv
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain_openai import OpenAIEmbeddings 
+from modules.ann_index import (
+    VECTORSTORE_INDEX_PROFILE, apply_index_profile, configure_search, delete_from_vectorstore,
+    effective_profile, index_metadata, index_profile,
+)
+from modules.docstore import (
+    DOCSTORE_FILE, DOCSTORE_IDS_FILE, DOCSTORE_OFFSETS_FILE, DOCSTORE_ORDER_FILE, ColumnarDocstore, has_docstore,
+    write_docstore,
+)
+from modules.embedding_cache import CachedEmbeddings, get_embedding_cache
+from modules.embedding_executor import ConcurrentEmbeddings
+from modules.file_fingerprints import file_fingerprint
+from modules.lexical_index import LEXICAL_INDEX_FILENAME, LexicalIndex, forget_lexical_index, set_lexical_index
+from modules.local_embeddings import HashingEmbeddings
+from modules.metrics import add_collector, span
+from modules.partition_index import (
+    PARTITION_INDEX_FILENAME, PartitionIndex, forget_partition_index, set_partition_index,
+)
+from modules.summaries import is_summary_row
 
 load_dotenv()
 
 embedding_api_key = os.getenv("EMBEDDING_API_KEY")  
 
+# "openai" embeds through the OpenAI API; "hashing" embeds locally on the CPU
+# (modules/local_embeddings.py), with no key or network. Indexes only load
+# with the backend, model and dimension they were built with
+EMBEDDING_BACKENDS = ("openai", "hashing")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+if EMBEDDING_BACKEND not in EMBEDDING_BACKENDS:
+    raise ValueError(f"EMBEDDING_BACKEND must be one of {', '.join(EMBEDDING_BACKENDS)}, not {EMBEDDING_BACKEND!r}.")
+# The OpenAI client's default model, which every index before the setting existed was built with
+OPENAI_EMBEDDING_MODEL = "text-embedding-ada-002"
+HASHING_EMBEDDING_DIMENSION = int(os.getenv("HASHING_EMBEDDING_DIMENSION", "512"))
+
+# Every dataset gets its own index directory under here, named by the
+# hash of the file's content; the manifest lists them
 VECTORSTORE_DIR = "vectorstore"
-FAISS_INDEX = os.path.join(VECTORSTORE_DIR, "index.faiss")
-METADATA_FILE = os.path.join(VECTORSTORE_DIR, "index.pkl")
-
-
-def save_vectorstore(vs):
-    """Save the vectorstore to local directory."""
+MANIFEST_FILE = os.path.join(VECTORSTORE_DIR, "manifest.json")
+# Versions (namespaces) of one source file kept on disk; older ones are
+# deleted once a newer one is saved. 0 keeps every version
+VECTORSTORE_VERSIONS_KEPT = int(os.getenv("VECTORSTORE_VERSIONS_KEPT", "3"))
+FAISS_INDEX = "index.faiss"
+# Pickled docstore written by FAISS.save_local; indexes saved before the
+# offset-indexed docstore (modules/docstore.py) existed still load from it
+METADATA_FILE = "index.pkl"
+ROW_MAP_FILE = "row_map.json"
+# Names the snapshot directory holding the current index.faiss, docstore,
+# index metadata, row map, lexical and partition index files. A save writes
+# a whole new snapshot and then replaces this one file, so a reader never
+# pairs files from two different saves. Indexes saved before snapshots keep
+# those files in the namespace directory itself
+SNAPSHOT_FILE = "snapshot.json"
+# Snapshots kept per namespace, the current one included, so a reader that
+# read the pointer just before a save can still open the files it names
+SNAPSHOTS_KEPT = 2
+# Index profile and parameters
+INDEX_META_FILE = "index_meta.json"
+# Every file a save writes, all of them to the same snapshot
+SNAPSHOT_FILES = (
+    FAISS_INDEX, METADATA_FILE, DOCSTORE_FILE, DOCSTORE_OFFSETS_FILE, DOCSTORE_IDS_FILE, DOCSTORE_ORDER_FILE,
+    INDEX_META_FILE, ROW_MAP_FILE, LEXICAL_INDEX_FILENAME, PARTITION_INDEX_FILENAME,
+)
+
+# Loaded indexes kept in memory across datasets, least recently used evicted first
+VECTORSTORE_MEMORY_BUDGET_MB = int(os.getenv("VECTORSTORE_MEMORY_BUDGET_MB", "1024"))
+# Map saved indexes read-only instead of reading them into process memory, so
+# server processes on one machine share the index pages through the page cache
+VECTORSTORE_MMAP = os.getenv("VECTORSTORE_MMAP", "1") == "1"
+
+_embeddings = None
+_cache_lock = threading.Lock()
+_manifest_lock = threading.Lock()
+# Loaded vectorstore -> the directory it was loaded from or saved to
+_directories = weakref.WeakKeyDictionary()
+# Vectorstores whose index is memory-mapped from disk rather than held in process memory
+_mapped = weakref.WeakSet()
+
+
+class EmbeddingMismatchError(ValueError):
+    """A saved index was built with other embeddings than the configured ones."""
+
+
+def get_embeddings():
+    """
+    Return the embeddings of the configured EMBEDDING_BACKEND. The OpenAI
+    client is wrapped in the persistent embedding cache, with cache misses
+    embedded in concurrent, rate-limited batches; local embeddings are cheaper
+    to recompute than to look up. Created once per process and shared.
+    """
+    global _embeddings
+    with _cache_lock:
+        if _embeddings is None:
+            if EMBEDDING_BACKEND == "hashing":
+                _embeddings = HashingEmbeddings(HASHING_EMBEDDING_DIMENSION)
+            else:
+                if not embedding_api_key:
+                    raise ValueError("OpenAI embedding API key not found in environment variables.")
+                # Retries on 429s, 5xx errors, timeouts and dropped connections are handled by ConcurrentEmbeddings
+                embeddings = OpenAIEmbeddings(model=OPENAI_EMBEDDING_MODEL, openai_api_key=embedding_api_key, max_retries=0)  # ✅
+                _embeddings = CachedEmbeddings(ConcurrentEmbeddings(embeddings), get_embedding_cache(), embeddings.model)
+        return _embeddings
+
+
+def embedding_metadata():
+    """Describe the configured embeddings, for the saved index metadata."""
+    model = HashingEmbeddings(HASHING_EMBEDDING_DIMENSION).model if EMBEDDING_BACKEND == "hashing" else OPENAI_EMBEDDING_MODEL
+    return {"embedding_backend": EMBEDDING_BACKEND, "embedding_model": model}
+
+
+def check_embeddings(directory, snapshot=None):
+    """
+    Raise EmbeddingMismatchError if the index saved in a directory was built
+    with other embeddings than the configured ones. Indexes saved before the
+    backend was recorded were all built with OpenAI.
+    """
+    path = os.path.join(snapshot or _snapshot_dir(directory), INDEX_META_FILE)
+    saved = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            saved = json.load(f)
+    backend = saved.get("embedding_backend", "openai")
+    model = saved.get("embedding_model", OPENAI_EMBEDDING_MODEL)
+    configured = embedding_metadata()
+    if (backend, model) != (configured["embedding_backend"], configured["embedding_model"]):
+        dimension = f", {saved['dimension']} dimensions" if "dimension" in saved else ""
+        raise EmbeddingMismatchError(
+            f"The index in {directory} was built with {backend} embeddings ({model}{dimension}), "
+            f"but EMBEDDING_BACKEND is {configured['embedding_backend']} ({configured['embedding_model']}). "
+            "Re-index the dataset or switch the backend back."
+        )
+
+
+def estimate_vectorstore_bytes(vs):
+    """
+    Rough private memory of a FAISS vectorstore: its vectors plus its document
+    text. Memory-mapped vectors and documents live in the shared page cache
+    and are not counted.
+    """
+    vector_bytes = 0 if vs in _mapped else vs.index.ntotal * vs.index.d * 4
+    documents = vs.docstore.added if isinstance(vs.docstore, ColumnarDocstore) else vs.docstore._dict
+    text_bytes = sum(len(doc.page_content) for doc in documents.values())
+    # Python string and dict overhead roughly doubles the raw text
+    return vector_bytes + 2 * text_bytes
+
+
+class VectorstoreLRU:
+    """
+    Process-wide cache of loaded vectorstores shared by every Streamlit
+    session, keyed by index directory. Each entry remembers the on-disk
+    signature it was loaded with; least recently used entries are evicted
+    once the estimated total size exceeds the memory budget. The most
+    recently used entry is always kept, even if it alone is over budget.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.entries = OrderedDict()  # directory -> (signature, vectorstore, size)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.eviction_listeners = []
+        self._lock = threading.Lock()
+
+    def get(self, directory, signature):
+        """Return the cached vectorstore for a directory if it still matches the files on disk."""
+        with self._lock:
+            entry = self.entries.get(directory)
+            if entry is None or entry[0] != signature:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(directory)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, directory, signature, vs):
+        """Cache a vectorstore for a directory, evicting others as needed to stay in budget."""
+        size = estimate_vectorstore_bytes(vs)
+        evicted = []
+        with self._lock:
+            previous = self.entries.pop(directory, None)
+            if previous is not None:
+                self.total_bytes -= previous[2]
+                if previous[1] is not vs:
+                    evicted.append((directory, previous[1]))
+            self.entries[directory] = (signature, vs, size)
+            self.total_bytes += size
+
+            while self.total_bytes > self.budget_bytes and len(self.entries) > 1:
+                old_directory, (_, old_vs, old_size) = self.entries.popitem(last=False)
+                self.total_bytes -= old_size
+                self.evictions += 1
+                evicted.append((old_directory, old_vs))
+
+        # Listeners run outside the lock so they can call back into the cache
+        for old_directory, old_vs in evicted:
+            for listener in self.eviction_listeners:
+                listener(old_directory, old_vs)
+
+    def stats(self):
+        """Return the cache size and hit, miss and eviction counts."""
+        with self._lock:
+            return {
+                "loaded": list(self.entries),
+                "bytes": self.total_bytes,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_loaded_vectorstores = VectorstoreLRU(VECTORSTORE_MEMORY_BUDGET_MB * 1024 * 1024)
+
+
+def _forget_secondary_indexes(directory, vs):
+    # An evicted or replaced index's lexical and partition indexes go with it,
+    # unless they belong to the snapshot that is loaded now
+    snapshot = _directories.get(vs)
+    entry = _loaded_vectorstores.entries.get(directory)
+    if snapshot is not None and (entry is None or _directories.get(entry[1]) != snapshot):
+        forget_lexical_index(snapshot)
+        forget_partition_index(snapshot)
+
+
+_loaded_vectorstores.eviction_listeners.append(_forget_secondary_indexes)
+
+
+def add_eviction_listener(listener):
+    """
+    Register listener(directory, vectorstore) to be called when a loaded
+    vectorstore is evicted or replaced, e.g. to drop chains built on it.
+    """
+    _loaded_vectorstores.eviction_listeners.append(listener)
+
+
+def _cache_metrics():
+    stats = _loaded_vectorstores.stats()
+    yield "cache_requests_total", {"cache": "vectorstore", "result": "hit"}, stats["hits"], "counter"
+    yield "cache_requests_total", {"cache": "vectorstore", "result": "miss"}, stats["misses"], "counter"
+    yield "cache_evictions_total", {"cache": "vectorstore"}, stats["evictions"], "counter"
+    yield "cache_entries", {"cache": "vectorstore"}, len(stats["loaded"]), "gauge"
+    yield "vectorstore_memory_bytes", {}, stats["bytes"], "gauge"
+
+
+add_collector(_cache_metrics)
+
+
+def dataset_namespace(file_path):
+    """
+    Return the namespace of a dataset file: a hash of its content, so the same
+    data always maps to the same index whatever the file is called. Files are
+    only re-hashed when their size or mtime changes (see modules.file_fingerprints).
+    """
+    return file_fingerprint(file_path)
+
+
+def namespace_dir(namespace):
+    """Return the index directory of a dataset namespace."""
+    return os.path.join(VECTORSTORE_DIR, namespace)
+
+
+def vectorstore_directory(vs):
+    """Return the snapshot directory a vectorstore was loaded from or saved to, or None."""
+    return _directories.get(vs)
+
+
+def load_manifest():
+    """Return the manifest of saved indexes: namespace -> details of its dataset."""
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    with open(MANIFEST_FILE, 'r') as f:
+        return json.load(f)
+
+
+def _record_namespace(namespace, source, vs, row_map):
+    """Add or refresh a namespace's manifest entry."""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with _manifest_lock:
+        manifest = load_manifest()
+        entry = manifest.get(namespace, {"created": now})
+        entry.update({
+            "rows": sum(1 for row in row_map if not is_summary_row(row)),
+            "documents": vs.index.ntotal,
+            "index_profile": index_metadata(vs.index)["profile"],
+            "updated": now,
+        })
+        if source is not None:
+            entry["source"] = source
+        manifest[namespace] = entry
+        _write_manifest(manifest)
+
+
+def _write_manifest(manifest):
+    tmp_file = MANIFEST_FILE + ".tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_file, MANIFEST_FILE)
+
+
+def prune_namespaces(source, current=None, keep=None):
+    """
+    Delete the index directories of all but the `keep` (by default
+    VECTORSTORE_VERSIONS_KEPT) most recently updated namespaces built from a
+    source file name, and drop them from the manifest. `current` is never
+    deleted. Processes that have a deleted index loaded keep serving it from
+    the open files until they evict it. Returns the deleted namespaces.
+    """
+    keep = VECTORSTORE_VERSIONS_KEPT if keep is None else keep
+    if keep <= 0:
+        return []
+    with _manifest_lock:
+        manifest = load_manifest()
+        versions = sorted(
+            ((namespace == current, entry["updated"], namespace) for namespace, entry in manifest.items()
+             if entry.get("source") == source),
+            reverse=True,
+        )
+        pruned = [namespace for _, _, namespace in versions[keep:]]
+        if not pruned:
+            return []
+        for namespace in pruned:
+            del manifest[namespace]
+        _write_manifest(manifest)
+    for namespace in pruned:
+        shutil.rmtree(namespace_dir(namespace), ignore_errors=True)
+    return pruned
+
+
+def latest_namespace(source):
+    """Return the most recently updated namespace built from a source file name, or None."""
+    candidates = [
+        (entry["updated"], namespace) for namespace, entry in load_manifest().items()
+        if entry.get("source") == source and _index_signature(namespace_dir(namespace)) is not None
+    ]
+    return max(candidates)[1] if candidates else None
+
+
+def _snapshot_dir(directory):
+    """Return the directory holding a namespace's current index and docstore files."""
     try:
-        os.makedirs(VECTORSTORE_DIR, exist_ok=True)
-        vs.save_local(VECTORSTORE_DIR)
+        with open(os.path.join(directory, SNAPSHOT_FILE), 'r') as f:
+            return os.path.join(directory, json.load(f)["snapshot"])
+    except FileNotFoundError:
+        return directory
+
+
+def _index_signature(directory, snapshot=None):
+    """Return (name, mtime, size) of the saved index files, or None if there is no index."""
+    snapshot = snapshot or _snapshot_dir(directory)
+    signature = []
+    for name in (FAISS_INDEX, DOCSTORE_OFFSETS_FILE, METADATA_FILE, ROW_MAP_FILE):
+        path = os.path.join(snapshot, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+    names = {name for name, _, _ in signature}
+    if FAISS_INDEX not in names or not names & {DOCSTORE_OFFSETS_FILE, METADATA_FILE}:
+        return None
+    return (os.path.basename(snapshot),) + tuple(signature)
+
+
+def owned_index(index):
+    """
+    Return a copy of a FAISS index that owns its data. clone_index of a
+    memory-mapped index still points into the read-only mapping, so the copy
+    is made by serializing instead.
+    """
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+def _read_index(path):
+    """Read a saved FAISS index, memory-mapped read-only when VECTORSTORE_MMAP is on."""
+    if VECTORSTORE_MMAP:
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY), True
+        except RuntimeError:
+            # Index types that cannot be mapped are read normally
+            pass
+    return faiss.read_index(path), False
+
+
+def _write_index_files(vs, snapshot_dir):
+    """
+    Write the FAISS index and the offset-indexed docstore to a snapshot
+    directory. The vectorstore then reads its documents from the saved files
+    rather than holding them in memory.
+    """
+    faiss.write_index(vs.index, os.path.join(snapshot_dir, FAISS_INDEX))
+    write_docstore(snapshot_dir, vs.docstore, vs.index_to_docstore_id)
+    vs.docstore = ColumnarDocstore(snapshot_dir)
+    vs.index_to_docstore_id = vs.docstore.index_to_docstore_id
+
+
+def _switch_snapshot(directory, snapshot_dir):
+    """
+    Point a namespace at a fully written snapshot with one rename (see
+    SNAPSHOT_FILE). Files are never overwritten, which would also pull the
+    pages out from under processes that have them mapped; older snapshots
+    and files of older layouts are removed once unlinking them can no longer
+    break a load in progress.
+    """
+    snapshot = os.path.basename(snapshot_dir)
+    _write_json(os.path.join(directory, SNAPSHOT_FILE), {"snapshot": snapshot})
+
+    for name in SNAPSHOT_FILES:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.remove(path)
+    snapshots = sorted(entry.name for entry in os.scandir(directory) if entry.is_dir() and entry.name.startswith("snapshot-"))
+    for old in snapshots[:max(0, len(snapshots) - SNAPSHOTS_KEPT)]:
+        if old != snapshot:
+            shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+
+
+def copy_vectorstore(vs):
+    """
+    Return an independent copy of a FAISS vectorstore. Updates are applied
+    to a copy so sessions reading the shared instance never see a
+    half-updated index.
+    """
+    if isinstance(vs.docstore, ColumnarDocstore):
+        docstore = vs.docstore.copy()
+    else:
+        docstore = InMemoryDocstore(dict(vs.docstore._dict))
+    return FAISS(
+        vs.embedding_function,
+        owned_index(vs.index),
+        docstore,
+        dict(vs.index_to_docstore_id),
+        normalize_L2=vs._normalize_L2,
+        distance_strategy=vs.distance_strategy,
+    )
+
+
+def document_ids(documents):
+    """
+    Assign every chunk an id of the form "<row_id>:<chunk number>" and group
+    the ids by the row they came from.
+    """
+    ids = []
+    row_map = {}
+    for doc in documents:
+        chunk_ids = row_map.setdefault(doc.metadata["row_id"], [])
+        chunk_ids.append(f"{doc.metadata['row_id']}:{len(chunk_ids)}")
+        ids.append(chunk_ids[-1])
+    return ids, row_map
+
+
+def load_row_map(namespace):
+    """Load the row id -> chunk ids mapping of a namespace's saved vectorstore, if any."""
+    path = os.path.join(_snapshot_dir(namespace_dir(namespace)), ROW_MAP_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    tmp_file = path + ".tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_file, path)
+
+
+def save_vectorstore(vs, namespace, row_map=None, lexical_index=None, partition_index=None, source=None):
+    """
+    Save the vectorstore and its index metadata to a new snapshot of its
+    namespace directory, along with its row id mapping, lexical index and
+    partition index (those not given are carried over from the current
+    snapshot), switch the namespace over to it and record the namespace in
+    the manifest, pruning older versions of the same source file.
+    """
+    try:
+        directory = namespace_dir(namespace)
+        os.makedirs(directory, exist_ok=True)
+        previous = _snapshot_dir(directory)
+        snapshot_dir = os.path.join(directory, f"snapshot-{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{os.getpid()}")
+        os.makedirs(snapshot_dir)
+
+        _write_index_files(vs, snapshot_dir)
+        _write_json(os.path.join(snapshot_dir, INDEX_META_FILE), {**index_metadata(vs.index), **embedding_metadata()})
+        if row_map is not None:
+            _write_json(os.path.join(snapshot_dir, ROW_MAP_FILE), row_map)
+        if lexical_index is not None:
+            lexical_index.save(snapshot_dir)
+        if partition_index is not None:
+            partition_index.save(snapshot_dir)
+        for name in (ROW_MAP_FILE, LEXICAL_INDEX_FILENAME, PARTITION_INDEX_FILENAME):
+            path = os.path.join(previous, name)
+            if not os.path.exists(os.path.join(snapshot_dir, name)) and os.path.exists(path):
+                shutil.copy2(path, snapshot_dir)
+        _switch_snapshot(directory, snapshot_dir)
+
+        if lexical_index is not None:
+            set_lexical_index(snapshot_dir, lexical_index)
+        if partition_index is not None:
+            set_partition_index(snapshot_dir, partition_index)
+        _record_namespace(namespace, source, vs, row_map if row_map is not None else load_row_map(namespace) or {})
+        if source is not None:
+            prune_namespaces(source, current=namespace)
+
+        # Serve the saved instance to every session without reloading it
+        _directories[vs] = snapshot_dir
+        _loaded_vectorstores.put(os.path.abspath(directory), _index_signature(directory, snapshot_dir), vs)
     except Exception as e:
         raise RuntimeError(f"❌ Error saving vectorstore: {str(e)}")
 
 
-def load_vectorstore():
-    """Load existing vectorstore from local directory."""
+def load_vectorstore(namespace):
+    """
+    Load a namespace's vectorstore from its directory, or return None if it
+    has none. Loaded instances are kept in a process-wide LRU cache and only
+    reloaded when the files on disk change. With VECTORSTORE_MMAP the index is
+    mapped read-only, so loading costs the same whatever its size and vectors
+    are paged in as searches touch them; changes always go to a copy.
+    Documents are likewise read from disk only when they are looked up.
+    Raises EmbeddingMismatchError for an index built with other embeddings
+    than the configured EMBEDDING_BACKEND.
+    """
     try:
-        if not embedding_api_key:
-            raise ValueError("OpenAI embedding API key not found in environment variables.")
-
-        if os.path.exists(FAISS_INDEX) and os.path.exists(METADATA_FILE):
-            embeddings = OpenAIEmbeddings(openai_api_key=embedding_api_key)  # ✅
-            return FAISS.load_local(
-                VECTORSTORE_DIR,
-                embeddings,
-                allow_dangerous_deserialization=True
-            )
-        else:
+        directory = namespace_dir(namespace)
+        snapshot = _snapshot_dir(directory)
+        signature = _index_signature(directory, snapshot)
+        if signature is None:
             return None
+
+        with span("load") as load_span:
+            key = os.path.abspath(directory)
+            vs = _loaded_vectorstores.get(key, signature)
+            if vs is not None:
+                load_span.label(cache="hit")
+                return vs
+
+            check_embeddings(directory, snapshot)
+            index, mapped = _read_index(os.path.join(snapshot, FAISS_INDEX))
+            if has_docstore(snapshot):
+                docstore = ColumnarDocstore(snapshot)
+                index_to_docstore_id = docstore.index_to_docstore_id
+            else:
+                # Saved by an older version; converted on its next save
+                with open(os.path.join(snapshot, METADATA_FILE), 'rb') as f:
+                    docstore, index_to_docstore_id = pickle.load(f)
+            vs = FAISS(get_embeddings(), configure_search(index), docstore, index_to_docstore_id)
+            if mapped:
+                _mapped.add(vs)
+            _directories[vs] = snapshot
+            _loaded_vectorstores.put(key, signature, vs)
+            load_span.label(cache="miss", mmap=mapped)
+            load_span.add(documents=vs.index.ntotal)
+            return vs
+    except EmbeddingMismatchError:
+        raise
     except Exception as e:
         raise RuntimeError(f"❌ Error loading vectorstore: {str(e)}")
 
 
-def create_vectorstore(documents):
-    """Create new vectorstore from documents."""
+def create_vectorstore(documents, namespace, source=None, profile=None):
+    """
+    Create a new vectorstore for a namespace from documents, with an index of
+    the given profile ("flat", "ivf_flat", "ivf_pq" or "hnsw"; by default
+    VECTORSTORE_INDEX_PROFILE).
+    """
     try:
-        if not embedding_api_key:
-            raise ValueError("OpenAI embedding API key not found in environment variables.")
-
-        embeddings = OpenAIEmbeddings(openai_api_key=embedding_api_key)  # ✅
-        vs = FAISS.from_documents(documents, embeddings)
-        save_vectorstore(vs)
-        return vs
+        with span("index", mode="create") as index_span:
+            embeddings = get_embeddings()
+            ids, row_map = document_ids(documents)
+            vs = FAISS.from_documents(documents, embeddings, ids=ids)
+            apply_index_profile(vs, profile or VECTORSTORE_INDEX_PROFILE)
+
+            lexical_index = LexicalIndex()
+            lexical_index.add_documents(ids, [doc.page_content for doc in documents])
+            partition_index = PartitionIndex()
+            partition_index.add_documents(ids, documents)
+
+            save_vectorstore(vs, namespace, row_map, lexical_index, partition_index, source=source)
+            index_span.add(documents=len(documents))
+            return vs
     except Exception as e:
         raise RuntimeError(f"❌ Error creating vectorstore: {str(e)}")
 
 
+def _writable_indexes(vs, namespace):
+    """Return private copies of a namespace's saved lexical and partition indexes to apply changes to."""
+    if vs is None:
+        return LexicalIndex(), PartitionIndex()
+    directory = _snapshot_dir(namespace_dir(namespace))
+    return (
+        LexicalIndex.load(directory) or LexicalIndex.from_vectorstore(vs),
+        PartitionIndex.load(directory) or PartitionIndex.from_vectorstore(vs),
+    )
+
+
+def sync_vectorstore(vs, document_batches, namespace, base_namespace=None, source=None, profile=None):
+    """
+    Bring a namespace's vectorstore in line with a stream of document batches.
+    Each batch is embedded and inserted before the next one is read, and only
+    rows that were added or changed are embedded; rows that are gone are
+    deleted at the end. `vs` is the vectorstore of `base_namespace` (by default
+    the namespace itself): a new version of a dataset starts from the previous
+    version's index, which is left untouched. Builds a fresh index when there
+    is no index or row mapping yet. The index is rebuilt with `profile` (by
+    default VECTORSTORE_INDEX_PROFILE) if it does not use it already. Returns the vectorstore, counts of added,
+    removed and unchanged data rows, and the number of summary documents
+    re-embedded.
+    """
+    try:
+        base_namespace = base_namespace or namespace
+        row_map = load_row_map(base_namespace) if vs is not None else None
+        if row_map is None:
+            vs, row_map = None, {}
+
+        # The passed-in vectorstore may be shared with other sessions, so
+        # changes go to a private copy that replaces it once saved
+        shared_vs = vs
+        lexical_index = partition_index = None
+        new_row_map = {}
+        added_rows = []
+        for documents in document_batches:
+            ids, batch_row_map = document_ids(documents)
+            new_row_map.update(batch_row_map)
+
+            added = [(doc_id, doc) for doc_id, doc in zip(ids, documents) if doc.metadata["row_id"] not in row_map]
+            if not added:
+                continue
+            added_rows.extend(row for row in batch_row_map if row not in row_map)
+
+            added_docs = [doc for _, doc in added]
+            added_ids = [doc_id for doc_id, _ in added]
+            if vs is None:
+                vs = FAISS.from_documents(added_docs, get_embeddings(), ids=added_ids)
+            else:
+                if vs is shared_vs:
+                    vs = copy_vectorstore(shared_vs)
+                vs.add_documents(added_docs, ids=added_ids)
+            if lexical_index is None:
+                lexical_index, partition_index = _writable_indexes(shared_vs, base_namespace)
+            lexical_index.add_documents(added_ids, [doc.page_content for doc in added_docs])
+            partition_index.add_documents(added_ids, added_docs)
+
+        if not new_row_map:
+            raise ValueError("No rows found to index.")
+
+        removed_rows = [row for row in row_map if row not in new_row_map]
+        if removed_rows:
+            if vs is shared_vs:
+                vs = copy_vectorstore(shared_vs)
+            removed_ids = [doc_id for row in removed_rows for doc_id in row_map[row]]
+            delete_from_vectorstore(vs, removed_ids)
+            if lexical_index is None:
+                lexical_index, partition_index = _writable_indexes(shared_vs, base_namespace)
+            lexical_index.delete(removed_ids)
+            partition_index.delete(removed_ids)
+
+        # Vectors are added to whatever index is there; switching layouts retrains it
+        profile = profile or VECTORSTORE_INDEX_PROFILE
+        rebuilt = False
+        if vs is not shared_vs:
+            rebuilt = apply_index_profile(vs, profile)
+        elif effective_profile(profile, vs.index.ntotal) != index_profile(vs.index):
+            vs = copy_vectorstore(shared_vs)
+            rebuilt = apply_index_profile(vs, profile)
+
+        if base_namespace != namespace:
+            # The new namespace needs its own copy of everything, even if no row changed
+            if vs is shared_vs:
+                vs = copy_vectorstore(shared_vs)
+            if lexical_index is None:
+                lexical_index, partition_index = _writable_indexes(shared_vs, base_namespace)
+            save_vectorstore(vs, namespace, new_row_map, lexical_index, partition_index, source=source)
+        elif removed_rows or added_rows or rebuilt:
+            save_vectorstore(vs, namespace, new_row_map, lexical_index, partition_index, source=source)
+
+        data_rows = sum(1 for row in new_row_map if not is_summary_row(row))
+        added_data_rows = sum(1 for row in added_rows if not is_summary_row(row))
+        changes = {
+            "added": added_data_rows,
+            "removed": sum(1 for row in removed_rows if not is_summary_row(row)),
+            "unchanged": data_rows - added_data_rows,
+            "summaries_updated": len(added_rows) - added_data_rows,
+        }
+        return vs, changes
+    except Exception as e:
+        raise RuntimeError(f"❌ Error updating vectorstore: {str(e)}")
+
 
 
 
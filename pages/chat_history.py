@@ -1,7 +1,7 @@
 import streamlit as st
 import json
-import os
 from datetime import datetime
+from modules.chat_store import MAX_COUNTED_MATCHES, get_chat_store, import_legacy_history
 
 
 # full_hide = """
@@ -31,61 +31,45 @@ st.set_page_config(
 if not st.session_state.get('authenticated', False):
     st.switch_page("pages/login.py")
 
+SORT_OPTIONS = {"Newest First": "newest", "Oldest First": "oldest", "Best Match": "relevance"}
+
 # Chat history management functions
-def load_chat_history_from_file():
-    """Load chat history from file"""
+def load_chat_summary():
+    """Load the conversation count and date range from the store"""
     try:
-        chat_dir = "chat_history"
-        filename = f"{chat_dir}/{st.session_state.username}_chat_history.json"
-        
-        if os.path.exists(filename):
-            with open(filename, 'r') as f:
-                return json.load(f)
-        return []
+        import_legacy_history(st.session_state.username)
+        chat_store = get_chat_store()
+        return chat_store.count(st.session_state.username), chat_store.date_range(st.session_state.username)
     except Exception as e:
         st.error(f"Error loading chat history: {str(e)}")
-        return []
+        return 0, (None, None)
 
-def save_chat_history_to_file(chat_history):
-    """Save chat history to file"""
+def clear_chat_history():
+    """Clear all chat history"""
     try:
-        chat_dir = "chat_history"
-        if not os.path.exists(chat_dir):
-            os.makedirs(chat_dir)
-        
-        filename = f"{chat_dir}/{st.session_state.username}_chat_history.json"
-        with open(filename, 'w') as f:
-            json.dump(chat_history, f, indent=2)
+        get_chat_store().clear(st.session_state.username)
         return True
     except Exception as e:
-        st.error(f"Error saving chat history: {str(e)}")
+        st.error(f"Error clearing chat history: {str(e)}")
         return False
 
-def delete_chat_entry(index, chat_history):
+def delete_chat_entry(chat_id):
     """Delete a specific chat entry"""
-    if 0 <= index < len(chat_history):
-        deleted_entry = chat_history.pop(index)
-        if save_chat_history_to_file(chat_history):
-            st.session_state.chat_history = chat_history
-            return True
-    return False
-
-def export_chat_history(chat_history):
-    """Export chat history as JSON"""
-    try:
-        export_data = {
-            'user': st.session_state.username,
-            'export_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'total_conversations': len(chat_history),
-            'conversations': chat_history
-        }
-        return json.dumps(export_data, indent=2)
-    except Exception as e:
-        st.error(f"Error exporting chat history: {str(e)}")
-        return None
+    return get_chat_store().delete(st.session_state.username, chat_id)
+
+def export_chat_history(username):
+    """Export chat history as JSON; only runs when the download button is clicked"""
+    chat_history = get_chat_store().conversations(username)
+    export_data = {
+        'user': username,
+        'export_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'total_conversations': len(chat_history),
+        'conversations': chat_history
+    }
+    return json.dumps(export_data, indent=2)
 
-# Load chat history
-chat_history = load_chat_history_from_file()
+# Load chat history statistics; conversations themselves are fetched one page at a time
+total_conversations, (first_chat, latest_chat) = load_chat_summary()
 
 # Sidebar navigation
 with st.sidebar:
@@ -104,13 +88,12 @@ with st.sidebar:
     
     # Chat statistics
     st.write("### 📊 Statistics")
-    st.metric("Total Conversations", len(chat_history))
+    st.metric("Total Conversations", total_conversations)
     
-    if chat_history:
+    if total_conversations:
         # Date range
-        dates = [datetime.strptime(chat['timestamp'], "%Y-%m-%d %H:%M:%S") for chat in chat_history]
-        earliest = min(dates).strftime("%Y-%m-%d")
-        latest = max(dates).strftime("%Y-%m-%d")
+        earliest = datetime.strptime(first_chat, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
+        latest = datetime.strptime(latest_chat, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
         
         st.write(f"**First Chat:** {earliest}")
         st.write(f"**Latest Chat:** {latest}")
@@ -121,19 +104,18 @@ with st.sidebar:
     st.write("### 🔧 Actions")
     
     # Export button
-    if chat_history:
-        export_data = export_chat_history(chat_history)
-        if export_data:
-            st.download_button(
-                label="📥 Export Chat History",
-                data=export_data,
-                file_name=f"{st.session_state.username}_chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                mime="application/json",
-                use_container_width=True
-            )
+    if total_conversations:
+        username = st.session_state.username
+        st.download_button(
+            label="📥 Export Chat History",
+            data=lambda: export_chat_history(username),
+            file_name=f"{username}_chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json",
+            use_container_width=True
+        )
     
     # Clear all button
-    if chat_history:
+    if total_conversations:
         if st.button("🗑️ Clear All History", use_container_width=True, type="secondary"):
             st.session_state.show_clear_confirm = True
 
@@ -144,7 +126,7 @@ if st.session_state.get('show_clear_confirm', False):
         col1, col2 = st.columns(2)
         with col1:
             if st.button("✅ Yes", use_container_width=True):
-                if save_chat_history_to_file([]):
+                if clear_chat_history():
                     st.session_state.chat_history = []
                     st.session_state.show_clear_confirm = False
                     st.success("All chat history cleared!")
@@ -158,7 +140,7 @@ if st.session_state.get('show_clear_confirm', False):
 st.title("💬 Chat History")
 st.write(f"Viewing chat history for: **{st.session_state.username}**")
 
-if not chat_history:
+if not total_conversations:
     st.info("📋 No chat history found. Start chatting in the main application to see your conversations here!")
     
     if st.button("🏠 Go to Main Application"):
@@ -171,41 +153,42 @@ else:
         search_term = st.text_input("🔍 Search conversations", placeholder="Search in questions or answers...")
     
     with col2:
-        sort_order = st.selectbox("📅 Sort by", ["Newest First", "Oldest First"])
+        sort_label = st.selectbox("📅 Sort by", list(SORT_OPTIONS))
     
     with col3:
         items_per_page = st.selectbox("📄 Items per page", [10, 25, 50, 100])
     
-    # Filter chat history based on search
+    # Searching, sorting and paging all run in the chat store's SQL queries
+    chat_store = get_chat_store()
+    sort_order = SORT_OPTIONS[sort_label]
     if search_term:
-        filtered_history = [
-            chat for chat in chat_history 
-            if search_term.lower() in chat['question'].lower() or search_term.lower() in chat['answer'].lower()
-        ]
+        total_items, too_many_matches, sort_order = chat_store.count_matches(
+            st.session_state.username, search_term, sort_order
+        )
     else:
-        filtered_history = chat_history.copy()
-    
-    # Sort chat history
-    if sort_order == "Newest First":
-        filtered_history.reverse()
+        total_items = total_conversations
+        too_many_matches = False
     
     # Pagination
-    total_items = len(filtered_history)
     total_pages = (total_items - 1) // items_per_page + 1 if total_items > 0 else 1
     
     if total_items > items_per_page:
         page = st.selectbox(f"Page (1-{total_pages})", range(1, total_pages + 1))
         start_idx = (page - 1) * items_per_page
         end_idx = min(start_idx + items_per_page, total_items)
-        page_history = filtered_history[start_idx:end_idx]
     else:
-        page_history = filtered_history
         start_idx = 0
         end_idx = total_items
+    page_history = chat_store.search(
+        st.session_state.username, search_term, sort_order, limit=end_idx - start_idx, offset=start_idx
+    )
     
     # Display results info
     if search_term:
-        st.write(f"Found **{total_items}** conversations matching '{search_term}'")
+        if too_many_matches:
+            st.write(f"Found more than **{MAX_COUNTED_MATCHES}** conversations matching '{search_term}'; showing the newest. Refine your search to narrow them down.")
+        else:
+            st.write(f"Found **{total_items}** conversations matching '{search_term}'")
     
     if total_items > items_per_page:
         st.write(f"Showing {start_idx + 1}-{end_idx} of {total_items} conversations")
@@ -213,9 +196,7 @@ else:
     st.divider()
     
     # Display chat history
-    for i, chat in enumerate(page_history):
-        original_index = chat_history.index(chat) if sort_order == "Oldest First" else len(chat_history) - 1 - chat_history.index(chat)
-        
+    for chat in page_history:
         with st.expander(f"💬 {chat['timestamp']} - {chat['question'][:100]}{'...' if len(chat['question']) > 100 else ''}", expanded=False):
             col1, col2 = st.columns([4, 1])
             
@@ -232,18 +213,18 @@ else:
                 st.write("### Actions")
                 
                 # Copy question button
-                if st.button(f"📋 Copy Q", key=f"copy_q_{i}"):
+                if st.button(f"📋 Copy Q", key=f"copy_q_{chat['id']}"):
                     # Note: Streamlit doesn't have native clipboard support
                     # You could implement this with JavaScript if needed
                     st.info("Question copied to clipboard! (Note: Feature requires JavaScript implementation)")
                 
                 # Copy answer button
-                if st.button(f"📋 Copy A", key=f"copy_a_{i}"):
+                if st.button(f"📋 Copy A", key=f"copy_a_{chat['id']}"):
                     st.info("Answer copied to clipboard! (Note: Feature requires JavaScript implementation)")
                 
                 # Delete button
-                if st.button(f"🗑️ Delete", key=f"delete_{i}", type="secondary"):
-                    if delete_chat_entry(original_index, chat_history):
+                if st.button(f"🗑️ Delete", key=f"delete_{chat['id']}", type="secondary"):
+                    if delete_chat_entry(chat['id']):
                         st.success("Chat deleted!")
                         st.rerun()
                     else:
@@ -0,0 +1,95 @@
+import streamlit as st
+import os
+from datetime import datetime
+from modules.metrics import METRICS_ENABLED, METRICS_FILE, METRICS_PORT, STAGES, get_metrics
+
+
+# Set page config
+st.set_page_config(
+    page_title="Metrics - AI LECTURER SUPPORT SYSTEM",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+# Check authentication
+if not st.session_state.get('authenticated', False):
+    st.switch_page("pages/login.py")
+
+# Comma-separated usernames allowed to see this page; everyone signed in when unset
+METRICS_ADMIN_USERS = [user.strip() for user in os.getenv("METRICS_ADMIN_USERS", "").split(",") if user.strip()]
+
+# Recent stage runs listed at the bottom of the page
+RECENT_RUNS_SHOWN = 50
+
+# Sidebar navigation
+with st.sidebar:
+    st.write("### Navigation")
+
+    if st.button("🏠 Back to Main", use_container_width=True):
+        st.switch_page("app.py")
+
+st.title("📈 Pipeline Metrics")
+
+if METRICS_ADMIN_USERS and st.session_state.username not in METRICS_ADMIN_USERS:
+    st.error("🚫 This page is only available to administrators.")
+    st.stop()
+
+if not METRICS_ENABLED:
+    st.info("ℹ️ Metrics are off. Set METRICS_ENABLED=1 and restart the app to record stage timings.")
+    st.stop()
+
+exports = [f"file `{METRICS_FILE}`"] if METRICS_FILE else []
+if METRICS_PORT:
+    exports.append(f"http://<host>:{METRICS_PORT}/metrics")
+if exports:
+    st.caption("Prometheus text export: " + ", ".join(exports))
+
+metrics = get_metrics()
+summary = metrics.stage_summary()
+
+if st.button("🔄 Refresh"):
+    st.rerun()
+
+# Per-stage totals since the app started; percentiles over the most recent runs
+st.write("### ⏱️ Stages")
+if summary:
+    stage_order = list(STAGES) + sorted(stage for stage in summary if stage not in STAGES)
+    rows = []
+    for stage in stage_order:
+        entry = summary.get(stage)
+        if entry is None:
+            continue
+        rows.append({
+            "stage": stage,
+            "runs": entry["runs"],
+            "total (s)": round(entry["total_seconds"], 3),
+            "mean (ms)": round(entry["mean_seconds"] * 1000, 1),
+            "recent p50 (ms)": round(entry["recent_p50_seconds"] * 1000, 1) if entry["recent_p50_seconds"] is not None else None,
+            "recent p99 (ms)": round(entry["recent_p99_seconds"] * 1000, 1) if entry["recent_p99_seconds"] is not None else None,
+        })
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+else:
+    st.info("No stage has run yet. Ask a question or load a dataset to record some.")
+
+with st.expander("📄 Prometheus text", expanded=False):
+    st.code(metrics.render(), language="text")
+
+st.write("### 🧾 Recent Runs")
+recent = metrics.recent_spans(RECENT_RUNS_SHOWN)
+if recent:
+    st.dataframe(
+        [
+            {
+                "time": datetime.fromtimestamp(run["time"]).strftime("%H:%M:%S"),
+                "stage": run["stage"],
+                "ms": round(run["seconds"] * 1000, 1),
+                "labels": ", ".join(f"{name}={value}" for name, value in run["labels"].items()),
+                "sizes": ", ".join(f"{name}={value}" for name, value in run["sizes"].items()),
+            }
+            for run in reversed(recent)
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+else:
+    st.info("No runs recorded yet.")
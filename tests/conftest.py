@@ -0,0 +1,13 @@
+import os
+
+# Index with local embeddings: no API key or network needed
+os.environ["EMBEDDING_BACKEND"] = "hashing"
+os.environ.setdefault("GROQ_API_KEY", "test")
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(tmp_path, monkeypatch):
+    """Run every test in its own directory, where the caches and vectorstores are created."""
+    monkeypatch.chdir(tmp_path)
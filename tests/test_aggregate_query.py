@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+
+from modules.aggregate_query import parse_aggregate_query, run_aggregate_query
+from modules.query_parsing import build_value_index
+
+
+@pytest.fixture
+def df():
+    df = pd.DataFrame({
+        "Department": ["Physics", "Physics", "Chemistry", "Chemistry"],
+        "Lecturers Name": ["Dr Ada Obi", "Dr Ben Eze", "Dr Ada Obi", "Dr Ben Eze"],
+        "Punctuality": [4, 5, 3, 2],
+        "Missed Classes": [1, 0, 2, 3],
+    })
+    df.attrs["value_index"] = build_value_index({
+        "Department": df["Department"].unique(), "Lecturers Name": df["Lecturers Name"].unique(),
+    })
+    return df
+
+
+@pytest.mark.parametrize("question, aggregation, metrics", [
+    ("What is the total number of missed classes per department", "sum", ["Missed Classes"]),
+    ("Sum of missed classes by department", "sum", ["Missed Classes"]),
+    ("What is the maximum number of missed classes", "max", ["Missed Classes"]),
+    ("Average number of missed classes per department", "mean", ["Missed Classes"]),
+    ("How many responses per department", "count", []),
+    ("Total number of responses by department", "count", []),
+])
+def test_aggregation_is_read_from_the_question(df, question, aggregation, metrics):
+    query = parse_aggregate_query(question, df)
+    assert (query["aggregation"], query["metrics"]) == (aggregation, metrics)
+
+
+def test_total_of_a_rating_column_sums_it(df):
+    query = parse_aggregate_query("What is the total number of missed classes per department", df)
+    assert query["group_by"] == ["Department"]
+    table = run_aggregate_query(df, query)
+    assert dict(zip(table["Department"], table["Missed Classes"])) == {"Chemistry": 5, "Physics": 1}
+
+
+def test_named_entities_become_filters_or_groups(df):
+    query = parse_aggregate_query("Average punctuality of Ada Obi", df)
+    assert query["filters"] == {"Lecturers Name": ["Dr Ada Obi"]}
+    query = parse_aggregate_query("Compare punctuality of Ada Obi and Ben Eze", df)
+    assert query["aggregation"] == "mean"
+    assert query["group_by"] == ["Lecturers Name"]
+
+
+def test_questions_without_an_aggregate_go_to_retrieval(df):
+    assert parse_aggregate_query("What did students say about Dr Ada Obi", df) is None
+    assert parse_aggregate_query("What is the average", df) is None
@@ -0,0 +1,77 @@
+import pytest
+
+from modules import answer_cache
+from modules.answer_cache import AnswerCache
+
+# Normalized question -> embedding; the first two are close paraphrases
+VECTORS = {
+    "who is the most punctual lecturer": [1.0, 0.0, 0.0],
+    "which lecturer is most punctual": [0.98, 0.2, 0.0],
+    "who grades fairly": [0.0, 1.0, 0.0],
+}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_repeats_are_served_per_dataset_and_model():
+    cache = AnswerCache(similarity_threshold=0)
+    cache.put("ns1", "Who is the most punctual lecturer?", "Dr A", model="m")
+    assert cache.get("ns1", "who is the MOST punctual lecturer", model="m") == "Dr A"
+    assert cache.get("ns2", "Who is the most punctual lecturer?", model="m") is None
+    assert cache.get("ns1", "Who is the most punctual lecturer?", model="other") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = AnswerCache(ttl_seconds=60, similarity_threshold=0)
+    cache.put("ns", "Who grades fairly?", "Dr B")
+    clock[0] += 60
+    assert cache.get("ns", "Who grades fairly?") == "Dr B"
+    clock[0] += 1
+    assert cache.get("ns", "Who grades fairly?") is None
+    assert cache.stats()["expirations"] == 1 and cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = AnswerCache(max_entries=2, similarity_threshold=0)
+    cache.put("ns", "q1", "a1")
+    cache.put("ns", "q2", "a2")
+    cache.get("ns", "q1")
+    cache.put("ns", "q3", "a3")
+    assert [cache.get("ns", q) for q in ("q1", "q2", "q3")] == ["a1", None, "a3"]
+    assert cache.evictions == 1
+
+
+def test_invalidate_drops_one_dataset():
+    cache = AnswerCache(similarity_threshold=0)
+    cache.put("ns1", "q", "a1")
+    cache.put("ns2", "q", "a2")
+    cache.invalidate("ns1")
+    assert (cache.get("ns1", "q"), cache.get("ns2", "q")) == (None, "a2")
+
+
+@pytest.mark.parametrize("threshold, answer", [(0.95, "Dr A"), (0.99, None)])
+def test_paraphrases_reuse_answers_above_the_similarity_threshold(threshold, answer):
+    cache = AnswerCache(similarity_threshold=threshold, embed_query=VECTORS.__getitem__)
+    cache.put("ns", "Who is the most punctual lecturer?", "Dr A")
+    cache.put("ns", "Who grades fairly?", "Dr B")
+    assert cache.get("ns", "Which lecturer is most punctual?") == answer
+    assert cache.stats()["semantic_hits"] == (answer is not None)
+
+
+def test_paraphrases_are_not_matched_across_datasets():
+    cache = AnswerCache(similarity_threshold=0.5, embed_query=VECTORS.__getitem__)
+    cache.put("ns1", "Who is the most punctual lecturer?", "Dr A")
+    assert cache.get("ns2", "Which lecturer is most punctual?") is None
+
+
+def test_embeddings_are_not_used_with_a_zero_threshold():
+    cache = AnswerCache(similarity_threshold=0, embed_query=VECTORS.__getitem__)
+    cache.put("ns", "Who is the most punctual lecturer?", "Dr A")
+    assert cache.embed_query is None
+    assert cache.get("ns", "Which lecturer is most punctual?") is None
@@ -0,0 +1,114 @@
+import json
+import os
+
+import pytest
+
+from modules import chat_store
+from modules.chat_store import ChatHistoryStore, import_legacy_history
+
+
+@pytest.fixture
+def store():
+    return ChatHistoryStore("chats.sqlite3", compact_interval=3600)
+
+
+def test_duplicate_exchanges_are_rejected_per_user(store):
+    assert store.append("ada", "Who is punctual?", "Dr A") is not None
+    assert store.append("ada", "Who is punctual?", "Dr A") is None
+    assert store.append("ben", "Who is punctual?", "Dr A") is not None
+    assert store.append("ada", "Who is punctual?", "Dr B") is not None
+    assert store.count("ada") == 2
+
+
+def test_a_deleted_exchange_can_be_saved_again(store):
+    chat_id = store.append("ada", "Who is punctual?", "Dr A")
+    assert store.delete("ada", chat_id)
+    assert store.append("ada", "Who is punctual?", "Dr A") is not None
+    assert store.count("ada") == 1
+
+
+def test_deletes_only_mark_rows_until_compaction(store):
+    first = store.append("ada", "q1", "a1")
+    store.append("ada", "q2", "a2")
+    assert not store.delete("ben", first)
+    assert store.delete("ada", first)
+    assert [chat["question"] for chat in store.conversations("ada")] == ["q2"]
+    assert store._conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0] == 2
+
+    assert store.compact() == 1
+    assert store._conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0] == 1
+    assert [chat["question"] for chat in store.conversations("ada")] == ["q2"]
+
+
+def test_clear_and_compact_when_due(store):
+    store.append("ada", "q1", "a1")
+    store.append("ben", "q1", "a1")
+    store.compact_interval = 0
+    store.clear("ada")
+    assert store.count("ada") == 0
+    assert store.count("ben") == 1
+    assert store._conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0] == 1
+
+
+def test_legacy_history_is_imported_once(store, monkeypatch):
+    monkeypatch.setattr(chat_store, "_chat_store", store)
+    os.makedirs(chat_store.CHAT_HISTORY_DIR)
+    path = os.path.join(chat_store.CHAT_HISTORY_DIR, "ada_chat_history.json")
+    chats = [
+        {"timestamp": "2024-01-01 10:00:00", "question": "q1", "answer": "a1"},
+        {"timestamp": "2024-01-02 10:00:00", "question": "q2", "answer": "a2"},
+        {"timestamp": "2024-01-03 10:00:00", "question": "q1", "answer": "a1"},
+    ]
+    with open(path, "w") as f:
+        json.dump(chats, f)
+
+    import_legacy_history("ada")
+    assert not os.path.exists(path)
+    assert os.path.exists(path + ".imported")
+    assert [chat["timestamp"] for chat in store.conversations("ada")] == ["2024-01-01 10:00:00", "2024-01-02 10:00:00"]
+
+    import_legacy_history("ada")
+    assert store.count("ada") == 2
+
+
+@pytest.fixture
+def history(store):
+    for i in range(1, 6):
+        store.append("ada", f"question {i} about punctuality", f"answer {i}")
+    store.append("ada", "question about grading", "answer punctuality punctuality punctuality")
+    store.append("ben", "question about punctuality", "answer")
+    return store
+
+
+def questions(chats):
+    return [chat["question"] for chat in chats]
+
+
+def test_search_pages_through_matches_in_order(history):
+    assert history.count("ada", "punctual") == 6
+    newest = history.search("ada", "punctual", "newest", limit=2, offset=1)
+    assert questions(newest) == ["question 5 about punctuality", "question 4 about punctuality"]
+    oldest = history.search("ada", "punctual", "oldest", limit=2, offset=4)
+    assert questions(oldest) == ["question 5 about punctuality", "question about grading"]
+    assert history.search("ada", "punctual", "relevance", limit=1)[0]["question"] == "question about grading"
+    assert questions(history.search("ada", "grading")) == ["question about grading"]
+
+
+def test_search_index_follows_deletes_and_compaction(history):
+    chat_id = history.search("ada", "grading")[0]["id"]
+    history.delete("ada", chat_id)
+    assert history.search("ada", "grading") == []
+    assert history.count("ada", "punctual") == 5
+
+    history.compact()
+    assert history.search("ada", "grading") == []
+    fts_rows = history._conn.execute("SELECT COUNT(*) FROM chats_fts WHERE chats_fts MATCH 'grading'").fetchone()[0]
+    assert fts_rows == 0
+    history.append("ada", "question about grading", "answer punctuality punctuality punctuality")
+    assert len(history.search("ada", "grading")) == 1
+
+
+def test_broad_searches_stop_counting_and_fall_back_from_relevance(history):
+    assert history.count_matches("ada", "punctual", "relevance", limit=10) == (6, False, "relevance")
+    assert history.count_matches("ada", "punctual", "relevance", limit=3) == (3, True, "newest")
+    assert history.count_matches("ada", "punctual", "oldest", limit=3) == (3, True, "oldest")
@@ -0,0 +1,60 @@
+from collections import Counter
+import os
+
+import pandas as pd
+import pytest
+
+from modules import data_loader
+from modules.data_loader import iter_excel_batches
+from modules.data_processing import iter_documents
+
+# A blank Year makes pandas infer floats for the batch it lands in
+ROWS = {
+    "Lecturers Name": ["Dr A", "Dr B", "Dr C", "Dr A", "Dr B", "Dr C"],
+    "Year": [2020, 2021, 2022, 2020, None, 2022],
+    "Punctuality": [4, 5, 3, 4, 5, 2],
+}
+
+
+def ingested(file_path, batch_size):
+    """Return the row ids and texts ingestion produces for a file."""
+    seen = Counter()
+    documents = [doc for df in iter_excel_batches(file_path, batch_size) for doc in iter_documents(df, seen)]
+    return [doc.metadata["row_id"] for doc in documents], [doc.page_content for doc in documents]
+
+
+@pytest.fixture(params=["csv", "xlsx"])
+def data_file(request, tmp_path):
+    path = tmp_path / f"feedback.{request.param}"
+    df = pd.DataFrame(ROWS).astype({"Year": "Int64"})
+    if request.param == "csv":
+        df.to_csv(path, index=False)
+    else:
+        df.to_excel(path, index=False)
+    return str(path)
+
+
+def test_rows_read_the_same_whatever_the_batch_size(data_file):
+    ids, texts = ingested(data_file, 4)
+    assert (ids, texts) == ingested(data_file, 1)
+    assert (ids, texts) == ingested(data_file, 100)
+    assert texts[0].splitlines()[1] == "Year: 2020"
+    assert texts[4].splitlines()[1] == "Year: nan"
+
+
+def test_rows_read_the_same_with_a_frame_cached(data_file):
+    pytest.importorskip("pyarrow")
+    expected = ingested(data_file, 4)
+    data_loader.load_excel_data(data_file)
+    assert os.path.exists(data_loader.sidecar_path(data_file))
+    assert ingested(data_file, 4) == expected
+
+
+def test_frames_parsed_by_different_engines_are_cached_apart(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path / "feedback.xlsx")
+    pd.DataFrame(ROWS).to_excel(path, index=False)
+    monkeypatch.setattr(data_loader, "EXCEL_ENGINE", "openpyxl")
+    openpyxl_sidecar = data_loader.sidecar_path(path)
+    monkeypatch.setattr(data_loader, "EXCEL_ENGINE", "calamine")
+    assert data_loader.sidecar_path(path) != openpyxl_sidecar
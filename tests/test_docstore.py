@@ -0,0 +1,85 @@
+import os
+
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+
+from modules.docstore import DOCSTORE_FILE, ColumnarDocstore, has_docstore, write_docstore
+
+
+def saved(directory, documents):
+    """Write documents, keyed by id in position order, and open them as a ColumnarDocstore."""
+    os.makedirs(directory, exist_ok=True)
+    write_docstore(directory, InMemoryDocstore(dict(documents)), dict(enumerate(documents)))
+    return ColumnarDocstore(directory)
+
+
+DOCUMENTS = {
+    "row:b": Document(page_content="Dr B was late", metadata={"Department": "Physics"}),
+    "summary:a": Document(page_content="Summary for Dr A", metadata={"doc_type": "summary"}),
+    "row:a": Document(page_content="Dr A was punctual ✓", metadata={}),
+    "summary:b": Document(page_content="Summary for Dr B", metadata={"doc_type": "summary"}),
+}
+
+
+def test_saved_documents_read_back_by_id_and_position():
+    docstore = saved("v1", DOCUMENTS)
+    assert has_docstore("v1")
+    for doc_id, doc in DOCUMENTS.items():
+        found = docstore.search(doc_id)
+        assert (found.id, found.page_content, found.metadata) == (doc_id, doc.page_content, doc.metadata)
+    assert list(docstore.index_to_docstore_id.values()) == list(DOCUMENTS)
+    assert {doc_id: docstore.id_positions[doc_id] for doc_id in DOCUMENTS} == {"row:b": 0, "summary:a": 1, "row:a": 2, "summary:b": 3}
+    assert docstore.search("row:c") == "ID row:c not found."
+    assert "row:c" not in docstore.id_positions
+
+
+def test_with_prefix_returns_sorted_positions():
+    docstore = saved("v1", DOCUMENTS)
+    assert docstore.id_positions.with_prefix("summary:").tolist() == [1, 3]
+    assert docstore.id_positions.with_prefix("row:").tolist() == [0, 2]
+    assert docstore.id_positions.with_prefix("other:").tolist() == []
+
+
+def test_added_and_deleted_documents_overlay_the_saved_ones():
+    docstore = saved("v1", DOCUMENTS)
+    copy = docstore.copy()
+    docstore.add({"row:c": Document(page_content="Dr C", metadata={})})
+    docstore.delete(["row:a"])
+
+    assert docstore.search("row:c").page_content == "Dr C"
+    assert docstore.search("row:a") == "ID row:a not found."
+    assert docstore.record("row:c") is None and docstore.record("row:a") is None
+    with pytest.raises(ValueError):
+        docstore.add({"row:b": Document(page_content="again")})
+    docstore.add({"row:a": Document(page_content="Dr A again")})
+    assert docstore.search("row:a").page_content == "Dr A again"
+    # A copy keeps its own overlay
+    assert copy.search("row:a").page_content == "Dr A was punctual ✓"
+    assert copy.search("row:c") == "ID row:c not found."
+
+
+def test_resave_copies_unchanged_records_and_writes_the_overlay():
+    docstore = saved("v1", DOCUMENTS)
+    docstore.delete(["summary:a"])
+    docstore.add({"row:c": Document(page_content="Dr C", metadata={"Year": "2020"})})
+    ids = {0: "row:b", 1: "row:a", 2: "summary:b", 3: "row:c"}
+
+    os.makedirs("v2")
+    write_docstore("v2", docstore, ids)
+    resaved = ColumnarDocstore("v2")
+    assert list(resaved.index_to_docstore_id.values()) == list(ids.values())
+    for doc_id in ("row:b", "row:a", "summary:b"):
+        assert resaved.record(doc_id) == docstore.record(doc_id)
+    assert resaved.search("row:c").metadata == {"Year": "2020"}
+    assert resaved.search("summary:a") == "ID summary:a not found."
+
+
+def test_empty_docstore():
+    docstore = saved("empty", {})
+    assert os.path.getsize(os.path.join("empty", DOCSTORE_FILE)) == 0
+    assert len(docstore.index_to_docstore_id) == len(docstore.id_positions) == 0
+    assert docstore.search("row:a") == "ID row:a not found."
+    assert docstore.id_positions.with_prefix("summary:").tolist() == []
+    docstore.add({"row:a": Document(page_content="Dr A")})
+    assert docstore.search("row:a").page_content == "Dr A"
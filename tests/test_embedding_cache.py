@@ -0,0 +1,72 @@
+import itertools
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from modules import embedding_cache
+from modules.embedding_cache import CachedEmbeddings, EmbeddingCache, text_hash
+
+
+class FakeEmbeddings(Embeddings):
+    """Embeds a text as [its length, 0.5], remembering every text it embedded."""
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded += texts
+        return [[float(len(text)), 0.5] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 0.5]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Make every time.time() call in the cache one second later than the last."""
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: float(next(ticks)))
+
+
+def cached_keys(cache, model, texts):
+    return set(cache.get_many(model, [text_hash(text) for text in texts]))
+
+
+def test_vectors_are_cached_per_model():
+    cache = EmbeddingCache("cache.sqlite3")
+    cache.put_many("model-a", [(text_hash("x"), [1.0, 0.5])])
+    assert cache.get_many("model-a", [text_hash("x")]) == {text_hash("x"): [1.0, 0.5]}
+    assert cache.get_many("model-b", [text_hash("x")]) == {}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_repeated_texts_are_embedded_once_and_then_served_from_the_cache():
+    fake = FakeEmbeddings()
+    embeddings = CachedEmbeddings(fake, EmbeddingCache("cache.sqlite3"), "fake")
+    assert embeddings.embed_documents(["ab", "c", "ab"]) == [[2.0, 0.5], [1.0, 0.5], [2.0, 0.5]]
+    assert fake.embedded == ["ab", "c"]
+
+    fake.embedded.clear()
+    assert embeddings.embed_documents(["c", "abc"]) == [[1.0, 0.5], [3.0, 0.5]]
+    assert fake.embedded == ["abc"]
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = EmbeddingCache("cache.sqlite3", max_entries=3)
+    for text in ("a", "b", "c"):
+        cache.put_many("fake", [(text_hash(text), [1.0])])
+    cache.get_many("fake", [text_hash("a")])
+
+    cache.put_many("fake", [(text_hash("d"), [1.0])])
+    assert cached_keys(cache, "fake", "abcd") == {text_hash(text) for text in "acd"}
+    assert cache.stats()["entries"] == 3
+    assert cache.evictions == 1
+
+
+def test_eviction_counts_entries_added_by_other_processes(clock):
+    first = EmbeddingCache("cache.sqlite3", max_entries=4)
+    second = EmbeddingCache("cache.sqlite3", max_entries=4)
+    for i in range(5):
+        (first if i % 2 else second).put_many("fake", [(text_hash(str(i)), [1.0])])
+    assert len(cached_keys(first, "fake", "01234")) == 4
+    assert first.stats()["entries"] == 4
@@ -0,0 +1,81 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from modules.embedding_executor import ConcurrentEmbeddings
+
+
+class ServerError(Exception):
+    status_code = 503
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+class FakeEmbeddings(Embeddings):
+    """Embeds a text as [its number], failing the first calls with the given errors."""
+
+    def __init__(self, errors=(), delay=0.0):
+        self.errors = list(errors)
+        self.delay = delay
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            error = self.errors.pop(0) if self.errors else None
+        try:
+            time.sleep(self.delay)
+            if error is not None:
+                raise error
+            return [[float(text)] for text in texts]
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def executor(embeddings, **options):
+    return ConcurrentEmbeddings(embeddings, requests_per_second=0, backoff_seconds=0, **options)
+
+
+def test_transient_errors_are_retried():
+    embeddings = FakeEmbeddings([ServerError(), ConnectionError()])
+    concurrent = executor(embeddings)
+    assert concurrent.embed_query("7") == [7.0]
+    assert embeddings.calls == 3
+    assert concurrent.stats() == {"requests": 3, "retries": 2, "failures": 0}
+
+
+def test_other_errors_are_raised_at_once():
+    embeddings = FakeEmbeddings([BadRequest()])
+    concurrent = executor(embeddings)
+    with pytest.raises(BadRequest):
+        concurrent.embed_documents(["1", "2"])
+    assert embeddings.calls == 1
+    assert concurrent.stats()["failures"] == 1
+
+
+def test_vectors_keep_the_order_of_the_texts_across_batches():
+    texts = [str(i) for i in range(50)]
+    concurrent = executor(FakeEmbeddings([ServerError()]), batch_size=3, max_workers=4)
+    assert concurrent.embed_documents(texts) == [[float(i)] for i in range(50)]
+
+
+def test_requests_in_flight_are_bounded_across_callers():
+    embeddings = FakeEmbeddings(delay=0.01)
+    concurrent = executor(embeddings, batch_size=1, max_workers=2)
+    with ThreadPoolExecutor(max_workers=4) as callers:
+        list(callers.map(concurrent.embed_documents, [["1", "2", "3", "4"]] * 4))
+    assert embeddings.max_in_flight <= 2
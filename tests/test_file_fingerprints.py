@@ -0,0 +1,70 @@
+import os
+import time
+
+import pytest
+
+from modules import file_fingerprints
+from modules.file_fingerprints import FingerprintCache, hash_file
+
+
+@pytest.fixture
+def hashed(monkeypatch):
+    """Record the path of every file the cache hashes."""
+    paths = []
+
+    def counting_hash_file(file_path, block_size=file_fingerprints.HASH_BLOCK_SIZE):
+        paths.append(file_path)
+        return hash_file(file_path, block_size)
+
+    monkeypatch.setattr(file_fingerprints, "hash_file", counting_hash_file)
+    return paths
+
+
+def write(path, content, mtime=None):
+    """Write a file and set its mtime, by default a minute ago."""
+    with open(path, "w") as f:
+        f.write(content)
+    mtime = time.time() - 60 if mtime is None else mtime
+    os.utime(path, (mtime, mtime))
+
+
+def test_unchanged_files_are_not_hashed_again(hashed):
+    write("data.csv", "a,b\n1,2\n")
+    cache = FingerprintCache("fingerprints.sqlite3")
+    digest = cache.fingerprint("data.csv")
+    assert digest == hash_file("data.csv")
+    assert cache.fingerprint("data.csv") == digest
+    # Another process sharing the table finds it too
+    assert FingerprintCache("fingerprints.sqlite3").fingerprint("data.csv") == digest
+    assert hashed == ["data.csv"]
+
+
+# The first changes the size only, the second the mtime only
+@pytest.mark.parametrize("content, mtime", [("a,b\n1,2\n3,4\n", 1_600_000_000), ("a,b\n9,9\n", 1_600_000_001)])
+def test_a_size_or_mtime_change_is_hashed_again(hashed, content, mtime):
+    write("data.csv", "a,b\n1,2\n", 1_600_000_000)
+    cache = FingerprintCache("fingerprints.sqlite3")
+    before = cache.fingerprint("data.csv")
+    write("data.csv", content, mtime)
+    assert cache.fingerprint("data.csv") == hash_file("data.csv") != before
+    assert len(hashed) == 2
+
+
+def test_files_written_just_now_are_not_cached(hashed):
+    write("data.csv", "a,b\n1,2\n", time.time())
+    cache = FingerprintCache("fingerprints.sqlite3")
+    cache.fingerprint("data.csv")
+    cache.fingerprint("data.csv")
+    assert len(hashed) == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_oldest_entries_are_dropped_beyond_max_entries(hashed):
+    cache = FingerprintCache("fingerprints.sqlite3", max_entries=2)
+    for name in ("a.csv", "b.csv", "c.csv"):
+        write(name, name)
+        cache.fingerprint(name)
+    assert cache.stats()["entries"] == 2
+    cache.fingerprint("c.csv")
+    cache.fingerprint("a.csv")
+    assert hashed == ["a.csv", "b.csv", "c.csv", "a.csv"]
@@ -0,0 +1,15 @@
+from modules.metrics import MetricsRegistry
+
+
+def test_samples_of_a_metric_reported_by_several_collectors_are_contiguous():
+    registry = MetricsRegistry()
+    registry.observe("embed", 0.2, sizes={"documents": 3})
+    registry.add_collector(lambda: [("cache_entries", {"cache": "embedding"}, 5, "gauge")])
+    registry.add_collector(lambda: [("jobs", {}, 1, "gauge"), ("cache_entries", {"cache": "answer"}, 2, "gauge")])
+    lines = [line for line in registry.render().splitlines() if "stage_duration" not in line]
+
+    types = [line for line in lines if line.startswith("# TYPE")]
+    assert types.count("# TYPE lecturer_support_cache_entries gauge") == 1
+    names = [line.split("{")[0].split()[0] for line in lines if not line.startswith("#")]
+    runs = [name for i, name in enumerate(names) if i == 0 or names[i - 1] != name]
+    assert len(runs) == len(set(runs)) == len(types)
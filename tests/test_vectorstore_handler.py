@@ -0,0 +1,155 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+from langchain.schema import Document
+
+from modules import vectorstore_handler
+from modules.data_processing import df_to_document
+from modules.lexical_index import LEXICAL_INDEX_FILENAME
+from modules.partition_index import PARTITION_INDEX_FILENAME
+from modules.vectorstore_handler import (
+    INDEX_META_FILE, ROW_MAP_FILE, SNAPSHOT_FILE, create_vectorstore, load_manifest, load_row_map, load_vectorstore,
+    namespace_dir, prune_namespaces, save_vectorstore, sync_vectorstore,
+)
+from modules.local_embeddings import HashingEmbeddings
+
+
+class CountingEmbeddings(HashingEmbeddings):
+    """Hashing embeddings that remember every text they embedded."""
+
+    def __init__(self, dimension):
+        super().__init__(dimension)
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded += texts
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    embeddings = CountingEmbeddings(vectorstore_handler.HASHING_EMBEDDING_DIMENSION)
+    monkeypatch.setattr(vectorstore_handler, "_embeddings", embeddings)
+    return embeddings
+
+
+def feedback(*rows):
+    """Documents for rows of (lecturer, punctuality), in batches of two rows."""
+    df = pd.DataFrame(rows, columns=["Lecturers Name", "Punctuality"])
+    documents = df_to_document(df)
+    return [documents[start:start + 2] for start in range(0, len(documents), 2)]
+
+
+def documents(*texts):
+    return [Document(page_content=text, metadata={"row_id": f"row{i}"}) for i, text in enumerate(texts)]
+
+
+def current_snapshot(namespace):
+    with open(os.path.join(namespace_dir(namespace), SNAPSHOT_FILE)) as f:
+        return os.path.join(namespace_dir(namespace), json.load(f)["snapshot"])
+
+
+def test_every_saved_file_is_in_the_snapshot():
+    create_vectorstore(documents("Dr A was punctual", "Dr B was late"), "ns")
+    snapshot = current_snapshot("ns")
+    for name in (INDEX_META_FILE, ROW_MAP_FILE, LEXICAL_INDEX_FILENAME, PARTITION_INDEX_FILENAME):
+        assert os.path.exists(os.path.join(snapshot, name))
+        assert not os.path.exists(os.path.join(namespace_dir("ns"), name))
+    assert vectorstore_handler.vectorstore_directory(load_vectorstore("ns")) == snapshot
+
+
+def test_files_not_given_are_carried_over_to_the_next_snapshot():
+    vs = create_vectorstore(documents("Dr A was punctual", "Dr B was late"), "ns")
+    first = current_snapshot("ns")
+    save_vectorstore(vs, "ns")
+    second = current_snapshot("ns")
+    assert second != first
+    assert load_row_map("ns") == {"row0": ["row0:0"], "row1": ["row1:0"]}
+    for name in (LEXICAL_INDEX_FILENAME, PARTITION_INDEX_FILENAME):
+        assert os.path.exists(os.path.join(second, name))
+
+
+def test_first_sync_adds_every_row(embeddings):
+    vs, changes = sync_vectorstore(None, feedback(("Dr A", 4), ("Dr B", 5), ("Dr C", 3)), "ns")
+    assert changes == {"added": 3, "removed": 0, "unchanged": 0, "summaries_updated": 0}
+    assert vs.index.ntotal == 3
+    assert len(embeddings.embedded) == 3
+
+
+def test_resync_embeds_only_changed_rows(embeddings):
+    vs, _ = sync_vectorstore(None, feedback(("Dr A", 4), ("Dr B", 5), ("Dr C", 3)), "ns")
+    embeddings.embedded.clear()
+
+    vs, changes = sync_vectorstore(vs, feedback(("Dr A", 4), ("Dr B", 2), ("Dr C", 3), ("Dr D", 1)), "ns")
+    assert changes == {"added": 2, "removed": 1, "unchanged": 2, "summaries_updated": 0}
+    assert embeddings.embedded == ["Lecturers Name: Dr B\nPunctuality: 2", "Lecturers Name: Dr D\nPunctuality: 1"]
+    texts = {vs.docstore.search(doc_id).page_content for doc_id in vs.index_to_docstore_id.values()}
+    assert "Lecturers Name: Dr B\nPunctuality: 5" not in texts
+    assert len(texts) == vs.index.ntotal == 4
+
+
+def test_unchanged_file_is_not_saved_again(embeddings):
+    rows = (("Dr A", 4), ("Dr B", 5))
+    vs, _ = sync_vectorstore(None, feedback(*rows), "ns")
+    snapshot = current_snapshot("ns")
+    embeddings.embedded.clear()
+
+    same, changes = sync_vectorstore(vs, feedback(*rows), "ns")
+    assert changes == {"added": 0, "removed": 0, "unchanged": 2, "summaries_updated": 0}
+    assert same is vs
+    assert embeddings.embedded == []
+    assert current_snapshot("ns") == snapshot
+
+
+def test_duplicate_rows_keep_their_own_ids(embeddings):
+    vs, changes = sync_vectorstore(None, feedback(("Dr A", 4), ("Dr A", 4), ("Dr A", 4)), "ns")
+    assert changes["added"] == 3
+    ids = sorted(load_row_map("ns"))
+    assert [row.partition("#")[2] for row in ids] == ["", "1", "2"]
+    assert len({row.partition("#")[0] for row in ids}) == 1
+
+    embeddings.embedded.clear()
+    vs, changes = sync_vectorstore(vs, feedback(("Dr A", 4), ("Dr A", 4)), "ns")
+    assert changes == {"added": 0, "removed": 1, "unchanged": 2, "summaries_updated": 0}
+    assert sorted(load_row_map("ns")) == ids[:2]
+    assert embeddings.embedded == []
+
+
+def test_new_version_starts_from_the_previous_index(embeddings):
+    vs, _ = sync_vectorstore(None, feedback(("Dr A", 4), ("Dr B", 5)), "v1")
+    embeddings.embedded.clear()
+
+    new, changes = sync_vectorstore(vs, feedback(("Dr A", 4), ("Dr B", 1)), "v2", base_namespace="v1")
+    assert changes == {"added": 1, "removed": 1, "unchanged": 1, "summaries_updated": 0}
+    assert embeddings.embedded == ["Lecturers Name: Dr B\nPunctuality: 1"]
+    assert new is not vs
+    assert len(load_row_map("v1")) == len(load_row_map("v2")) == 2
+    assert load_row_map("v1") != load_row_map("v2")
+
+
+def test_saving_a_version_prunes_the_oldest_of_the_same_source(monkeypatch):
+    monkeypatch.setattr(vectorstore_handler, "VECTORSTORE_VERSIONS_KEPT", 1)
+    create_vectorstore(documents("Dr A was punctual"), "other", source="other.csv")
+    create_vectorstore(documents("Dr A was punctual"), "v1", source="feedback.csv")
+    create_vectorstore(documents("Dr A was late"), "v2", source="feedback.csv")
+    assert not os.path.exists(namespace_dir("v1"))
+    assert os.path.exists(namespace_dir("v2")) and os.path.exists(namespace_dir("other"))
+    assert set(load_manifest()) == {"other", "v2"}
+
+
+def test_prune_keeps_the_latest_versions_and_the_current_one(monkeypatch):
+    monkeypatch.setattr(vectorstore_handler, "VECTORSTORE_VERSIONS_KEPT", 0)
+    versions = {"v1": "2024-01-01", "v2": "2024-01-03", "v3": "2024-01-02", "v4": "2024-01-04"}
+    for namespace in versions:
+        create_vectorstore(documents(f"Dr A was punctual in {namespace}"), namespace, source="feedback.csv")
+    manifest = load_manifest()
+    for namespace, updated in versions.items():
+        manifest[namespace]["updated"] = updated
+    vectorstore_handler._write_manifest(manifest)
+
+    assert sorted(prune_namespaces("feedback.csv", current="v1", keep=2)) == ["v2", "v3"]
+    assert set(load_manifest()) == {"v1", "v4"}
+    assert sorted(os.listdir(vectorstore_handler.VECTORSTORE_DIR)) == ["manifest.json", "v1", "v4"]
+    assert prune_namespaces("feedback.csv", keep=0) == []